@@ -1,78 +1,77 @@
 import sqlite3
 import os
+import sys
 
-# Удаляем старую базу, если она уже есть
-if os.path.exists("students_courses.db"):
-    os.remove("students_courses.db")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from schema_migrations import migrate
 
-# Подключаемся к базе данных
-conn = sqlite3.connect("students_courses.db")
-cursor = conn.cursor()
-
-# Создаем таблицу Students
-cursor.execute('''
-CREATE TABLE Students (
+# Схема по версиям: при запуске применяются только недостающие миграции,
+# а не пересоздание базы при каждом запуске
+MIGRATIONS = [
+    """
+CREATE TABLE IF NOT EXISTS Students (
     StudentID INTEGER PRIMARY KEY,
     FirstName TEXT NOT NULL,
     LastName TEXT NOT NULL
 );
-''')
 
-# Создаем таблицу Courses
-cursor.execute('''
-CREATE TABLE Courses (
+CREATE TABLE IF NOT EXISTS Courses (
     CourseID INTEGER PRIMARY KEY,
     CourseName TEXT NOT NULL
 );
-''')
 
-# Создаем таблицу Enrollments (связь студентов и курсов)
-cursor.execute('''
-CREATE TABLE Enrollments (
+CREATE TABLE IF NOT EXISTS Enrollments (
     EnrollmentID INTEGER PRIMARY KEY,
     StudentID INTEGER,
     CourseID INTEGER,
     FOREIGN KEY (StudentID) REFERENCES Students(StudentID),
     FOREIGN KEY (CourseID) REFERENCES Courses(CourseID)
 );
-''')
+""",
+]
+
+
+def seed(cursor):
+    # Заполняем таблицу Students
+    cursor.executemany('''
+    INSERT INTO Students (StudentID, FirstName, LastName)
+    VALUES (?, ?, ?);
+    ''', [
+        (1, 'Андрей', 'Иванов'),
+        (2, 'Мария', 'Петрова'),
+        (3, 'Илья', 'Ильин'),
+        (4, 'Ольга', 'Сидорова'),
+        (5, 'Инна', 'Игнатьева')
+    ])
 
-# Заполняем таблицу Students
-cursor.executemany('''
-INSERT INTO Students (StudentID, FirstName, LastName)
-VALUES (?, ?, ?);
-''', [
-    (1, 'Андрей', 'Иванов'),
-    (2, 'Мария', 'Петрова'),
-    (3, 'Илья', 'Ильин'),
-    (4, 'Ольга', 'Сидорова'),
-    (5, 'Инна', 'Игнатьева')
-])
+    # Заполняем таблицу Courses
+    cursor.executemany('''
+    INSERT INTO Courses (CourseID, CourseName)
+    VALUES (?, ?);
+    ''', [
+        (1, 'Математика'),
+        (2, 'Информатика'),
+        (3, 'Физика')
+    ])
 
-# Заполняем таблицу Courses
-cursor.executemany('''
-INSERT INTO Courses (CourseID, CourseName)
-VALUES (?, ?);
-''', [
-    (1, 'Математика'),
-    (2, 'Информатика'),
-    (3, 'Физика')
-])
+    # Заполняем таблицу Enrollments
+    cursor.executemany('''
+    INSERT INTO Enrollments (EnrollmentID, StudentID, CourseID)
+    VALUES (?, ?, ?);
+    ''', [
+        (1, 1, 1),
+        (2, 1, 2),
+        (3, 2, 3),
+        (4, 3, 2),
+        (5, 4, 1),
+        (6, 5, 2)
+    ])
 
-# Заполняем таблицу Enrollments
-cursor.executemany('''
-INSERT INTO Enrollments (EnrollmentID, StudentID, CourseID)
-VALUES (?, ?, ?);
-''', [
-    (1, 1, 1),
-    (2, 1, 2),
-    (3, 2, 3),
-    (4, 3, 2),
-    (5, 4, 1),
-    (6, 5, 2)
-])
 
-conn.commit()
+# Подключаемся к базе данных
+conn = sqlite3.connect("students_courses.db")
+migrate(conn, 'student_courses', MIGRATIONS, seed=seed, seed_table='Students')
+cursor = conn.cursor()
 
 # Выполняем INNER JOIN и фильтрацию по фамилии
 print("Студенты, чья фамилия начинается с 'И':\n")
@@ -1,22 +1,20 @@
 import sqlite3
 import os
+import sys
 
-# Удаляем старую базу, если уже существует
-if os.path.exists("cinema.db"):
-    os.remove("cinema.db")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from schema_migrations import migrate
 
-# Подключение
-conn = sqlite3.connect("cinema.db")
-cursor = conn.cursor()
-
-# Создание таблиц
-cursor.executescript("""
-CREATE TABLE Genres (
+# Схема по версиям: при запуске применяются только недостающие миграции,
+# а не пересоздание базы при каждом запуске
+MIGRATIONS = [
+    """
+CREATE TABLE IF NOT EXISTS Genres (
     GenreID INTEGER PRIMARY KEY,
     GenreName TEXT
 );
 
-CREATE TABLE Movies (
+CREATE TABLE IF NOT EXISTS Movies (
     MovieID INTEGER PRIMARY KEY,
     Title TEXT,
     Year INTEGER,
@@ -24,13 +22,13 @@ CREATE TABLE Movies (
     FOREIGN KEY (GenreID) REFERENCES Genres(GenreID)
 );
 
-CREATE TABLE Halls (
+CREATE TABLE IF NOT EXISTS Halls (
     HallID INTEGER PRIMARY KEY,
     HallName TEXT,
     Capacity INTEGER
 );
 
-CREATE TABLE Sessions (
+CREATE TABLE IF NOT EXISTS Sessions (
     SessionID INTEGER PRIMARY KEY,
     MovieID INTEGER,
     HallID INTEGER,
@@ -40,14 +38,14 @@ CREATE TABLE Sessions (
     FOREIGN KEY (HallID) REFERENCES Halls(HallID)
 );
 
-CREATE TABLE Customers (
+CREATE TABLE IF NOT EXISTS Customers (
     CustomerID INTEGER PRIMARY KEY,
     FirstName TEXT,
     LastName TEXT,
     City TEXT
 );
 
-CREATE TABLE Tickets (
+CREATE TABLE IF NOT EXISTS Tickets (
     TicketID INTEGER PRIMARY KEY,
     SessionID INTEGER,
     CustomerID INTEGER,
@@ -55,51 +53,58 @@ CREATE TABLE Tickets (
     FOREIGN KEY (SessionID) REFERENCES Sessions(SessionID),
     FOREIGN KEY (CustomerID) REFERENCES Customers(CustomerID)
 );
-""")
+""",
+]
+
+
+def seed(cursor):
+    # Заполнение таблиц — только если база пустая
+    cursor.executemany("INSERT INTO Genres VALUES (?, ?);", [
+        (1, "Боевик"),
+        (2, "Комедия"),
+        (3, "Фантастика")
+    ])
+
+    cursor.executemany("INSERT INTO Movies VALUES (?, ?, ?, ?);", [
+        (1, "Мстители", 2019, 3),
+        (2, "Джентльмены", 2020, 2),
+        (3, "Бэтмен", 2022, 1)
+    ])
+
+    cursor.executemany("INSERT INTO Halls VALUES (?, ?, ?);", [
+        (1, "Зал 1", 100),
+        (2, "Зал 2", 80)
+    ])
+
+    cursor.executemany("INSERT INTO Sessions VALUES (?, ?, ?, ?, ?);", [
+        (1, 1, 1, "2024-05-01 19:00", 2500),
+        (2, 2, 2, "2024-05-02 18:00", 2000),
+        (3, 3, 1, "2024-05-03 20:00", 3000),
+        (4, 1, 2, "2024-05-05 21:00", 2700)
+    ])
+
+    cursor.executemany("INSERT INTO Customers VALUES (?, ?, ?, ?);", [
+        (1, "Иван", "Петров", "Алматы"),
+        (2, "Мария", "Иванова", "Астана"),
+        (3, "Олег", "Сидоров", "Алматы"),
+        (4, "Инна", "Ким", "Караганда")
+    ])
+
+    cursor.executemany("INSERT INTO Tickets VALUES (?, ?, ?, ?);", [
+        (1, 1, 1, "A1"),
+        (2, 2, 1, "B2"),
+        (3, 1, 2, "A2"),
+        (4, 3, 3, "C3"),
+        (5, 4, 1, "A3"),  # Иван Петров купил уже 3 билета на разные сеансы
+        (6, 3, 2, "B1"),
+        (7, 4, 3, "C2")
+    ])
 
-# Заполнение таблиц
-cursor.executemany("INSERT INTO Genres VALUES (?, ?);", [
-    (1, "Боевик"),
-    (2, "Комедия"),
-    (3, "Фантастика")
-])
-
-cursor.executemany("INSERT INTO Movies VALUES (?, ?, ?, ?);", [
-    (1, "Мстители", 2019, 3),
-    (2, "Джентльмены", 2020, 2),
-    (3, "Бэтмен", 2022, 1)
-])
-
-cursor.executemany("INSERT INTO Halls VALUES (?, ?, ?);", [
-    (1, "Зал 1", 100),
-    (2, "Зал 2", 80)
-])
-
-cursor.executemany("INSERT INTO Sessions VALUES (?, ?, ?, ?, ?);", [
-    (1, 1, 1, "2024-05-01 19:00", 2500),
-    (2, 2, 2, "2024-05-02 18:00", 2000),
-    (3, 3, 1, "2024-05-03 20:00", 3000),
-    (4, 1, 2, "2024-05-05 21:00", 2700)
-])
-
-cursor.executemany("INSERT INTO Customers VALUES (?, ?, ?, ?);", [
-    (1, "Иван", "Петров", "Алматы"),
-    (2, "Мария", "Иванова", "Астана"),
-    (3, "Олег", "Сидоров", "Алматы"),
-    (4, "Инна", "Ким", "Караганда")
-])
-
-cursor.executemany("INSERT INTO Tickets VALUES (?, ?, ?, ?);", [
-    (1, 1, 1, "A1"),
-    (2, 2, 1, "B2"),
-    (3, 1, 2, "A2"),
-    (4, 3, 3, "C3"),
-    (5, 4, 1, "A3"),  # Иван Петров купил уже 3 билета на разные сеансы
-    (6, 3, 2, "B1"),
-    (7, 4, 3, "C2")
-])
-
-conn.commit()
+
+# Подключение
+conn = sqlite3.connect("cinema.db")
+migrate(conn, 'kinoteaatr', MIGRATIONS, seed=seed, seed_table='Genres')
+cursor = conn.cursor()
 
 # Выполняем запрос
 print("Результат запроса (клиенты с >=2 билетами на разные сеансы):\n")
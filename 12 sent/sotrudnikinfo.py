@@ -1,47 +1,52 @@
 import sqlite3
 import os
+import sys
 
-# Удаляем старую базу, если она уже есть
-if os.path.exists("employees_projects.db"):
-    os.remove("employees_projects.db")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from schema_migrations import migrate
 
-# Подключаемся к SQLite
-conn = sqlite3.connect("employees_projects.db")
-cursor = conn.cursor()
-
-# Создаем таблицы
-cursor.executescript("""
-CREATE TABLE employees (
+# Схема по версиям: при запуске применяются только недостающие миграции,
+# а не пересоздание базы при каждом запуске
+MIGRATIONS = [
+    """
+CREATE TABLE IF NOT EXISTS employees (
     employee_id INTEGER PRIMARY KEY,
     employee_name TEXT,
     department TEXT
 );
 
-CREATE TABLE projects (
+CREATE TABLE IF NOT EXISTS projects (
     project_id INTEGER PRIMARY KEY,
     project_name TEXT,
     employee_id INTEGER,
     FOREIGN KEY (employee_id) REFERENCES employees(employee_id)
 );
-""")
+""",
+]
 
-# Добавляем данные
-cursor.executemany("INSERT INTO employees VALUES (?, ?, ?);", [
-    (1, "Иванов", "Отдел продаж"),
-    (2, "Петров", "Маркетинг"),
-    (3, "Сидоров", "IT"),
-    (4, "Ким", "Финансы"),
-    (5, "Анна", "IT")
-])
 
-cursor.executemany("INSERT INTO projects VALUES (?, ?, ?);", [
-    (1, "Проект A", 1),
-    (2, "Проект B", 3),
-    (3, "Проект C", None),
-    (4, "Проект D", 5)
-])
+def seed(cursor):
+    # Тестовые данные — только если база пустая
+    cursor.executemany("INSERT INTO employees VALUES (?, ?, ?);", [
+        (1, "Иванов", "Отдел продаж"),
+        (2, "Петров", "Маркетинг"),
+        (3, "Сидоров", "IT"),
+        (4, "Ким", "Финансы"),
+        (5, "Анна", "IT")
+    ])
 
-conn.commit()
+    cursor.executemany("INSERT INTO projects VALUES (?, ?, ?);", [
+        (1, "Проект A", 1),
+        (2, "Проект B", 3),
+        (3, "Проект C", None),
+        (4, "Проект D", 5)
+    ])
+
+
+# Подключаемся к SQLite
+conn = sqlite3.connect("employees_projects.db")
+migrate(conn, 'sotrudnikinfo', MIGRATIONS, seed=seed, seed_table='employees')
+cursor = conn.cursor()
 
 # 1. Все сотрудники + проекты (LEFT JOIN)
 print("1. Все сотрудники и проекты (включая тех, у кого нет проектов):")
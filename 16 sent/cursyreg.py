@@ -1,47 +1,52 @@
 import sqlite3
 import os
+import sys
 
-# Удаляем старую базу, если есть
-if os.path.exists("courses_enrollments.db"):
-    os.remove("courses_enrollments.db")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from schema_migrations import migrate
 
-# Подключаемся
-conn = sqlite3.connect("courses_enrollments.db")
-cursor = conn.cursor()
-
-# Создаем таблицы
-cursor.executescript("""
-CREATE TABLE Courses (
+# Схема по версиям: при запуске применяются только недостающие миграции,
+# а не пересоздание базы при каждом запуске
+MIGRATIONS = [
+    """
+CREATE TABLE IF NOT EXISTS Courses (
     course_id INTEGER PRIMARY KEY,
     course_title TEXT
 );
 
-CREATE TABLE Enrollments (
+CREATE TABLE IF NOT EXISTS Enrollments (
     enrollment_id INTEGER PRIMARY KEY,
     student_id INTEGER,
     course_id INTEGER,
     enrollment_date TEXT,
     FOREIGN KEY (course_id) REFERENCES Courses(course_id)
 );
-""")
+""",
+]
+
 
-# Добавляем тестовые данные
-cursor.executemany("INSERT INTO Courses VALUES (?, ?);", [
-    (1, "Python для начинающих"),
-    (2, "Веб-разработка"),
-    (3, "Машинное обучение"),
-    (4, "Анализ данных"),
-    (5, "SQL основы")
-])
-
-cursor.executemany("INSERT INTO Enrollments VALUES (?, ?, ?, ?);", [
-    (1, 101, 1, "2024-05-01"),
-    (2, 102, 1, "2024-05-02"),
-    (3, 103, 2, "2024-05-03"),
-    (4, 104, 3, "2024-05-04")
-])
-
-conn.commit()
+def seed(cursor):
+    # Тестовые данные — только если база пустая
+    cursor.executemany("INSERT INTO Courses VALUES (?, ?);", [
+        (1, "Python для начинающих"),
+        (2, "Веб-разработка"),
+        (3, "Машинное обучение"),
+        (4, "Анализ данных"),
+        (5, "SQL основы")
+    ])
+
+    cursor.executemany("INSERT INTO Enrollments VALUES (?, ?, ?, ?);", [
+        (1, 101, 1, "2024-05-01"),
+        (2, 102, 1, "2024-05-02"),
+        (3, 103, 2, "2024-05-03"),
+        (4, 104, 3, "2024-05-04")
+    ])
+
+
+# Подключаемся
+conn = sqlite3.connect("courses_enrollments.db")
+migrate(conn, 'cursyreg', MIGRATIONS, seed=seed, seed_table='Courses')
+cursor = conn.cursor()
 
 # SQL-запрос: курсы без регистраций
 print("Курсы, на которые никто не зарегистрировался:\n")
@@ -1,47 +1,52 @@
 import sqlite3
 import os
+import sys
 
-# Удаляем старую базу, если есть
-if os.path.exists("social_likes.db"):
-    os.remove("social_likes.db")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from schema_migrations import migrate
 
-# Подключаемся
-conn = sqlite3.connect("social_likes.db")
-cursor = conn.cursor()
-
-# Создаем таблицы
-cursor.executescript("""
-CREATE TABLE Users (
+# Схема по версиям: при запуске применяются только недостающие миграции,
+# а не пересоздание базы при каждом запуске
+MIGRATIONS = [
+    """
+CREATE TABLE IF NOT EXISTS Users (
     user_id INTEGER PRIMARY KEY,
     username TEXT
 );
 
-CREATE TABLE Posts (
+CREATE TABLE IF NOT EXISTS Posts (
     post_id INTEGER PRIMARY KEY,
     user_id INTEGER,
     post_content TEXT,
     likes_count INTEGER DEFAULT 0,
     FOREIGN KEY (user_id) REFERENCES Users(user_id)
 );
-""")
+""",
+]
+
 
-# Добавляем пользователей
-cursor.executemany("INSERT INTO Users VALUES (?, ?);", [
-    (1, "ivan"),
-    (2, "maria"),
-    (3, "alex"),
-    (4, "olga")
-])
-
-# Добавляем посты
-cursor.executemany("INSERT INTO Posts VALUES (?, ?, ?, ?);", [
-    (1, 1, "Первый пост Ивана", 10),
-    (2, 1, "Второй пост Ивана", 5),
-    (3, 2, "Пост Марии", 8),
-    (4, 3, "Пост Алекса", 0)
-])
-
-conn.commit()
+def seed(cursor):
+    # Добавляем пользователей
+    cursor.executemany("INSERT INTO Users VALUES (?, ?);", [
+        (1, "ivan"),
+        (2, "maria"),
+        (3, "alex"),
+        (4, "olga")
+    ])
+
+    # Добавляем посты
+    cursor.executemany("INSERT INTO Posts VALUES (?, ?, ?, ?);", [
+        (1, 1, "Первый пост Ивана", 10),
+        (2, 1, "Второй пост Ивана", 5),
+        (3, 2, "Пост Марии", 8),
+        (4, 3, "Пост Алекса", 0)
+    ])
+
+
+# Подключаемся
+conn = sqlite3.connect("social_likes.db")
+migrate(conn, 'polzovately', MIGRATIONS, seed=seed, seed_table='Users')
+cursor = conn.cursor()
 
 # SQL-запрос: пользователи + сумма лайков
 print("Пользователи и общее количество лайков:\n")
@@ -1,53 +1,57 @@
 import sqlite3
+import os
+import sys
 
-# Подключаемся к базе (создаст файл, если его нет)
-conn = sqlite3.connect('people.db')
-cursor = conn.cursor()
-
-# Создаем таблицы
-cursor.execute('DROP TABLE IF EXISTS Customers')
-cursor.execute('DROP TABLE IF EXISTS Employees')
-cursor.execute('DROP TABLE IF EXISTS Suppliers')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from schema_migrations import migrate
 
-cursor.execute('''
-CREATE TABLE Customers (
+# Схема по версиям: при запуске применяются только недостающие миграции,
+# а не пересоздание базы при каждом запуске
+MIGRATIONS = [
+    """
+CREATE TABLE IF NOT EXISTS Customers (
     Name TEXT,
     Phone TEXT
-)
-''')
+);
 
-cursor.execute('''
-CREATE TABLE Employees (
+CREATE TABLE IF NOT EXISTS Employees (
     Name TEXT,
     Phone TEXT
-)
-''')
+);
 
-cursor.execute('''
-CREATE TABLE Suppliers (
+CREATE TABLE IF NOT EXISTS Suppliers (
     Name TEXT,
     Phone TEXT
-)
-''')
+);
+""",
+]
 
-# Добавляем данные (некоторые телефоны NULL)
-cursor.executemany('INSERT INTO Customers (Name, Phone) VALUES (?, ?)', [
-    ('Anna Schmidt', '+49 123 456'),
-    ('John Doe', None),
-    ('Pierre Dupont', '+33 987 654')
-])
 
-cursor.executemany('INSERT INTO Employees (Name, Phone) VALUES (?, ?)', [
-    ('Hans Müller', None),
-    ('John Doe', '+44 222 111'),
-    ('Maria Ivanova', '+7 777 555')
-])
+def seed(cursor):
+    # Добавляем данные (некоторые телефоны NULL)
+    cursor.executemany('INSERT INTO Customers (Name, Phone) VALUES (?, ?)', [
+        ('Anna Schmidt', '+49 123 456'),
+        ('John Doe', None),
+        ('Pierre Dupont', '+33 987 654')
+    ])
 
-cursor.executemany('INSERT INTO Suppliers (Name, Phone) VALUES (?, ?)', [
-    ('Pierre Dupont', '+33 987 654'),
-    ('Tech Corp', None),
-    ('Anna Schmidt', '+49 123 456')
-])
+    cursor.executemany('INSERT INTO Employees (Name, Phone) VALUES (?, ?)', [
+        ('Hans Müller', None),
+        ('John Doe', '+44 222 111'),
+        ('Maria Ivanova', '+7 777 555')
+    ])
+
+    cursor.executemany('INSERT INTO Suppliers (Name, Phone) VALUES (?, ?)', [
+        ('Pierre Dupont', '+33 987 654'),
+        ('Tech Corp', None),
+        ('Anna Schmidt', '+49 123 456')
+    ])
+
+
+# Подключаемся к базе (создаст файл, если его нет)
+conn = sqlite3.connect('people.db')
+migrate(conn, 'telephone', MIGRATIONS, seed=seed, seed_table='Customers')
+cursor = conn.cursor()
 
 # SQL-запрос для объединения данных без дублей
 query = '''
@@ -1,42 +1,48 @@
 import sqlite3
+import os
+import sys
 
-# Создаём или подключаем базу
-conn = sqlite3.connect('customers.db')
-cursor = conn.cursor()
-
-# Удаляем старые таблицы, если есть
-cursor.execute('DROP TABLE IF EXISTS Customers2024')
-cursor.execute('DROP TABLE IF EXISTS Customers2025')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from schema_migrations import migrate
 
-# Создаём таблицы
-cursor.execute('''
-CREATE TABLE Customers2024 (
+# Схема по версиям: при запуске применяются только недостающие миграции,
+# а не пересоздание базы при каждом запуске
+MIGRATIONS = [
+    """
+CREATE TABLE IF NOT EXISTS Customers2024 (
     CustomerID INTEGER PRIMARY KEY,
     CustomerName TEXT
-)
-''')
+);
 
-cursor.execute('''
-CREATE TABLE Customers2025 (
+CREATE TABLE IF NOT EXISTS Customers2025 (
     CustomerID INTEGER PRIMARY KEY,
     CustomerName TEXT
-)
-''')
+);
+""",
+]
+
+
+def seed(cursor):
+    # Добавляем данные (пример)
+    cursor.executemany('INSERT INTO Customers2024 (CustomerID, CustomerName) VALUES (?, ?)', [
+        (1, 'Alice'),
+        (2, 'Bob'),
+        (3, 'Charlie'),
+        (4, 'Diana')
+    ])
+
+    cursor.executemany('INSERT INTO Customers2025 (CustomerID, CustomerName) VALUES (?, ?)', [
+        (2, 'Bob'),
+        (3, 'Charlie'),
+        (5, 'Eve'),
+        (6, 'Frank')
+    ])
 
-# Добавляем данные (пример)
-cursor.executemany('INSERT INTO Customers2024 (CustomerID, CustomerName) VALUES (?, ?)', [
-    (1, 'Alice'),
-    (2, 'Bob'),
-    (3, 'Charlie'),
-    (4, 'Diana')
-])
 
-cursor.executemany('INSERT INTO Customers2025 (CustomerID, CustomerName) VALUES (?, ?)', [
-    (2, 'Bob'),
-    (3, 'Charlie'),
-    (5, 'Eve'),
-    (6, 'Frank')
-])
+# Создаём или подключаем базу
+conn = sqlite3.connect('customers.db')
+migrate(conn, 'customers', MIGRATIONS, seed=seed, seed_table='Customers2024')
+cursor = conn.cursor()
 
 # 1. Клиенты, которые были в 2024, но не попали в 2025
 cursor.execute('''
@@ -1,43 +1,49 @@
 import sqlite3
+import os
+import sys
 
-# Создаём или подключаем базу данных
-conn = sqlite3.connect('employees.db')
-cursor = conn.cursor()
-
-# Удаляем таблицы, если уже есть
-cursor.execute('DROP TABLE IF EXISTS Employees')
-cursor.execute('DROP TABLE IF EXISTS FormerEmployees')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from schema_migrations import migrate
 
-# Создаём таблицы
-cursor.execute('''
-CREATE TABLE Employees (
+# Схема по версиям: при запуске применяются только недостающие миграции,
+# а не пересоздание базы при каждом запуске
+MIGRATIONS = [
+    """
+CREATE TABLE IF NOT EXISTS Employees (
     EmployeeID INTEGER PRIMARY KEY,
     FullName TEXT,
     Department TEXT
-)
-''')
+);
 
-cursor.execute('''
-CREATE TABLE FormerEmployees (
+CREATE TABLE IF NOT EXISTS FormerEmployees (
     EmployeeID INTEGER PRIMARY KEY,
     FullName TEXT,
     Department TEXT
-)
-''')
+);
+""",
+]
+
+
+def seed(cursor):
+    # Пример данных
+    cursor.executemany('INSERT INTO Employees VALUES (?, ?, ?)', [
+        (1, 'Alice Brown', 'IT'),
+        (2, 'Bob Smith', 'HR'),
+        (3, 'Charlie Johnson', 'Finance'),
+        (4, 'Diana Miller', 'Marketing')
+    ])
+
+    cursor.executemany('INSERT INTO FormerEmployees VALUES (?, ?, ?)', [
+        (3, 'Charlie Johnson', 'Finance'),
+        (5, 'Eve Davis', 'IT'),
+        (6, 'Frank Wilson', 'Sales')
+    ])
 
-# Пример данных
-cursor.executemany('INSERT INTO Employees VALUES (?, ?, ?)', [
-    (1, 'Alice Brown', 'IT'),
-    (2, 'Bob Smith', 'HR'),
-    (3, 'Charlie Johnson', 'Finance'),
-    (4, 'Diana Miller', 'Marketing')
-])
 
-cursor.executemany('INSERT INTO FormerEmployees VALUES (?, ?, ?)', [
-    (3, 'Charlie Johnson', 'Finance'),
-    (5, 'Eve Davis', 'IT'),
-    (6, 'Frank Wilson', 'Sales')
-])
+# Создаём или подключаем базу данных
+conn = sqlite3.connect('employees.db')
+migrate(conn, 'rabotniki', MIGRATIONS, seed=seed, seed_table='Employees')
+cursor = conn.cursor()
 
 # 1. Сотрудники, которые сейчас работают, но никогда не были уволены
 cursor.execute('''
@@ -1,42 +1,48 @@
 import sqlite3
+import os
+import sys
 
-# Создание базы данных
-conn = sqlite3.connect('users.db')
-cursor = conn.cursor()
-
-# Удаляем таблицы, если уже есть
-cursor.execute('DROP TABLE IF EXISTS WebUsers')
-cursor.execute('DROP TABLE IF EXISTS AppUsers')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from schema_migrations import migrate
 
-# Создаём таблицы
-cursor.execute('''
-CREATE TABLE WebUsers (
+# Схема по версиям: при запуске применяются только недостающие миграции,
+# а не пересоздание базы при каждом запуске
+MIGRATIONS = [
+    """
+CREATE TABLE IF NOT EXISTS WebUsers (
     UserID INTEGER PRIMARY KEY,
     UserName TEXT
-)
-''')
+);
 
-cursor.execute('''
-CREATE TABLE AppUsers (
+CREATE TABLE IF NOT EXISTS AppUsers (
     UserID INTEGER PRIMARY KEY,
     UserName TEXT
-)
-''')
+);
+""",
+]
 
-# Добавляем тестовые данные
-cursor.executemany('INSERT INTO WebUsers VALUES (?, ?)', [
-    (1, 'Alice'),
-    (2, 'Bob'),
-    (3, 'Charlie'),
-    (4, 'Diana')
-])
-
-cursor.executemany('INSERT INTO AppUsers VALUES (?, ?)', [
-    (3, 'Charlie'),
-    (4, 'Diana'),
-    (5, 'Eve'),
-    (6, 'Frank')
-])
+
+def seed(cursor):
+    # Добавляем тестовые данные
+    cursor.executemany('INSERT INTO WebUsers VALUES (?, ?)', [
+        (1, 'Alice'),
+        (2, 'Bob'),
+        (3, 'Charlie'),
+        (4, 'Diana')
+    ])
+
+    cursor.executemany('INSERT INTO AppUsers VALUES (?, ?)', [
+        (3, 'Charlie'),
+        (4, 'Diana'),
+        (5, 'Eve'),
+        (6, 'Frank')
+    ])
+
+
+# Создание базы данных
+conn = sqlite3.connect('users.db')
+migrate(conn, 'sait', MIGRATIONS, seed=seed, seed_table='WebUsers')
+cursor = conn.cursor()
 
 # SQL-запрос: пользователи, которые есть и в сайте, и в приложении
 cursor.execute('''
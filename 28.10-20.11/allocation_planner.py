@@ -0,0 +1,249 @@
+"""Планировщик распределения пачки заказов с разбиением по складам.
+
+В отличие от allocate_order, который отменяет заказ, если ни один склад
+не может выполнить его целиком, планировщик разрешает отгрузку с
+нескольких складов. Для пачки новых заказов он:
+
+ 1. забирает заказы (FOR UPDATE SKIP LOCKED);
+ 2. загружает позиции заказов и срез inventory только по их товарам
+    в массивы NumPy — без блокировок;
+ 3. жадно подбирает для каждого заказа как можно меньше складов: сначала
+    склад, покрывающий заказ целиком, иначе склад, покрывающий больше
+    всего единиц, и так далее;
+ 4. блокирует только склады, с которых идут отгрузки, по возрастанию id —
+    тот же порядок, что в allocate_orders, — и перепроверяет заблокированные
+    строки остатков. Заказы, которым остатка уже не хватает, остаются 'new'
+    и попадут в следующую пачку;
+ 5. записывает план одной транзакцией: inventory, order_allocations,
+    movements и статусы заказов — несколькими запросами на всю пачку.
+
+Запуск:
+    python allocation_planner.py --batch-size 500 --max-warehouses 3
+"""
+import argparse
+
+from db_pool import connection
+from smart_warehouse_sim import run_in_transaction
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+CLAIM_ORDERS_SQL = """
+    SELECT id FROM orders
+    WHERE status = 'new'
+    ORDER BY id
+    LIMIT %s
+    FOR UPDATE SKIP LOCKED
+"""
+
+LOCK_WAREHOUSES_SQL = """
+    SELECT id FROM warehouses
+    WHERE id = ANY(%s)
+    ORDER BY id
+    FOR NO KEY UPDATE
+"""
+
+# Брони (reserve_order) не блокируют склад, поэтому строки остатков тоже
+# блокируются: иначе бронь между проверкой и списанием нарушит reserved <= quantity
+LOCK_INVENTORY_SQL = """
+    SELECT i.warehouse_id, i.product_id, i.quantity - i.reserved
+    FROM inventory i
+    JOIN unnest(%s::int[], %s::int[]) AS p(wh, prod)
+      ON i.warehouse_id = p.wh AND i.product_id = p.prod
+    ORDER BY i.warehouse_id, i.product_id
+    FOR UPDATE OF i
+"""
+
+
+def plan_batch(order_ids, item_order, item_product, item_qty, inv_wh, inv_product, inv_qty,
+               max_warehouses=3):
+    """Строит план отгрузки для пачки заказов (без обращения к БД).
+
+    Позиции и остатки передаются параллельными массивами. Заказы
+    обрабатываются в порядке order_ids, каждый уменьшает доступный остаток
+    для следующих. Возвращает (shipments, primary, cancelled):
+    shipments — список (order_id, warehouse_id, product_id, qty),
+    primary — {order_id: склад с наибольшей долей}, cancelled — {order_id: причина}.
+    """
+    if np is None:
+        raise RuntimeError("allocation planner requires numpy: pip install numpy")
+
+    item_order = np.asarray(item_order, dtype=np.int64)
+    item_product = np.asarray(item_product, dtype=np.int64)
+    item_qty = np.asarray(item_qty, dtype=np.int64)
+
+    # Плотная матрица остатков: строки — склады, столбцы — товары пачки
+    warehouses, wh_idx = np.unique(np.asarray(inv_wh, dtype=np.int64), return_inverse=True)
+    products = np.unique(np.concatenate([item_product, np.asarray(inv_product, dtype=np.int64)]))
+    stock = np.zeros((len(warehouses), len(products)), dtype=np.int64)
+    np.add.at(stock, (wh_idx, np.searchsorted(products, inv_product)), np.asarray(inv_qty, dtype=np.int64))
+    item_col = np.searchsorted(products, item_product)
+
+    order_sort = np.argsort(item_order, kind='stable')
+    sorted_orders = item_order[order_sort]
+
+    shipments, primary, cancelled = [], {}, {}
+    for oid in order_ids:
+        lo, hi = np.searchsorted(sorted_orders, [oid, oid + 1])
+        rows = order_sort[lo:hi]
+        if len(rows) == 0:
+            cancelled[oid] = 'Order has no items'
+            continue
+        cols, need = item_col[rows], item_qty[rows].copy()
+        view = stock[:, cols]
+        if len(warehouses) == 0 or np.any(view.sum(axis=0) < need):
+            cancelled[oid] = 'Not enough stock across all warehouses'
+            continue
+
+        taken = []
+        available = view.copy()
+        while need.any() and len(taken) < max_warehouses:
+            full = np.all(available >= need, axis=1)
+            if full.any():
+                # Склад, закрывающий остаток заказа целиком; при равенстве — с большим запасом
+                w = int(np.argmax(np.where(full, available.sum(axis=1), -1)))
+            else:
+                w = int(np.argmax(np.minimum(available, need).sum(axis=1)))
+            take = np.minimum(available[w], need)
+            taken.append((w, take))
+            available[w] -= take
+            need -= take
+
+        if need.any():
+            cancelled[oid] = f'Cannot be fulfilled from {max_warehouses} warehouses'
+            continue
+
+        stock[:, cols] = available
+        best_w, best_units = None, -1
+        for w, take in taken:
+            for col, qty in zip(cols, take):
+                if qty:
+                    shipments.append((oid, int(warehouses[w]), int(products[col]), int(qty)))
+            if take.sum() > best_units:
+                best_w, best_units = int(warehouses[w]), int(take.sum())
+        primary[oid] = best_w
+    return shipments, primary, cancelled
+
+
+def lock_shipments(cur, shipments, primary):
+    """Блокирует склады и строки остатков плана и перепроверяет остатки.
+
+    Пока план строился, параллельная пачка или бронь могли забрать часть
+    остатка. Заказы с отгрузкой по такой паре (склад, товар) откладываются
+    целиком: без них запланированное количество по паре не превышает
+    прежнего, поэтому отгрузки остальных заказов остаются в силе.
+    Возвращает (shipments, primary, deferred) без отложенных заказов.
+    """
+    if not shipments:
+        return shipments, primary, set()
+    planned = {}
+    for _, wh, prod, qty in shipments:
+        planned[(wh, prod)] = planned.get((wh, prod), 0) + qty
+    pairs = sorted(planned)
+
+    cur.execute(LOCK_WAREHOUSES_SQL, (sorted({wh for wh, _ in pairs}),))
+    cur.execute(LOCK_INVENTORY_SQL, ([wh for wh, _ in pairs], [prod for _, prod in pairs]))
+    available = {(wh, prod): qty for wh, prod, qty in cur.fetchall()}
+
+    short = {pair for pair, qty in planned.items() if available.get(pair, 0) < qty}
+    deferred = {oid for oid, wh, prod, _ in shipments if (wh, prod) in short}
+    if deferred:
+        shipments = [s for s in shipments if s[0] not in deferred]
+        primary = {oid: wh for oid, wh in primary.items() if oid not in deferred}
+    return shipments, primary, deferred
+
+
+def allocate_batch(cur, batch_size, max_warehouses):
+    """Одна пачка: чтение, план и запись внутри текущей транзакции."""
+    cur.execute(CLAIM_ORDERS_SQL, (batch_size,))
+    order_ids = [r[0] for r in cur.fetchall()]
+    if not order_ids:
+        return None
+
+    cur.execute("""
+        SELECT order_id, product_id, SUM(quantity)
+        FROM order_items WHERE order_id = ANY(%s)
+        GROUP BY order_id, product_id
+    """, (order_ids,))
+    items = cur.fetchall()
+    product_ids = sorted({r[1] for r in items})
+
+    # План строится по снимку без блокировок: параллельные пачки и allocate_orders
+    # не ждут друг друга на складах, которые этой пачке не нужны
+    cur.execute("""
+        SELECT warehouse_id, product_id, quantity - reserved
+        FROM inventory WHERE product_id = ANY(%s) AND quantity > reserved
+        ORDER BY warehouse_id, product_id
+    """, (product_ids,))
+    inventory = cur.fetchall()
+
+    shipments, primary, cancelled = plan_batch(
+        order_ids,
+        [r[0] for r in items], [r[1] for r in items], [r[2] for r in items],
+        [r[0] for r in inventory], [r[1] for r in inventory], [r[2] for r in inventory],
+        max_warehouses,
+    )
+    shipments, primary, deferred = lock_shipments(cur, shipments, primary)
+
+    if shipments:
+        s_order, s_wh, s_prod, s_qty = (list(col) for col in zip(*shipments))
+        cur.execute("""
+            UPDATE inventory i SET quantity = i.quantity - p.qty
+            FROM (
+                SELECT wh, prod, SUM(qty) AS qty
+                FROM unnest(%s::int[], %s::int[], %s::int[]) AS t(wh, prod, qty)
+                GROUP BY wh, prod
+            ) p
+            WHERE i.warehouse_id = p.wh AND i.product_id = p.prod
+        """, (s_wh, s_prod, s_qty))
+        cur.execute("""
+            INSERT INTO order_allocations (order_id, warehouse_id, product_id, quantity)
+            SELECT * FROM unnest(%s::int[], %s::int[], %s::int[], %s::int[])
+        """, (s_order, s_wh, s_prod, s_qty))
+        cur.execute("""
+            INSERT INTO movements (warehouse_id, product_id, quantity_change, reason)
+            SELECT wh, prod, -qty, 'allocation_plan'
+            FROM unnest(%s::int[], %s::int[], %s::int[]) AS t(wh, prod, qty)
+        """, (s_wh, s_prod, s_qty))
+        cur.execute("""
+            UPDATE orders o SET status = 'processing', allocated_warehouse_id = p.wh
+            FROM unnest(%s::int[], %s::int[]) AS p(id, wh)
+            WHERE o.id = p.id
+        """, (list(primary), list(primary.values())))
+    if cancelled:
+        cur.execute("UPDATE orders SET status = 'cancelled' WHERE id = ANY(%s)", (list(cancelled),))
+
+    split = len({(s[0], s[1]) for s in shipments}) - len(primary)
+    return {'orders': len(order_ids), 'allocated': len(primary), 'split_shipments': split,
+            'cancelled': len(cancelled), 'deferred': len(deferred)}
+
+
+def run_planner(conn, batch_size=500, max_warehouses=3):
+    """Распределяет все новые заказы пачками. Возвращает сводку по всем пачкам."""
+    total = {'batches': 0, 'orders': 0, 'allocated': 0, 'split_shipments': 0, 'cancelled': 0,
+             'deferred': 0}
+    while True:
+        summary = run_in_transaction(conn, lambda cur: allocate_batch(cur, batch_size, max_warehouses))
+        if summary is None:
+            return total
+        total['batches'] += 1
+        for key, value in summary.items():
+            total[key] += value
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch split-shipment allocation planner")
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--max-warehouses', type=int, default=3,
+                        help="maximum number of warehouses per order")
+    args = parser.parse_args()
+
+    with connection() as conn:
+        print(run_planner(conn, args.batch_size, args.max_warehouses))
+
+
+if __name__ == '__main__':
+    main()
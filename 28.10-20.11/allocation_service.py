@@ -0,0 +1,292 @@
+"""Многопроцессный сервис распределения заказов для smart_warehouse_sim.
+
+Каждый рабочий процесс держит своё соединение и в цикле забирает пачку
+новых заказов (FOR UPDATE SKIP LOCKED) и распределяет её через
+allocate_orders. Ошибки сериализации и взаимоблокировки повторяются
+целиком (run_in_transaction). После прочих ошибок обработчик ждёт с
+растущей паузой, после нескольких подряд берёт новое соединение, а если
+и это не помогло — останавливается.
+
+Запуск:
+    python allocation_service.py --workers 8 --batch-size 50     # до Ctrl+C
+    python allocation_service.py --workers 8 --drain             # пока есть заказы
+    python allocation_service.py --stress                        # проверка на перепродажу
+"""
+import argparse
+import multiprocessing
+import random
+import sys
+import threading
+import time
+
+import psycopg2
+
+from db_pool import get_connection, release
+from smart_warehouse_sim import (
+    ALLOCATE_BATCH_SQL, SCHEMA_SQL, bulk_insert, bulk_load_stock, run_in_transaction,
+)
+
+
+# Пауза после ошибки пачки: ERROR_BACKOFF, дальше вдвое больше, но не выше MAX_ERROR_BACKOFF
+ERROR_BACKOFF = 0.1
+MAX_ERROR_BACKOFF = 30
+# Сколько ошибок подряд до переподключения и до остановки обработчика
+RECONNECT_AFTER = 5
+STOP_AFTER = 10
+
+
+def worker_main(worker_no, batch_size, poll_interval, drain, stop, results):
+    counts = {'allocated': 0, 'cancelled': 0, 'serialization': 0, 'deadlock': 0, 'errors': 0,
+              'stopped': 0}
+
+    def on_retry(kind):
+        counts[kind] += 1
+
+    def claim_and_allocate(cur):
+        cur.execute(ALLOCATE_BATCH_SQL, (batch_size,))
+        return cur.fetchall()
+
+    conn = None
+    failures = 0
+    try:
+        while not stop.is_set():
+            try:
+                if conn is None:
+                    conn = get_connection()
+                rows = run_in_transaction(conn, claim_and_allocate, retries=10, on_retry=on_retry)
+            except psycopg2.Error as e:
+                # Постоянная ошибка (нет функции, удалена таблица, сервер недоступен)
+                # не должна превращаться в цикл без пауз
+                counts['errors'] += 1
+                failures += 1
+                print(f"worker {worker_no}: batch failed ({failures} in a row): {e}")
+                if failures >= STOP_AFTER:
+                    print(f"worker {worker_no}: stopping after {failures} consecutive errors")
+                    counts['stopped'] += 1
+                    break
+                if conn is not None and (conn.closed or failures % RECONNECT_AFTER == 0):
+                    # Закрытое соединение пул при возврате выбросит и не выдаст снова
+                    conn.close()
+                    release(conn)
+                    conn = None
+                stop.wait(min(ERROR_BACKOFF * 2 ** (failures - 1), MAX_ERROR_BACKOFF))
+                continue
+            failures = 0
+            if not rows:
+                if drain:
+                    break
+                stop.wait(poll_interval)
+                continue
+            for _, wh_id, error in rows:
+                counts['allocated' if error is None else 'cancelled'] += 1
+    finally:
+        if conn is not None:
+            release(conn)
+        results.put((worker_no, counts))
+
+
+def run_service(workers, batch_size=50, poll_interval=0.5, drain=False):
+    """Запускает workers процессов и ждёт их завершения. Возвращает сводные счётчики."""
+    stop = multiprocessing.Event()
+    results = multiprocessing.Queue()
+    procs = [
+        multiprocessing.Process(target=worker_main,
+                                args=(i, batch_size, poll_interval, drain, stop, results))
+        for i in range(workers)
+    ]
+    for p in procs:
+        p.start()
+    try:
+        for p in procs:
+            p.join()
+    except KeyboardInterrupt:
+        stop.set()
+        for p in procs:
+            p.join()
+
+    total = {}
+    while not results.empty():
+        _, counts = results.get()
+        for key, value in counts.items():
+            total[key] = total.get(key, 0) + value
+    return total
+
+
+# Пачки распределения, которые сейчас выполняются (не ждут блокировку) и ждут её
+OVERLAP_SQL = """
+    SELECT COUNT(*) FILTER (WHERE wait_event_type IS DISTINCT FROM 'Lock'),
+           COUNT(*) FILTER (WHERE wait_event_type = 'Lock')
+    FROM pg_stat_activity
+    WHERE state = 'active' AND pid <> pg_backend_pid() AND query LIKE '%allocate_orders(%'
+"""
+
+
+class OverlapMonitor(threading.Thread):
+    """Замеряет, сколько пачек allocate_orders действительно выполняется одновременно.
+
+    Каждые interval секунд смотрит pg_stat_activity. Пачка, ждущая блокировку,
+    не считается выполняющейся: при общей блокировке на все склады пачки
+    стоят в очереди друг за другом, и «параллельность» была бы мнимой.
+    """
+
+    def __init__(self, interval=0.002):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.samples = 0       # замеры, когда шла хотя бы одна пачка
+        self.running_total = 0
+        self.peak = 0
+        self.lock_wait_samples = 0
+
+    def run(self):
+        conn = get_connection()
+        try:
+            with conn.cursor() as cur:
+                while not self.stopped.is_set():
+                    cur.execute(OVERLAP_SQL)
+                    running, waiting = cur.fetchone()
+                    # Статистика активности кешируется до конца транзакции
+                    conn.commit()
+                    if running or waiting:
+                        self.samples += 1
+                        self.running_total += running
+                        self.peak = max(self.peak, running)
+                        self.lock_wait_samples += bool(waiting)
+                    self.stopped.wait(self.interval)
+        finally:
+            release(conn)
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+    def summary(self):
+        if not self.samples:
+            return {'samples': 0}
+        return {
+            'samples': self.samples,
+            'peak_running': self.peak,
+            'mean_running': round(self.running_total / self.samples, 2),
+            'lock_wait_share': round(self.lock_wait_samples / self.samples, 2),
+        }
+
+
+def stress_test(workers=16, orders=5000, batch_size=5, seed=1, warehouses_count=4):
+    """Проверяет, что параллельное распределение не продаёт больше, чем есть.
+
+    Спрос специально превышает запас и сосредоточен на нескольких «горячих»
+    товарах. После прогона сверяются остатки, журнал движения и счётчик
+    used_volume, а также что пачки действительно выполнялись одновременно,
+    а не стояли в очереди на блокировках. Возвращает список найденных
+    нарушений (пустой — всё в порядке).
+    """
+    rnd = random.Random(seed)
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute(SCHEMA_SQL)
+        warehouses = bulk_insert(cur, 'warehouses', ('name', 'city', 'capacity'),
+                                 [(f'WH_{i}', 'Stress', 100000) for i in range(warehouses_count)])
+        products = bulk_insert(cur, 'products', ('name', 'price', 'unit_volume'),
+                               [(f'SKU_{i}', 10, 1) for i in range(20)])
+        customers = bulk_insert(cur, 'customers', ('name',), [('Stress',)])
+        bulk_load_stock(cur, [(wh, pid, rnd.randint(5, 30)) for wh in warehouses for pid in products])
+
+        hot = products[:5]
+        for _ in range(orders):
+            cur.execute("INSERT INTO orders (customer_id, status) VALUES (%s,'new') RETURNING id", (customers[0],))
+            oid = cur.fetchone()[0]
+            pool = hot if rnd.random() < 0.8 else products
+            items = rnd.sample(pool, rnd.randint(1, 3))
+            cur.execute("""
+                INSERT INTO order_items (order_id, product_id, quantity)
+                SELECT %s, unnest(%s::int[]), unnest(%s::int[])
+            """, (oid, items, [rnd.randint(1, 5) for _ in items]))
+        cur.execute("CREATE TEMP TABLE stress_initial AS SELECT * FROM inventory")
+        conn.commit()
+
+        monitor = OverlapMonitor()
+        monitor.start()
+        started = time.perf_counter()
+        totals = run_service(workers, batch_size=batch_size, drain=True)
+        elapsed = time.perf_counter() - started
+        monitor.stop()
+        overlap = monitor.summary()
+        print(f"{workers} workers processed {orders} orders in {elapsed:.2f}s: {totals}")
+        print(f"concurrent allocation batches: {overlap}")
+
+        problems = []
+        # Без этой проверки тест не отличил бы параллельных обработчиков от очереди.
+        # Пик ненадёжен (пачка успевает «выполняться» до первой блокировки), поэтому
+        # смотрим среднее: при общей блокировке на все склады оно около 1.
+        if workers >= 4 and overlap.get('mean_running', 0) < 1.5:
+            problems.append(f"allocation batches did not run concurrently: {overlap}")
+        cur.execute("SELECT COUNT(*) FROM orders WHERE status = 'new'")
+        left = cur.fetchone()[0]
+        if left:
+            problems.append(f"{left} orders left unprocessed")
+
+        # Остаток = начальный запас − всё, что ушло в распределённые заказы
+        cur.execute("""
+            SELECT s.warehouse_id, s.product_id, s.quantity AS initial, i.quantity AS final,
+                   COALESCE(a.allocated, 0) AS allocated
+            FROM stress_initial s
+            JOIN inventory i USING (warehouse_id, product_id)
+            LEFT JOIN (
+                SELECT o.allocated_warehouse_id AS warehouse_id, oi.product_id, SUM(oi.quantity) AS allocated
+                FROM orders o JOIN order_items oi ON oi.order_id = o.id
+                WHERE o.status = 'processing'
+                GROUP BY 1, 2
+            ) a USING (warehouse_id, product_id)
+            WHERE i.quantity < 0 OR s.quantity - COALESCE(a.allocated, 0) <> i.quantity
+        """)
+        for wh, pid, initial, final, allocated in cur.fetchall():
+            problems.append(f"wh={wh} pid={pid}: initial={initial} allocated={allocated} final={final}")
+
+        cur.execute("""
+            SELECT COUNT(*) FROM inventory i
+            WHERE i.quantity <> (
+                SELECT COALESCE(SUM(m.quantity_change), 0) FROM movements m
+                WHERE m.warehouse_id = i.warehouse_id AND m.product_id = i.product_id
+            )
+        """)
+        drift = cur.fetchone()[0]
+        if drift:
+            problems.append(f"{drift} inventory rows disagree with movements")
+
+        cur.execute("SELECT COUNT(*) FROM audit_used_volume()")
+        if cur.fetchone()[0]:
+            problems.append("used_volume counter drifted")
+        conn.rollback()
+        cur.close()
+        return problems
+    finally:
+        release(conn)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parallel order allocation service")
+    parser.add_argument('--workers', type=int, help="worker processes (default 4, 16 for --stress)")
+    parser.add_argument('--batch-size', type=int, default=50)
+    parser.add_argument('--poll-interval', type=float, default=0.5)
+    parser.add_argument('--drain', action='store_true', help="exit when no new orders are left")
+    parser.add_argument('--stress', action='store_true',
+                        help="run the overselling stress test (recreates the schema)")
+    parser.add_argument('--orders', type=int, default=5000, help="orders for --stress")
+    args = parser.parse_args()
+
+    if args.stress:
+        problems = stress_test(workers=args.workers or 16, orders=args.orders)
+        if problems:
+            print("FAILED:")
+            for p in problems:
+                print("  " + p)
+            sys.exit(1)
+        print("OK: no overselling, inventory matches allocations and movements.")
+    else:
+        totals = run_service(args.workers or 4, args.batch_size, args.poll_interval, args.drain)
+        print(totals)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,35 +1,35 @@
-import psycopg2
+import os
+import sys
 
-connection = psycopg2.connect(
-    host="localhost",
-    port="5432",
-    database="my_python_app",
-    user="postgres",
-    password="khadimov"  # замените своим
-)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from schema_migrations import migrate
+from db_pool import get_connection, release
 
-cursor = connection.cursor()
-
-# Создаём таблицу
-cursor.execute("""
+# Схема по версиям (schema_migrations): таблица больше не чистится при запуске
+MIGRATIONS = [
+    """
     CREATE TABLE IF NOT EXISTS cars (
         id SERIAL PRIMARY KEY,
         brand VARCHAR(50),
         model VARCHAR(50),
         color VARCHAR(20) DEFAULT 'не указан'
     );
-""")
+    """,
+]
+
 
-# Чистим таблицу для демонстрации
-cursor.execute("DELETE FROM cars;")
+def seed(cursor):
+    # Добавляем запись без цвета — DEFAULT сработает автоматически
+    cursor.execute("""
+        INSERT INTO cars (brand, model)
+        VALUES (%s, %s);
+    """, ('Toyota', 'Camry'))
 
-# Добавляем запись без цвета — DEFAULT сработает автоматически
-cursor.execute("""
-    INSERT INTO cars (brand, model)
-    VALUES (%s, %s);
-""", ('Toyota', 'Camry'))
 
-connection.commit()
+connection = get_connection()
+migrate(connection, 'brand', MIGRATIONS, seed=seed, seed_table='cars')
+
+cursor = connection.cursor()
 
 # Проверяем данные
 cursor.execute("SELECT * FROM cars;")
@@ -40,4 +40,4 @@ for row in rows:
     print(row)
 
 cursor.close()
-connection.close()
+release(connection)
@@ -0,0 +1,204 @@
+"""Общий пул соединений для скриптов 28.10-20.11.
+
+Параметры подключения берутся из переменных окружения (по умолчанию —
+прежние значения, зашитые в скрипты):
+
+    PGHOST, PGPORT, PGDATABASE, PGUSER, PGPASSWORD   — куда подключаться
+    PGPOOL_MIN, PGPOOL_MAX  — сколько соединений открыть сразу и сколько
+                              держать максимум (1 и 10)
+    PGPOOL_CHECK_AFTER      — через сколько секунд простоя соединение
+                              проверяется SELECT 1 перед выдачей (30)
+    PGAPPNAME, PG_STATEMENT_TIMEOUT, PG_LOCK_TIMEOUT,
+    PG_IDLE_IN_TRANSACTION_TIMEOUT — настройки сеанса каждого соединения
+
+Использование:
+
+    with connection() as conn:          # соединение возвращается в пул
+        with conn.cursor() as cur:
+            execute_prepared_many(cur, 'insert_user',
+                                  "INSERT INTO users (username) VALUES ($1)",
+                                  [('Alice',), ('Bob',)])
+        conn.commit()
+
+Для скриптов без функций есть пара get_connection() / release(conn).
+Пул потокобезопасен; если все соединения заняты, поток ждёт освобождения.
+После fork (multiprocessing) дочерний процесс создаёт свой пул и не
+трогает соединения родителя.
+"""
+import atexit
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions, extras, pool
+
+DSN = {
+    'host': os.environ.get('PGHOST', 'localhost'),
+    'port': int(os.environ.get('PGPORT', 5432)),
+    'database': os.environ.get('PGDATABASE', 'my_python_app'),
+    'user': os.environ.get('PGUSER', 'postgres'),
+    'password': os.environ.get('PGPASSWORD', 'khadimov'),  # поменяй на свой пароль или задай PGPASSWORD
+}
+
+MIN_CONNECTIONS = int(os.environ.get('PGPOOL_MIN', 1))
+MAX_CONNECTIONS = int(os.environ.get('PGPOOL_MAX', 10))
+CHECK_AFTER = float(os.environ.get('PGPOOL_CHECK_AFTER', 30))
+
+# Передаются при подключении через options, поэтому не стоят лишнего запроса
+SESSION_SETTINGS = {
+    'statement_timeout': os.environ.get('PG_STATEMENT_TIMEOUT', '0'),
+    'lock_timeout': os.environ.get('PG_LOCK_TIMEOUT', '0'),
+    'idle_in_transaction_session_timeout': os.environ.get('PG_IDLE_IN_TRANSACTION_TIMEOUT', '0'),
+}
+
+
+class PooledConnection(extensions.connection):
+    """Соединение пула: помнит подготовленные на нём операторы и время возврата."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+        self.released_at = time.monotonic()
+
+
+def _connect_kwargs():
+    options = ' '.join(f"-c {name}={value}" for name, value in SESSION_SETTINGS.items())
+    return dict(DSN,
+                application_name=os.environ.get('PGAPPNAME', 'python-scripts'),
+                options=options,
+                connection_factory=PooledConnection)
+
+
+class _BlockingPool(pool.ThreadedConnectionPool):
+    """ThreadedConnectionPool, который ждёт свободное соединение вместо PoolError."""
+
+    def __init__(self, minconn, maxconn, **kwargs):
+        self._slots = threading.BoundedSemaphore(maxconn)
+        super().__init__(minconn, maxconn, **kwargs)
+        # В psycopg2 minconn — это ещё и число соединений, которые пул оставляет
+        # открытыми при возврате; остальные закрываются. Держим открытыми все.
+        self.minconn = maxconn
+
+    def borrow(self, timeout=None):
+        if not self._slots.acquire(timeout=timeout):
+            raise pool.PoolError("timed out waiting for a free connection")
+        try:
+            conn = self.getconn()
+            if conn.closed or (time.monotonic() - conn.released_at > CHECK_AFTER and not _is_alive(conn)):
+                # Соединение порвано (рестарт сервера, таймаут на балансировщике) — заменяем
+                self.putconn(conn, close=True)
+                conn = self.getconn()
+            return conn
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def give_back(self, conn):
+        try:
+            conn.released_at = time.monotonic()
+            # putconn сам откатывает незавершённую транзакцию
+            self.putconn(conn, close=bool(conn.closed))
+        finally:
+            self._slots.release()
+
+
+def _is_alive(conn):
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        return False
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+# Пулы, унаследованные от родителя через fork. Ссылки держим, чтобы сборщик мусора
+# не закрыл их соединения: закрытие шлёт серверу Terminate по общему с родителем сокету.
+_inherited_pools = []
+
+
+def get_pool():
+    """Пул текущего процесса (создаётся при первом обращении и заново после fork)."""
+    global _pool, _pool_pid
+    pid = os.getpid()
+    if _pool is None or _pool_pid != pid:
+        with _pool_lock:
+            if _pool is None or _pool_pid != pid:
+                if _pool is not None:
+                    _inherited_pools.append(_pool)
+                _pool = _BlockingPool(MIN_CONNECTIONS, MAX_CONNECTIONS, **_connect_kwargs())
+                _pool_pid = pid
+    return _pool
+
+
+def get_connection(timeout=None):
+    """Берёт соединение из пула. Вернуть — release(conn)."""
+    return get_pool().borrow(timeout)
+
+
+def release(conn):
+    get_pool().give_back(conn)
+
+
+@contextmanager
+def connection(timeout=None):
+    """Соединение из пула на время блока with."""
+    conn = get_connection(timeout)
+    try:
+        yield conn
+    finally:
+        release(conn)
+
+
+def configure_pool(min_connections=None, max_connections=None):
+    """Меняет размер пула (например, по числу рабочих потоков). Текущий пул
+    закрывается, новый будет создан при следующем запросе соединения."""
+    global MIN_CONNECTIONS, MAX_CONNECTIONS
+    close_pool()
+    if min_connections is not None:
+        MIN_CONNECTIONS = min_connections
+    if max_connections is not None:
+        MAX_CONNECTIONS = max_connections
+    MIN_CONNECTIONS = min(MIN_CONNECTIONS, MAX_CONNECTIONS)
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.closeall()
+        _pool = None
+
+
+atexit.register(close_pool)
+
+
+def _ensure_prepared(cur, name, sql):
+    conn = cur.connection
+    if name not in conn.prepared:
+        cur.execute(f"PREPARE {name} AS {sql}")
+        conn.prepared.add(name)
+    params = max((int(n) for n in re.findall(r'\$(\d+)', sql)), default=0)
+    if not params:
+        return f"EXECUTE {name}"
+    return "EXECUTE {} ({})".format(name, ', '.join(['%s'] * params))
+
+
+def execute_prepared(cur, name, sql, params):
+    """Выполняет sql (с параметрами $1, $2, ...) как серверный подготовленный оператор.
+
+    PREPARE выполняется один раз на соединение; дальше сервер не разбирает
+    и не планирует запрос заново.
+    """
+    cur.execute(_ensure_prepared(cur, name, sql), params)
+
+
+def execute_prepared_many(cur, name, sql, rows, page_size=100):
+    """То же для пачки строк: EXECUTE отправляются по page_size за один обмен с сервером."""
+    extras.execute_batch(cur, _ensure_prepared(cur, name, sql), rows, page_size=page_size)
@@ -1,14 +1,21 @@
 # fetch_problem_orders_example.py
+#
+# Сканер «проблемных» заказов (сумма <= 0 или статус Cancelled).
+# Заказы читаются страницами по id (keyset-пагинация) через частичный индекс,
+# поэтому память и время одной страницы не зависят от размера таблицы.
+# Результат — JSONL, по заказу на строку.
+#
+#   python fetch_problem_orders.py --setup                  # тестовая таблица
+#   python fetch_problem_orders.py --output problems.jsonl --page-size 5000
+#   python fetch_problem_orders.py --output problems.jsonl --after-id 123456   # продолжить с id, дописывая в файл
+import argparse
+import json
+import sys
+
 import psycopg2
-from psycopg2 import DatabaseError
 
-DSN = {
-    'host': 'localhost',
-    'port': 5432,
-    'database': 'my_python_app',  # замени на свою базу
-    'user': 'postgres',
-    'password': 'khadimov'
-}
+from db_pool import get_connection, release
+
 
 def setup_orders_table(conn):
     with conn.cursor() as cur:
@@ -32,37 +39,109 @@ def setup_orders_table(conn):
             ('shipped', 0);
         """)
     conn.commit()
-    print("Orders table created and test data inserted.")
+    print("Orders table created and test data inserted.", file=sys.stderr)
 
 
-def fetch_problem_orders(conn):
-    with conn.cursor() as cur:
-        cur.execute("""
-            SELECT id, status, total_amount
-            FROM orders
-            WHERE total_amount <= 0 OR status = 'Cancelled'
-            ORDER BY id;
-        """)
-        rows = cur.fetchall()
+# Условие должно совпадать с условием индекса дословно, иначе планировщик
+# не докажет, что частичный индекс подходит
+PROBLEM_PREDICATE = "(total_amount <= 0 OR status = 'Cancelled')"
+
+
+def ensure_problem_index(conn):
+    # CONCURRENTLY не блокирует запись в большую таблицу, но не работает внутри транзакции
+    conn.commit()
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            # Прерванный или упавший CREATE INDEX CONCURRENTLY оставляет индекс INVALID:
+            # планировщик его не использует, а IF NOT EXISTS считает, что он уже есть
+            cur.execute("""
+                SELECT indisvalid FROM pg_index
+                WHERE indexrelid = to_regclass('orders_problem_idx')
+            """)
+            row = cur.fetchone()
+            if row is not None and not row[0]:
+                print("Rebuilding invalid index orders_problem_idx.", file=sys.stderr)
+                cur.execute("DROP INDEX CONCURRENTLY IF EXISTS orders_problem_idx;")
+            cur.execute(f"""
+                CREATE INDEX CONCURRENTLY IF NOT EXISTS orders_problem_idx
+                ON orders (id) WHERE {PROBLEM_PREDICATE};
+            """)
+    finally:
+        conn.autocommit = False
+
+
+def fetch_problem_orders(conn, page_size=1000, after_id=0):
+    """Генератор страниц (списков строк id, status, total_amount) по page_size заказов.
+
+    Каждая страница — отдельный запрос «id > последний id» по индексу и
+    отдельная короткая транзакция: на таблице в десятки миллионов строк
+    скан не держит снимок и память всё время прохода.
+    """
+    last_id = after_id
+    while True:
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                SELECT id, status, total_amount
+                FROM orders
+                WHERE {PROBLEM_PREDICATE} AND id > %s
+                ORDER BY id
+                LIMIT %s;
+            """, (last_id, page_size))
+            rows = cur.fetchall()
+        conn.rollback()
         if not rows:
-            print("No problematic orders found.")
-        else:
-            print("Problematic orders:")
-            for r in rows:
-                print(f"ID={r[0]}, Status={r[1]}, Total={r[2]}")
+            return
+        yield rows
+        last_id = rows[-1][0]
+
+
+def write_jsonl(pages, out):
+    """Пишет заказы по строке JSON на заказ. Возвращает (число заказов, последний id)."""
+    count, last_id = 0, None
+    for rows in pages:
+        for order_id, status, total_amount in rows:
+            # NUMERIC отдаём строкой, чтобы не терять точность на float
+            out.write(json.dumps({'id': order_id, 'status': status,
+                                  'total_amount': str(total_amount)}) + "\n")
+        out.flush()
+        count += len(rows)
+        last_id = rows[-1][0]
+    return count, last_id
+
 
 def main():
+    parser = argparse.ArgumentParser(description="Stream problematic orders as JSONL")
+    parser.add_argument('--setup', action='store_true',
+                        help="recreate the orders table with test data first")
+    parser.add_argument('--page-size', type=int, default=1000)
+    parser.add_argument('--after-id', type=int, default=0,
+                        help="resume after this order id (appends to --output)")
+    parser.add_argument('--output', help="JSONL file (default: stdout)")
+    args = parser.parse_args()
+
     try:
-        conn = psycopg2.connect(**DSN)
+        conn = get_connection()
     except psycopg2.OperationalError as e:
-        print("Connection failed:", e)
+        print("Connection failed:", e, file=sys.stderr)
         return
 
+    # при продолжении с --after-id дописываем в тот же файл, а не затираем уже выгруженное
+    mode = 'a' if args.after_id else 'w'
+    out = open(args.output, mode, encoding='utf-8') if args.output else sys.stdout
     try:
-        setup_orders_table(conn)
-        fetch_problem_orders(conn)
+        if args.setup:
+            setup_orders_table(conn)
+        ensure_problem_index(conn)
+        count, last_id = write_jsonl(fetch_problem_orders(conn, args.page_size, args.after_id), out)
+        if not count:
+            print("No problematic orders found.", file=sys.stderr)
+        else:
+            print(f"{count} problematic orders written, last id {last_id}.", file=sys.stderr)
     finally:
-        conn.close()
+        if out is not sys.stdout:
+            out.close()
+        release(conn)
 
 if __name__ == "__main__":
     main()
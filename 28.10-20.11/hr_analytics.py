@@ -0,0 +1,117 @@
+"""Групповая статистика по сотрудникам на стороне клиента.
+
+Нужные столбцы выгружаются одним COPY ... TO STDOUT (FORMAT binary) в
+массивы NumPy, а среднее, медиана и перцентили по группам считаются
+векторно. Один проход по таблице заменяет серию GROUP BY-запросов; чтобы
+не нагружать основной сервер, запускайте аналитику на реплике
+(PGHOST=replica python vozrast.py).
+
+    with connection() as conn, conn.cursor() as cur:
+        cols = fetch_columns(cur, "SELECT department_id, age FROM employees WHERE age IS NOT NULL",
+                             [('department_id', 'int4'), ('age', 'int4')])
+        table = group_stats(cols['department_id'], cols['age'])
+"""
+import io
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# Типы фиксированной длины, которые разбираются без цикла по строкам
+_BINARY_TYPES = {
+    'int2': '>i2',
+    'int4': '>i4',
+    'int8': '>i8',
+    'float4': '>f4',
+    'float8': '>f8',
+}
+
+_COPY_SIGNATURE = b'PGCOPY\n\xff\r\n\x00'
+
+
+def _require_numpy():
+    if np is None:
+        raise RuntimeError("hr_analytics requires numpy: pip install numpy")
+
+
+def fetch_columns(cur, query, columns, params=None):
+    """Выполняет query через бинарный COPY и возвращает {имя столбца: массив NumPy}.
+
+    columns — список (имя, тип) в порядке столбцов запроса; тип — один из
+    int2, int4, int8, float4, float8, значения приводятся к нему в SQL.
+    NULL не поддерживается: отфильтруйте его или замените через COALESCE.
+    """
+    _require_numpy()
+    unknown = [t for _, t in columns if t not in _BINARY_TYPES]
+    if unknown:
+        raise ValueError(f"unsupported column types: {unknown}")
+
+    if params is not None:
+        query = cur.mogrify(query, params).decode()
+    casts = ', '.join(f'q.{name}::{pg_type}' for name, pg_type in columns)
+    buf = io.BytesIO()
+    cur.copy_expert(f"COPY (SELECT {casts} FROM ({query}) q) TO STDOUT (FORMAT binary)", buf)
+    return _parse_binary_copy(buf.getbuffer(), columns)
+
+
+def _parse_binary_copy(data, columns):
+    if bytes(data[:11]) != _COPY_SIGNATURE:
+        raise ValueError("not a PostgreSQL binary COPY stream")
+    ext_len = int.from_bytes(data[15:19], 'big')
+    body = data[19 + ext_len:len(data) - 2]  # в конце — признак конца потока (-1)
+
+    # Все поля фиксированной длины, поэтому каждая строка — запись одного
+    # размера: число полей, затем для каждого поля длина и значение
+    fields = [('nfields', '>i2')]
+    for name, pg_type in columns:
+        fields += [(f'{name}__len', '>i4'), (name, _BINARY_TYPES[pg_type])]
+    row_dtype = np.dtype(fields)
+    if len(body) % row_dtype.itemsize:
+        raise ValueError("unexpected row layout in COPY stream (NULL values?)")
+    rows = np.frombuffer(body, dtype=row_dtype)
+
+    result = {}
+    for name, pg_type in columns:
+        if len(rows) and np.any(rows[f'{name}__len'] != np.dtype(_BINARY_TYPES[pg_type]).itemsize):
+            raise ValueError(f"column {name} contains NULL values")
+        result[name] = rows[name].astype(np.dtype(_BINARY_TYPES[pg_type]).newbyteorder('='))
+    return result
+
+
+def group_stats(keys, values, percentiles=(25, 50, 75, 90)):
+    """Количество, среднее, минимум, перцентили и максимум values по группам keys.
+
+    Возвращает структурированный массив NumPy, по строке на группу в
+    порядке возрастания ключа: поля key, count, mean, min, p25, p50, ..., max.
+    Перцентили — с линейной интерполяцией, как percentile_cont в PostgreSQL.
+    """
+    _require_numpy()
+    keys = np.asarray(keys)
+    values = np.asarray(values, dtype=np.float64)
+
+    # Сортировка по (ключ, значение): каждая группа — непрерывный
+    # отсортированный отрезок, перцентиль — индекс внутри отрезка
+    order = np.lexsort((values, keys))
+    keys, values = keys[order], values[order]
+    group_keys, starts, counts = np.unique(keys, return_index=True, return_counts=True)
+
+    fields = [('key', keys.dtype), ('count', np.int64), ('mean', np.float64), ('min', np.float64)]
+    fields += [(f'p{q:g}', np.float64) for q in percentiles]
+    fields += [('max', np.float64)]
+    table = np.empty(len(group_keys), dtype=fields)
+    if not len(group_keys):
+        return table
+
+    table['key'] = group_keys
+    table['count'] = counts
+    table['mean'] = np.add.reduceat(values, starts) / counts
+    table['min'] = values[starts]
+    table['max'] = values[starts + counts - 1]
+    for q in percentiles:
+        pos = starts + (counts - 1) * (q / 100.0)
+        lo = np.floor(pos).astype(np.int64)
+        hi = np.ceil(pos).astype(np.int64)
+        table[f'p{q:g}'] = values[lo] + (values[hi] - values[lo]) * (pos - lo)
+    return table
@@ -1,56 +1,157 @@
-import psycopg2
+import argparse
+import os
+import sys
 
-connection = psycopg2.connect(
-    host="localhost",
-    port="5432",
-    database="my_python_app",
-    user="postgres",
-    password="khadimov"  # замени на свой пароль
-)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from schema_migrations import migrate
+from db_pool import execute_prepared_many, get_connection, release
 
-cursor = connection.cursor()
+parser = argparse.ArgumentParser(description="Orders per client report")
+parser.add_argument('--rebuild-counters', action='store_true',
+                    help="recount clients.orders_count from orders (after bulk loads)")
+args = parser.parse_args()
 
-# Создаём таблицы
-cursor.execute("""
+
+def rebuild_orders_count(cursor):
+    # Для загрузок в обход триггеров (COPY с отключёнными триггерами,
+    # session_replication_role = replica). SHARE не даёт менять orders во время пересчёта.
+    cursor.execute("LOCK TABLE orders IN SHARE MODE;")
+    cursor.execute("""
+        UPDATE clients c
+        SET orders_count = n.orders_count
+        FROM (
+            SELECT c2.id, COUNT(o.id) AS orders_count
+            FROM clients c2
+            LEFT JOIN orders o ON o.client_id = c2.id
+            GROUP BY c2.id
+        ) n
+        WHERE c.id = n.id AND c.orders_count <> n.orders_count;
+    """)
+    return cursor.rowcount
+
+
+# Счётчик заказов клиента. Его поддерживают триггеры на orders, поэтому отчёт
+# читает готовые числа по индексу, а не группирует всю таблицу заказов.
+# Триггеры уровня оператора: один UPDATE clients на весь INSERT/DELETE/UPDATE,
+# сколько бы строк он ни затронул. Строки клиентов блокируются по возрастанию id,
+# чтобы параллельные вставки заказов не ловили взаимоблокировки.
+ORDERS_COUNT_SQL = """
+    ALTER TABLE clients ADD COLUMN IF NOT EXISTS orders_count INT NOT NULL DEFAULT 0;
+    CREATE INDEX IF NOT EXISTS clients_orders_count_idx ON clients (orders_count DESC, id);
+
+    CREATE OR REPLACE FUNCTION count_client_orders() RETURNS trigger AS $$
+    DECLARE
+        ids INT[];
+        deltas BIGINT[];
+    BEGIN
+        IF TG_OP = 'TRUNCATE' THEN
+            UPDATE clients SET orders_count = 0 WHERE orders_count <> 0;
+            RETURN NULL;
+        ELSIF TG_OP = 'INSERT' THEN
+            SELECT array_agg(client_id ORDER BY client_id), array_agg(n ORDER BY client_id)
+            INTO ids, deltas
+            FROM (SELECT client_id, COUNT(*) AS n FROM new_rows
+                  WHERE client_id IS NOT NULL GROUP BY client_id) d;
+        ELSIF TG_OP = 'DELETE' THEN
+            SELECT array_agg(client_id ORDER BY client_id), array_agg(-n ORDER BY client_id)
+            INTO ids, deltas
+            FROM (SELECT client_id, COUNT(*) AS n FROM old_rows
+                  WHERE client_id IS NOT NULL GROUP BY client_id) d;
+        ELSE
+            SELECT array_agg(client_id ORDER BY client_id), array_agg(n ORDER BY client_id)
+            INTO ids, deltas
+            FROM (SELECT client_id, SUM(n) AS n
+                  FROM (SELECT client_id, 1 AS n FROM new_rows
+                        UNION ALL
+                        SELECT client_id, -1 FROM old_rows) x
+                  WHERE client_id IS NOT NULL
+                  GROUP BY client_id
+                  HAVING SUM(n) <> 0) d;
+        END IF;
+
+        IF ids IS NULL THEN
+            RETURN NULL;
+        END IF;
+
+        PERFORM 1 FROM clients WHERE id = ANY(ids) ORDER BY id FOR NO KEY UPDATE;
+        UPDATE clients c
+        SET orders_count = c.orders_count + d.n
+        FROM unnest(ids, deltas) AS d(client_id, n)
+        WHERE c.id = d.client_id;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    DROP TRIGGER IF EXISTS trg_orders_count_ins ON orders;
+    DROP TRIGGER IF EXISTS trg_orders_count_del ON orders;
+    DROP TRIGGER IF EXISTS trg_orders_count_upd ON orders;
+    DROP TRIGGER IF EXISTS trg_orders_count_truncate ON orders;
+    CREATE TRIGGER trg_orders_count_ins AFTER INSERT ON orders
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION count_client_orders();
+    CREATE TRIGGER trg_orders_count_del AFTER DELETE ON orders
+        REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION count_client_orders();
+    -- UPDATE OF client_id нельзя: с таблицами переходов список столбцов не допускается;
+    -- обновления других столбцов дают нулевые дельты и ничего не пишут
+    CREATE TRIGGER trg_orders_count_upd AFTER UPDATE ON orders
+        REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION count_client_orders();
+    CREATE TRIGGER trg_orders_count_truncate AFTER TRUNCATE ON orders
+        FOR EACH STATEMENT EXECUTE FUNCTION count_client_orders();
+"""
+
+
+def add_orders_count(cursor):
+    cursor.execute(ORDERS_COUNT_SQL)
+    # Столбец добавлен к уже заполненным таблицам
+    rebuild_orders_count(cursor)
+
+
+# Схема по версиям (schema_migrations): применяются только недостающие миграции
+MIGRATIONS = [
+    """
     CREATE TABLE IF NOT EXISTS clients (
         id SERIAL PRIMARY KEY,
         name TEXT
     );
-""")
 
-cursor.execute("""
     CREATE TABLE IF NOT EXISTS orders (
         id SERIAL PRIMARY KEY,
         client_id INT REFERENCES clients(id)
     );
-""")
+    """,
+    add_orders_count,
+]
+
+
+# Тестовые данные добавляются только в пустую базу
+def seed(cursor):
+    # Добавляем клиентов
+    execute_prepared_many(cursor, 'insert_client', "INSERT INTO clients (name) VALUES ($1)",
+                          [('Alice',), ('Bob',), ('Charlie',)])
 
-# Чистим данные
-cursor.execute("DELETE FROM orders;")
-cursor.execute("DELETE FROM clients;")
+    # Добавляем заказы (клиент — по имени, id зависят от последовательности)
+    execute_prepared_many(cursor, 'insert_order',
+                          "INSERT INTO orders (client_id) SELECT id FROM clients WHERE name = $1",
+                          [('Alice',), ('Alice',), ('Bob',), ('Charlie',), ('Charlie',), ('Charlie',)])
 
-# Добавляем клиентов
-cursor.execute("INSERT INTO clients (name) VALUES (%s)", ('Alice',))
-cursor.execute("INSERT INTO clients (name) VALUES (%s)", ('Bob',))
-cursor.execute("INSERT INTO clients (name) VALUES (%s)", ('Charlie',))
 
-# Добавляем заказы
-cursor.execute("INSERT INTO orders (client_id) VALUES (%s)", (1,))
-cursor.execute("INSERT INTO orders (client_id) VALUES (%s)", (1,))
-cursor.execute("INSERT INTO orders (client_id) VALUES (%s)", (2,))
-cursor.execute("INSERT INTO orders (client_id) VALUES (%s)", (3,))
-cursor.execute("INSERT INTO orders (client_id) VALUES (%s)", (3,))
-cursor.execute("INSERT INTO orders (client_id) VALUES (%s)", (3,))
+connection = get_connection()
+migrate(connection, 'klient', MIGRATIONS, seed=seed, seed_table='clients')
+
+cursor = connection.cursor()
 
-connection.commit()
+if args.rebuild_counters:
+    fixed = rebuild_orders_count(cursor)
+    connection.commit()
+    print(f"Счётчики заказов пересчитаны, исправлено клиентов: {fixed}")
 
-# Запрос: количество заказов по каждому клиенту
+# Запрос: количество заказов по каждому клиенту — готовый счётчик по индексу
 cursor.execute("""
-    SELECT c.name, COUNT(o.id) AS orders_count
-    FROM clients c
-    LEFT JOIN orders o ON c.id = o.client_id
-    GROUP BY c.id, c.name
-    ORDER BY orders_count DESC;
+    SELECT name, orders_count
+    FROM clients
+    ORDER BY orders_count DESC, id;
 """)
 
 rows = cursor.fetchall()
@@ -60,4 +161,4 @@ for row in rows:
     print(row)
 
 cursor.close()
-connection.close()
+release(connection)
@@ -1,31 +1,32 @@
-import psycopg2
+import os
+import sys
 
-# Подключение к базе данных
-connection = psycopg2.connect(
-    host="localhost",
-    port="5432",
-    database="my_python_app",
-    user="postgres",
-    password="khadimov"  # замените на свой пароль
-)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from schema_migrations import migrate
+from db_pool import execute_prepared_many, get_connection, release
 
-cursor = connection.cursor()
-
-# 1. Создаем таблицу (если еще не существует)
-cursor.execute("""
+# 1. Схема по версиям (schema_migrations): применяются только недостающие миграции
+MIGRATIONS = [
+    """
     CREATE TABLE IF NOT EXISTS users (
         id SERIAL PRIMARY KEY,
         username TEXT NOT NULL
     );
-""")
+    """,
+]
+
 
-# 2. Вставляем несколько пользователей
-cursor.execute("INSERT INTO users (username) VALUES (%s)", ('Alice',))
-cursor.execute("INSERT INTO users (username) VALUES (%s)", ('Bob',))
-cursor.execute("INSERT INTO users (username) VALUES (%s)", ('Charlie',))
+# 2. Несколько пользователей — только в пустую таблицу, а не при каждом запуске
+def seed(cursor):
+    execute_prepared_many(cursor, 'insert_user', "INSERT INTO users (username) VALUES ($1)",
+                          [('Alice',), ('Bob',), ('Charlie',)])
 
-# Сохраняем изменения
-connection.commit()
+
+# Соединение из общего пула (параметры — в db_pool.py)
+connection = get_connection()
+migrate(connection, 'main', MIGRATIONS, seed=seed, seed_table='users')
+
+cursor = connection.cursor()
 
 # 3. Получаем всех пользователей
 cursor.execute("SELECT * FROM users;")
@@ -35,6 +36,6 @@ print("Пользователи в базе данных:")
 for row in rows:
     print(f"id={row[0]}, username={row[1]}")
 
-# Закрываем соединение
+# Возвращаем соединение в пул
 cursor.close()
-connection.close()
+release(connection)
@@ -1,24 +1,24 @@
+import argparse
+import io
 import random
-import psycopg2
+import sys
+import time
 from psycopg2 import DatabaseError
 
-DSN = {
-    'host': 'localhost',
-    'port': 5432,
-    'database': 'my_python_app',
-    'user': 'postgres',
-    'password': 'khadimov'  # поменяй на свой пароль
-}
-
-def main():
-    conn = psycopg2.connect(**DSN)
-    try:
-        cur = conn.cursor()
+from db_pool import get_connection, release
 
-        # --- 1) Создаем схему, функции и триггер ---
-        cur.execute("""
+# Схема, функции и триггеры симулятора
+SCHEMA_SQL = """
         -- Удаляем старое
+        DROP TABLE IF EXISTS order_summary_changes CASCADE;
+        DROP TABLE IF EXISTS stock_summary_changes CASCADE;
+        DROP TABLE IF EXISTS order_summary CASCADE;
+        DROP TABLE IF EXISTS stock_summary CASCADE;
+        DROP TABLE IF EXISTS stock_snapshot_state CASCADE;
+        DROP TABLE IF EXISTS stock_snapshots CASCADE;
         DROP TABLE IF EXISTS movements CASCADE;
+        DROP TABLE IF EXISTS stock_reservations CASCADE;
+        DROP TABLE IF EXISTS order_allocations CASCADE;
         DROP TABLE IF EXISTS order_items CASCADE;
         DROP TABLE IF EXISTS orders CASCADE;
         DROP TABLE IF EXISTS inventory CASCADE;
@@ -31,7 +31,10 @@ def main():
             id SERIAL PRIMARY KEY,
             name TEXT NOT NULL,
             city TEXT,
-            capacity NUMERIC NOT NULL CHECK (capacity > 0)
+            capacity NUMERIC NOT NULL CHECK (capacity > 0),
+            -- Занятый объём, поддерживается триггерами на inventory
+            used_volume NUMERIC NOT NULL DEFAULT 0 CHECK (used_volume >= 0),
+            CHECK (used_volume <= capacity)
         );
 
         -- Товары
@@ -47,8 +50,13 @@ def main():
             warehouse_id INT NOT NULL REFERENCES warehouses(id) ON DELETE CASCADE,
             product_id INT NOT NULL REFERENCES products(id) ON DELETE CASCADE,
             quantity INT NOT NULL CHECK (quantity >= 0),
-            PRIMARY KEY (warehouse_id, product_id)
+            -- Сумма активных броней (stock_reservations); доступно quantity - reserved
+            reserved INT NOT NULL DEFAULT 0 CHECK (reserved >= 0),
+            PRIMARY KEY (warehouse_id, product_id),
+            CHECK (reserved <= quantity)
         );
+        -- Поиск складов по товарам заказа (allocation_candidates)
+        CREATE INDEX inventory_product_qty_idx ON inventory (product_id, quantity) INCLUDE (warehouse_id, reserved);
 
         -- Клиенты
         CREATE TABLE customers (
@@ -61,7 +69,7 @@ def main():
             id SERIAL PRIMARY KEY,
             customer_id INT REFERENCES customers(id) ON DELETE SET NULL,
             created_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
-            status TEXT NOT NULL CHECK (status IN ('new','processing','shipped','cancelled')),
+            status TEXT NOT NULL CHECK (status IN ('new','reserved','processing','shipped','cancelled')),
             total_amount NUMERIC(14,2) DEFAULT 0 NOT NULL CHECK (total_amount >= 0),
             allocated_warehouse_id INT REFERENCES warehouses(id) ON DELETE SET NULL
         );
@@ -73,15 +81,101 @@ def main():
             product_id INT NOT NULL REFERENCES products(id) ON DELETE RESTRICT,
             quantity INT NOT NULL CHECK (quantity > 0)
         );
+        CREATE INDEX order_items_order_id_idx ON order_items (order_id);
 
-        -- Журнал движения
+        -- Отгрузки по складам для заказов, разбитых на несколько складов
+        -- (allocation_planner.py). allocated_warehouse_id заказа — основной склад.
+        CREATE TABLE order_allocations (
+            order_id INT NOT NULL REFERENCES orders(id) ON DELETE CASCADE,
+            warehouse_id INT NOT NULL REFERENCES warehouses(id) ON DELETE CASCADE,
+            product_id INT NOT NULL REFERENCES products(id) ON DELETE RESTRICT,
+            quantity INT NOT NULL CHECK (quantity > 0),
+            PRIMARY KEY (order_id, warehouse_id, product_id)
+        );
+
+        -- Временные брони остатков (reserve_order). Пока бронь активна, её количество
+        -- учтено в inventory.reserved; подтверждение списывает остаток, истечение
+        -- или отмена возвращают его (confirm_reservation, release_reservations).
+        CREATE TABLE stock_reservations (
+            id BIGSERIAL PRIMARY KEY,
+            order_id INT NOT NULL REFERENCES orders(id) ON DELETE CASCADE,
+            warehouse_id INT NOT NULL,
+            product_id INT NOT NULL,
+            quantity INT NOT NULL CHECK (quantity > 0),
+            expires_at TIMESTAMP WITH TIME ZONE NOT NULL,
+            FOREIGN KEY (warehouse_id, product_id) REFERENCES inventory(warehouse_id, product_id) ON DELETE CASCADE
+        );
+        CREATE INDEX stock_reservations_wh_product_idx ON stock_reservations (warehouse_id, product_id);
+        CREATE INDEX stock_reservations_order_idx ON stock_reservations (order_id);
+        CREATE INDEX stock_reservations_expires_idx ON stock_reservations (expires_at);
+
+        -- Журнал движения, секционирован по месяцам created_at.
+        -- Строки вне созданных секций попадают в movements_default
+        -- (см. ensure_movement_partitions).
         CREATE TABLE movements (
-            id SERIAL PRIMARY KEY,
+            id BIGSERIAL,
             warehouse_id INT REFERENCES warehouses(id) ON DELETE SET NULL,
             product_id INT REFERENCES products(id) ON DELETE SET NULL,
             quantity_change INT NOT NULL,
             reason TEXT,
-            created_at TIMESTAMP WITH TIME ZONE DEFAULT now()
+            created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+            PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at);
+        CREATE TABLE movements_default PARTITION OF movements DEFAULT;
+        -- История по товару на складе и выборки по диапазону дат
+        CREATE INDEX movements_wh_product_idx ON movements (warehouse_id, product_id, created_at);
+        CREATE INDEX movements_created_brin ON movements USING brin (created_at);
+
+        -- Дневные снимки остатков: строка пишется только за день, когда по паре
+        -- (склад, товар) было движение, и хранит количество на конец этого дня
+        CREATE TABLE stock_snapshots (
+            warehouse_id INT NOT NULL,
+            product_id INT NOT NULL,
+            snapshot_date DATE NOT NULL,
+            quantity BIGINT NOT NULL,
+            PRIMARY KEY (warehouse_id, product_id, snapshot_date)
+        );
+
+        -- Последний день, за который сняты снимки
+        CREATE TABLE stock_snapshot_state (
+            id BOOLEAN PRIMARY KEY DEFAULT true CHECK (id),
+            last_date DATE
+        );
+        INSERT INTO stock_snapshot_state (last_date) VALUES (NULL);
+
+        -- Сводки для дашбордов (см. refresh_summaries): те же строки, что в отчётах
+        -- «остатки по складам» и «заказы», но уже с названиями, без соединений.
+        -- Читаются страницами по первичному ключу (iter_stock_summary, iter_order_summary).
+        CREATE TABLE stock_summary (
+            warehouse_id INT NOT NULL,
+            product_id INT NOT NULL,
+            warehouse_name TEXT NOT NULL,
+            product_name TEXT NOT NULL,
+            quantity INT NOT NULL,
+            refreshed_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+            PRIMARY KEY (warehouse_id, product_id)
+        );
+
+        CREATE TABLE order_summary (
+            order_id INT PRIMARY KEY,
+            customer_name TEXT,
+            status TEXT NOT NULL,
+            allocated_warehouse_id INT,
+            total_amount NUMERIC(14,2) NOT NULL,
+            refreshed_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()
+        );
+
+        -- Журналы изменённых ключей для сводок. Триггеры только дописывают в них
+        -- строки, поэтому запись остатков и заказов не ждёт блокировок строк сводок.
+        CREATE TABLE stock_summary_changes (
+            id BIGSERIAL PRIMARY KEY,
+            warehouse_id INT NOT NULL,
+            product_id INT NOT NULL
+        );
+
+        CREATE TABLE order_summary_changes (
+            id BIGSERIAL PRIMARY KEY,
+            order_id INT NOT NULL
         );
 
         -- Функция безопасного поступления
@@ -100,12 +194,11 @@ def main():
 
             incoming_volume := prod_volume * qty;
 
-            SELECT COALESCE(SUM(i.quantity * p.unit_volume),0)
-            INTO current_volume
-            FROM inventory i JOIN products p ON p.id = i.product_id
-            WHERE i.warehouse_id = wh_id;
-
-            SELECT capacity INTO max_capacity FROM warehouses WHERE id = wh_id;
+            -- Занятый объём берём из счётчика; блокировка строки склада
+            -- сериализует параллельные поступления на один склад
+            SELECT capacity, used_volume INTO max_capacity, current_volume
+            FROM warehouses WHERE id = wh_id
+            FOR NO KEY UPDATE;
             IF NOT FOUND THEN RAISE EXCEPTION 'Warehouse % does not exist', wh_id; END IF;
 
             IF current_volume + incoming_volume > max_capacity THEN
@@ -124,67 +217,799 @@ def main():
         END;
         $$;
 
-        -- Функция allocate_order
-        CREATE OR REPLACE FUNCTION allocate_order(o_id INT) RETURNS VOID LANGUAGE plpgsql AS $$
+        -- Склады, способные целиком выполнить заказ, от большего запаса к меньшему.
+        -- Поиск идёт от позиций заказа к inventory по индексу (product_id, quantity),
+        -- поэтому читаются только строки товаров заказа, а не весь inventory.
+        -- Функция на SQL встраивается в вызывающий запрос, её план виден в EXPLAIN.
+        CREATE OR REPLACE FUNCTION allocation_candidates(o_id INT)
+        RETURNS TABLE(warehouse_id INT, total_available BIGINT) LANGUAGE sql STABLE AS $$
+            WITH req AS (
+                SELECT oi.product_id, SUM(oi.quantity) AS req_qty
+                FROM order_items oi WHERE oi.order_id = o_id
+                GROUP BY oi.product_id
+            )
+            SELECT i.warehouse_id, SUM(i.quantity - i.reserved) AS total_available
+            FROM req r
+            JOIN inventory i ON i.product_id = r.product_id AND i.quantity >= r.req_qty
+                AND i.quantity - i.reserved >= r.req_qty
+            GROUP BY i.warehouse_id
+            HAVING COUNT(*) = (SELECT COUNT(*) FROM req)
+            ORDER BY total_available DESC, i.warehouse_id
+        $$;
+
+        -- Функция allocate_order.
+        -- Безопасна при параллельном запуске: блокировки берутся в порядке
+        -- заказ -> склад -> остатки склада по возрастанию product_id,
+        -- а окончательная проверка остатков делается уже под блокировкой.
+        -- min_wh — наименьший склад, который можно брать (см. allocate_orders).
+        -- Если заказ помещается только на склады с меньшим id, он не отменяется:
+        -- ошибка WH002, заказ остаётся 'new'.
+        DROP FUNCTION IF EXISTS allocate_order(INT);
+        CREATE OR REPLACE FUNCTION allocate_order(o_id INT, min_wh INT DEFAULT NULL) RETURNS VOID LANGUAGE plpgsql AS $$
         DECLARE
             candidate_wh INT;
+            allocated_wh INT;
+            order_status TEXT;
             required_items_count INT;
+            locked_ok INT;
+            skipped_lower BOOLEAN := false;
         BEGIN
-            SELECT COUNT(*) INTO required_items_count FROM order_items WHERE order_id = o_id;
+            -- Один заказ не должен распределяться двумя обработчиками сразу
+            SELECT status INTO order_status FROM orders WHERE id = o_id FOR UPDATE;
+            IF NOT FOUND THEN RAISE EXCEPTION 'Order % does not exist', o_id; END IF;
+            IF order_status <> 'new' THEN
+                RAISE EXCEPTION 'Order % is already %', o_id, order_status;
+            END IF;
+
+            SELECT COUNT(DISTINCT product_id) INTO required_items_count FROM order_items WHERE order_id = o_id;
             IF required_items_count = 0 THEN
                 UPDATE orders SET status='cancelled' WHERE id=o_id;
                 RAISE EXCEPTION 'Order % has no items', o_id;
             END IF;
 
-            WITH req AS (
-                SELECT product_id, quantity AS req_qty FROM order_items WHERE order_id = o_id
-            ),
-            avail AS (
-                SELECT i.warehouse_id, i.product_id, i.quantity AS avail_qty FROM inventory i
-            ),
-            matched AS (
-                SELECT a.warehouse_id,
-                       COUNT(*) FILTER (WHERE a.avail_qty >= r.req_qty) AS ok_count,
-                       SUM(a.avail_qty) FILTER (WHERE a.product_id IN (SELECT product_id FROM req)) AS total_available_for_items
-                FROM avail a
-                JOIN req r ON r.product_id = a.product_id
-                GROUP BY a.warehouse_id
-            ),
-            candidates AS (
-                SELECT warehouse_id, ok_count, total_available_for_items
-                FROM matched
-                WHERE ok_count = (SELECT COUNT(*) FROM req)
-            )
-            SELECT warehouse_id INTO candidate_wh
-            FROM candidates
-            ORDER BY total_available_for_items DESC NULLS LAST
-            LIMIT 1;
+            -- Кандидаты читаются без блокировок и служат только подсказкой
+            FOR candidate_wh IN
+                SELECT c.warehouse_id FROM allocation_candidates(o_id) c
+            LOOP
+                IF candidate_wh < min_wh THEN
+                    skipped_lower := true;
+                    CONTINUE;
+                END IF;
+                BEGIN
+                    PERFORM 1 FROM warehouses WHERE id = candidate_wh FOR NO KEY UPDATE;
+
+                    SELECT COUNT(*) FILTER (WHERE l.available >= l.req_qty) INTO locked_ok
+                    FROM (
+                        SELECT i.quantity - i.reserved AS available, r.req_qty
+                        FROM inventory i
+                        JOIN (
+                            SELECT product_id, SUM(quantity) AS req_qty
+                            FROM order_items WHERE order_id = o_id
+                            GROUP BY product_id
+                        ) r ON r.product_id = i.product_id
+                        WHERE i.warehouse_id = candidate_wh
+                        ORDER BY i.product_id
+                        FOR UPDATE OF i
+                    ) l;
+
+                    IF locked_ok < required_items_count THEN
+                        -- Остаток уже забрал другой заказ: откат подтранзакции снимает
+                        -- блокировки этого склада, и мы пробуем следующий
+                        RAISE EXCEPTION USING ERRCODE = 'WH001';
+                    END IF;
+                    allocated_wh := candidate_wh;
+                EXCEPTION WHEN SQLSTATE 'WH001' THEN
+                    NULL;
+                END;
+                EXIT WHEN allocated_wh IS NOT NULL;
+            END LOOP;
 
-            IF candidate_wh IS NULL THEN
+            IF allocated_wh IS NULL AND skipped_lower THEN
+                RAISE EXCEPTION 'Order % fits only warehouses below %', o_id, min_wh
+                    USING ERRCODE = 'WH002';
+            END IF;
+            IF allocated_wh IS NULL THEN
                 UPDATE orders SET status='cancelled' WHERE id=o_id;
                 RAISE EXCEPTION 'No single warehouse can fulfill order % — order cancelled', o_id;
             END IF;
 
             WITH req AS (
-                SELECT product_id, quantity AS req_qty FROM order_items WHERE order_id = o_id
+                SELECT product_id, SUM(quantity) AS req_qty
+                FROM order_items WHERE order_id = o_id
+                GROUP BY product_id
             )
             UPDATE inventory i
             SET quantity = i.quantity - r.req_qty
             FROM req r
-            WHERE i.warehouse_id = candidate_wh AND i.product_id = r.product_id;
+            WHERE i.warehouse_id = allocated_wh AND i.product_id = r.product_id;
 
             INSERT INTO movements (warehouse_id, product_id, quantity_change, reason)
-            SELECT candidate_wh, r.product_id, -r.quantity, 'allocate_order'
+            SELECT allocated_wh, r.product_id, -r.quantity, 'allocate_order'
             FROM order_items r
             WHERE r.order_id = o_id;
 
+            UPDATE orders SET status='processing', allocated_warehouse_id=allocated_wh WHERE id=o_id;
+
+        END;
+        $$;
+
+        -- Пакетное распределение: один вызов на пачку заказов, результат по каждому заказу.
+        -- Каждый заказ обрабатывается в своей подтранзакции, поэтому ошибка одного
+        -- заказа не откатывает остальные. Ошибки сериализации и взаимоблокировки
+        -- пробрасываются наружу — их нужно повторять целиком, а не отменять заказ.
+        CREATE OR REPLACE FUNCTION allocate_orders(o_ids INT[])
+        RETURNS TABLE(order_id INT, warehouse_id INT, error TEXT) LANGUAGE plpgsql AS $$
+        DECLARE
+            cur_id INT;
+            held_wh INT;  -- наибольший склад, заблокированный этой пачкой
+        BEGIN
+            -- Пачка удерживает склады распределённых заказов до commit (их строки
+            -- меняет и триггер used_volume). Блокируется только выбранный склад
+            -- каждого заказа, но все пачки берут склады по возрастанию id: заказы
+            -- идут в порядке склада, который они предпочитают, и каждый следующий
+            -- заказ берёт склад не меньше уже удерживаемых. Поэтому пачки не ждут
+            -- друг друга по кругу и работают параллельно на разных складах.
+            -- Заказ, который поместился бы только на склад с меньшим id, остаётся
+            -- 'new' и в результат не попадает — его заберёт следующая пачка.
+            -- Склады блокируются везде в режиме NO KEY UPDATE: он исключает другие
+            -- блокировки складов, но не мешает проверкам внешних ключей (KEY SHARE),
+            -- например при бронировании с записью orders.allocated_warehouse_id.
+            FOR cur_id IN
+                SELECT o.id
+                FROM unnest(o_ids) AS o(id)
+                LEFT JOIN LATERAL (
+                    SELECT c.warehouse_id FROM allocation_candidates(o.id) c LIMIT 1
+                ) preferred ON true
+                ORDER BY preferred.warehouse_id NULLS FIRST, o.id
+            LOOP
+                order_id := cur_id;
+                BEGIN
+                    PERFORM allocate_order(cur_id, held_wh);
+                    SELECT o.allocated_warehouse_id INTO warehouse_id FROM orders o WHERE o.id = cur_id;
+                    held_wh := GREATEST(held_wh, warehouse_id);
+                    error := NULL;
+                EXCEPTION
+                    WHEN serialization_failure OR deadlock_detected THEN
+                        RAISE;
+                    WHEN SQLSTATE 'WH002' THEN
+                        CONTINUE;
+                    WHEN OTHERS THEN
+                        UPDATE orders o SET status='cancelled' WHERE o.id = cur_id;
+                        warehouse_id := NULL;
+                        error := SQLERRM;
+                END;
+                RETURN NEXT;
+            END LOOP;
+        END;
+        $$;
+
+        -- Бронирование заказа на одном складе на время hold (корзина, оплата).
+        -- Остаток не списывается, растёт только inventory.reserved, а склад не
+        -- блокируется: транзакция короткая и держит лишь строки inventory товаров
+        -- заказа (по возрастанию product_id). Возвращает склад брони.
+        CREATE OR REPLACE FUNCTION reserve_order(o_id INT, hold INTERVAL DEFAULT '15 minutes')
+        RETURNS INT LANGUAGE plpgsql AS $$
+        DECLARE
+            candidate_wh INT;
+            reserved_wh INT;
+            order_status TEXT;
+            required_items_count INT;
+            locked_ok INT;
+        BEGIN
+            SELECT status INTO order_status FROM orders WHERE id = o_id FOR UPDATE;
+            IF NOT FOUND THEN RAISE EXCEPTION 'Order % does not exist', o_id; END IF;
+            IF order_status <> 'new' THEN
+                RAISE EXCEPTION 'Order % is already %', o_id, order_status;
+            END IF;
+
+            SELECT COUNT(DISTINCT product_id) INTO required_items_count FROM order_items WHERE order_id = o_id;
+            IF required_items_count = 0 THEN
+                RAISE EXCEPTION 'Order % has no items', o_id;
+            END IF;
+
+            FOR candidate_wh IN
+                SELECT c.warehouse_id FROM allocation_candidates(o_id) c
+            LOOP
+                BEGIN
+                    SELECT COUNT(*) FILTER (WHERE l.available >= l.req_qty) INTO locked_ok
+                    FROM (
+                        SELECT i.quantity - i.reserved AS available, r.req_qty
+                        FROM inventory i
+                        JOIN (
+                            SELECT product_id, SUM(quantity) AS req_qty
+                            FROM order_items WHERE order_id = o_id
+                            GROUP BY product_id
+                        ) r ON r.product_id = i.product_id
+                        WHERE i.warehouse_id = candidate_wh
+                        ORDER BY i.product_id
+                        FOR UPDATE OF i
+                    ) l;
+
+                    IF locked_ok < required_items_count THEN
+                        RAISE EXCEPTION USING ERRCODE = 'WH001';
+                    END IF;
+                    reserved_wh := candidate_wh;
+                EXCEPTION WHEN SQLSTATE 'WH001' THEN
+                    NULL;
+                END;
+                EXIT WHEN reserved_wh IS NOT NULL;
+            END LOOP;
+
+            IF reserved_wh IS NULL THEN
+                RAISE EXCEPTION 'No single warehouse can reserve order %', o_id;
+            END IF;
+
+            WITH req AS (
+                SELECT product_id, SUM(quantity) AS req_qty
+                FROM order_items WHERE order_id = o_id
+                GROUP BY product_id
+            )
+            UPDATE inventory i
+            SET reserved = i.reserved + r.req_qty
+            FROM req r
+            WHERE i.warehouse_id = reserved_wh AND i.product_id = r.product_id;
+
+            INSERT INTO stock_reservations (order_id, warehouse_id, product_id, quantity, expires_at)
+            SELECT o_id, reserved_wh, product_id, SUM(quantity), now() + hold
+            FROM order_items WHERE order_id = o_id
+            GROUP BY product_id;
+
+            UPDATE orders SET status='reserved', allocated_warehouse_id=reserved_wh WHERE id=o_id;
+            RETURN reserved_wh;
+        END;
+        $$;
+
+        -- Подтверждение брони: списывает забронированный остаток и переводит заказ
+        -- в processing. Склад блокируется до остатков, как в allocate_order
+        -- (списание меняет used_volume склада).
+        CREATE OR REPLACE FUNCTION confirm_reservation(o_id INT) RETURNS VOID LANGUAGE plpgsql AS $$
+        DECLARE
+            order_status TEXT;
+            wh_id INT;
+        BEGIN
+            SELECT status, allocated_warehouse_id INTO order_status, wh_id FROM orders WHERE id = o_id FOR UPDATE;
+            IF NOT FOUND THEN RAISE EXCEPTION 'Order % does not exist', o_id; END IF;
+            IF order_status <> 'reserved' THEN
+                RAISE EXCEPTION 'Order % is not reserved (status %)', o_id, order_status;
+            END IF;
+            IF EXISTS (SELECT 1 FROM stock_reservations WHERE order_id = o_id AND expires_at < now()) THEN
+                RAISE EXCEPTION 'Reservation for order % has expired', o_id;
+            END IF;
+
+            PERFORM 1 FROM warehouses WHERE id = wh_id FOR NO KEY UPDATE;
+            PERFORM 1 FROM inventory i
+            JOIN stock_reservations r ON r.warehouse_id = i.warehouse_id AND r.product_id = i.product_id
+            WHERE r.order_id = o_id
+            ORDER BY i.product_id
+            FOR UPDATE OF i;
+
+            UPDATE inventory i
+            SET quantity = i.quantity - r.quantity, reserved = i.reserved - r.quantity
+            FROM stock_reservations r
+            WHERE r.order_id = o_id AND i.warehouse_id = r.warehouse_id AND i.product_id = r.product_id;
+
+            INSERT INTO movements (warehouse_id, product_id, quantity_change, reason)
+            SELECT warehouse_id, product_id, -quantity, 'confirm_reservation'
+            FROM stock_reservations WHERE order_id = o_id;
+
+            DELETE FROM stock_reservations WHERE order_id = o_id;
+            UPDATE orders SET status='processing' WHERE id=o_id;
+        END;
+        $$;
+
+        -- Снимает брони заказов o_ids и переводит их в new_status ('cancelled' или
+        -- 'new' для повторного распределения). Заказы должны быть уже заблокированы
+        -- вызывающим. Склады блокируются по возрастанию id, остатки — по (склад, товар).
+        -- Возвращает число освобождённых заказов.
+        CREATE OR REPLACE FUNCTION release_reservations(o_ids INT[], new_status TEXT DEFAULT 'cancelled')
+        RETURNS INT LANGUAGE plpgsql AS $$
+        DECLARE
+            released INT;
+        BEGIN
+            PERFORM 1 FROM warehouses w
+            WHERE w.id IN (SELECT r.warehouse_id FROM stock_reservations r WHERE r.order_id = ANY(o_ids))
+            ORDER BY w.id
+            FOR NO KEY UPDATE;
+            PERFORM 1 FROM inventory i
+            WHERE (i.warehouse_id, i.product_id) IN (
+                SELECT r.warehouse_id, r.product_id FROM stock_reservations r WHERE r.order_id = ANY(o_ids)
+            )
+            ORDER BY i.warehouse_id, i.product_id
+            FOR UPDATE;
+
+            UPDATE inventory i
+            SET reserved = i.reserved - t.quantity
+            FROM (
+                SELECT warehouse_id, product_id, SUM(quantity) AS quantity
+                FROM stock_reservations WHERE order_id = ANY(o_ids)
+                GROUP BY warehouse_id, product_id
+            ) t
+            WHERE i.warehouse_id = t.warehouse_id AND i.product_id = t.product_id;
+
+            DELETE FROM stock_reservations WHERE order_id = ANY(o_ids);
+            UPDATE orders SET status = new_status, allocated_warehouse_id = NULL
+            WHERE id = ANY(o_ids) AND status = 'reserved';
+            GET DIAGNOSTICS released = ROW_COUNT;
+            RETURN released;
+        END;
+        $$;
+
+        -- Отмена брони одного заказа (например, клиент ушёл из корзины)
+        CREATE OR REPLACE FUNCTION release_reservation(o_id INT, new_status TEXT DEFAULT 'cancelled')
+        RETURNS VOID LANGUAGE plpgsql AS $$
+        DECLARE
+            order_status TEXT;
+        BEGIN
+            SELECT status INTO order_status FROM orders WHERE id = o_id FOR UPDATE;
+            IF NOT FOUND THEN RAISE EXCEPTION 'Order % does not exist', o_id; END IF;
+            IF order_status <> 'reserved' THEN
+                RAISE EXCEPTION 'Order % is not reserved (status %)', o_id, order_status;
+            END IF;
+            PERFORM release_reservations(ARRAY[o_id], new_status);
+        END;
+        $$;
+
+        -- Фоновая очистка: снимает до batch_size просроченных броней (по заказам)
+        -- и отменяет эти заказы. Заказы, которые сейчас подтверждаются, заблокированы
+        -- и пропускаются до следующего запуска. Возвращает число отменённых заказов.
+        CREATE OR REPLACE FUNCTION expire_reservations(batch_size INT DEFAULT 1000)
+        RETURNS INT LANGUAGE plpgsql AS $$
+        DECLARE
+            expired INT[];
+        BEGIN
+            SELECT array_agg(e.id) INTO expired
+            FROM (
+                SELECT o.id FROM orders o
+                WHERE o.id IN (SELECT r.order_id FROM stock_reservations r WHERE r.expires_at < now())
+                  AND o.status = 'reserved'
+                ORDER BY o.id
+                LIMIT batch_size
+                FOR UPDATE OF o SKIP LOCKED
+            ) e;
+            IF expired IS NULL THEN
+                RETURN 0;
+            END IF;
+            RETURN release_reservations(expired, 'cancelled');
+        END;
+        $$;
+
+        -- Создаёт месячные секции movements начиная с месяца from_day на months_ahead
+        -- месяцев вперёд. Строки, уже попавшие за этот месяц в movements_default,
+        -- переносятся в новую секцию. Возвращает число созданных секций.
+        CREATE OR REPLACE FUNCTION ensure_movement_partitions(from_day DATE DEFAULT current_date, months_ahead INT DEFAULT 2)
+        RETURNS INT LANGUAGE plpgsql AS $$
+        DECLARE
+            month_start DATE := date_trunc('month', from_day)::date;
+            month_end DATE;
+            part_name TEXT;
+            created INT := 0;
+        BEGIN
+            FOR i IN 0..months_ahead LOOP
+                month_end := (month_start + interval '1 month')::date;
+                part_name := format('movements_%s', to_char(month_start, 'YYYY_MM'));
+                IF to_regclass(part_name) IS NULL THEN
+                    CREATE TEMP TABLE movements_moved AS SELECT * FROM movements_default WHERE false;
+                    WITH moved AS (
+                        DELETE FROM movements_default
+                        WHERE created_at >= month_start AND created_at < month_end
+                        RETURNING *
+                    )
+                    INSERT INTO movements_moved SELECT * FROM moved;
+                    EXECUTE format('CREATE TABLE %I PARTITION OF movements FOR VALUES FROM (%L) TO (%L)',
+                                   part_name, month_start, month_end);
+                    INSERT INTO movements SELECT * FROM movements_moved;
+                    DROP TABLE movements_moved;
+                    created := created + 1;
+                END IF;
+                month_start := month_end;
+            END LOOP;
+            RETURN created;
+        END;
+        $$;
+
+        SELECT ensure_movement_partitions((current_date - interval '1 month')::date, 3);
+
+        -- Снимает дневные снимки за все полные дни после последнего снятого по upto включительно.
+        -- Количество на конец дня = последний снимок пары + сумма движений за дни после него.
+        CREATE OR REPLACE FUNCTION take_stock_snapshots(upto DATE DEFAULT current_date - 1)
+        RETURNS INT LANGUAGE plpgsql AS $$
+        DECLARE
+            last_day DATE;
+            written INT;
+        BEGIN
+            SELECT last_date INTO last_day FROM stock_snapshot_state FOR UPDATE;
+            IF last_day >= upto THEN
+                RETURN 0;
+            END IF;
+
+            WITH daily AS (
+                SELECT m.created_at::date AS day, m.warehouse_id, m.product_id,
+                       SUM(m.quantity_change) AS delta
+                FROM movements m
+                WHERE (last_day IS NULL OR m.created_at >= last_day + 1)
+                  AND m.created_at < upto + 1
+                  AND m.warehouse_id IS NOT NULL AND m.product_id IS NOT NULL
+                GROUP BY 1, 2, 3
+            )
+            INSERT INTO stock_snapshots (warehouse_id, product_id, snapshot_date, quantity)
+            SELECT d.warehouse_id, d.product_id, d.day,
+                   COALESCE(prev.quantity, 0)
+                   + SUM(d.delta) OVER (PARTITION BY d.warehouse_id, d.product_id ORDER BY d.day)
+            FROM daily d
+            LEFT JOIN LATERAL (
+                SELECT s.quantity FROM stock_snapshots s
+                WHERE s.warehouse_id = d.warehouse_id AND s.product_id = d.product_id
+                ORDER BY s.snapshot_date DESC
+                LIMIT 1
+            ) prev ON true;
+            GET DIAGNOSTICS written = ROW_COUNT;
+
+            UPDATE stock_snapshot_state SET last_date = upto;
+            RETURN written;
+        END;
+        $$;
+
+        -- Остаток пары (склад, товар) на момент at: ближайший снимок до at
+        -- плюс движения после него — без перебора всего журнала.
+        CREATE OR REPLACE FUNCTION stock_as_of(wh_id INT, prod_id INT, at TIMESTAMPTZ DEFAULT now())
+        RETURNS BIGINT LANGUAGE plpgsql STABLE AS $$
+        DECLARE
+            snap_date DATE;
+            snap_qty BIGINT := 0;
+            delta BIGINT;
+        BEGIN
+            SELECT s.snapshot_date, s.quantity INTO snap_date, snap_qty
+            FROM stock_snapshots s
+            WHERE s.warehouse_id = wh_id AND s.product_id = prod_id
+              AND s.snapshot_date + 1 <= at
+            ORDER BY s.snapshot_date DESC
+            LIMIT 1;
+
+            SELECT COALESCE(SUM(m.quantity_change), 0) INTO delta
+            FROM movements m
+            WHERE m.warehouse_id = wh_id AND m.product_id = prod_id
+              AND (snap_date IS NULL OR m.created_at >= snap_date + 1)
+              AND m.created_at <= at;
+
+            RETURN COALESCE(snap_qty, 0) + delta;
+        END;
+        $$;
+
+        -- Поддержка warehouses.used_volume при любом изменении inventory.
+        -- Триггеры уровня оператора: один UPDATE склада на оператор, а не на строку.
+        CREATE OR REPLACE FUNCTION sync_used_volume() RETURNS TRIGGER LANGUAGE plpgsql AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                UPDATE warehouses w SET used_volume = w.used_volume + d.volume
+                FROM (
+                    SELECT n.warehouse_id, SUM(n.quantity * p.unit_volume) AS volume
+                    FROM new_rows n JOIN products p ON p.id = n.product_id
+                    GROUP BY n.warehouse_id
+                ) d
+                WHERE w.id = d.warehouse_id AND d.volume <> 0;
+            ELSIF TG_OP = 'DELETE' THEN
+                UPDATE warehouses w SET used_volume = w.used_volume - d.volume
+                FROM (
+                    SELECT o.warehouse_id, SUM(o.quantity * p.unit_volume) AS volume
+                    FROM old_rows o JOIN products p ON p.id = o.product_id
+                    GROUP BY o.warehouse_id
+                ) d
+                WHERE w.id = d.warehouse_id AND d.volume <> 0;
+            ELSIF TG_OP = 'UPDATE' THEN
+                UPDATE warehouses w SET used_volume = w.used_volume + d.volume
+                FROM (
+                    SELECT ch.warehouse_id, SUM(ch.quantity * p.unit_volume) AS volume
+                    FROM (
+                        SELECT warehouse_id, product_id, quantity FROM new_rows
+                        UNION ALL
+                        SELECT warehouse_id, product_id, -quantity FROM old_rows
+                    ) ch JOIN products p ON p.id = ch.product_id
+                    GROUP BY ch.warehouse_id
+                ) d
+                WHERE w.id = d.warehouse_id AND d.volume <> 0;
+            END IF;
+            RETURN NULL;
+        END;
+        $$;
+
+        CREATE TRIGGER trg_inventory_volume_ins
+        AFTER INSERT ON inventory
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT
+        EXECUTE FUNCTION sync_used_volume();
+
+        CREATE TRIGGER trg_inventory_volume_upd
+        AFTER UPDATE ON inventory
+        REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT
+        EXECUTE FUNCTION sync_used_volume();
+
+        CREATE TRIGGER trg_inventory_volume_del
+        AFTER DELETE ON inventory
+        REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT
+        EXECUTE FUNCTION sync_used_volume();
+
+        -- Сверка счётчика used_volume с реальной суммой по остаткам.
+        -- Возвращает только расходящиеся склады; fix => true переписывает счётчик.
+        -- Расхождение возможно, например, после изменения products.unit_volume.
+        CREATE OR REPLACE FUNCTION audit_used_volume(fix BOOLEAN DEFAULT false)
+        RETURNS TABLE(wh_id INT, counter_volume NUMERIC, actual_volume NUMERIC) LANGUAGE plpgsql AS $$
+        BEGIN
+            RETURN QUERY
+            WITH actual AS (
+                SELECT w.id, COALESCE(SUM(i.quantity * p.unit_volume), 0) AS volume
+                FROM warehouses w
+                LEFT JOIN inventory i ON i.warehouse_id = w.id
+                LEFT JOIN products p ON p.id = i.product_id
+                GROUP BY w.id
+            )
+            SELECT w.id, w.used_volume, a.volume
+            FROM warehouses w JOIN actual a ON a.id = w.id
+            WHERE w.used_volume <> a.volume
+            ORDER BY w.id;
+
+            IF fix THEN
+                UPDATE warehouses w SET used_volume = a.volume
+                FROM (
+                    SELECT i.warehouse_id, SUM(i.quantity * p.unit_volume) AS volume
+                    FROM inventory i JOIN products p ON p.id = i.product_id
+                    GROUP BY i.warehouse_id
+                ) a
+                WHERE w.id = a.warehouse_id AND w.used_volume <> a.volume;
+                UPDATE warehouses w SET used_volume = 0
+                WHERE w.used_volume <> 0
+                  AND NOT EXISTS (SELECT 1 FROM inventory i WHERE i.warehouse_id = w.id);
+            END IF;
+        END;
+        $$;
+
+        -- Пересчёт total_amount: триггеры уровня оператора с таблицами переходов.
+        -- К каждому затронутому заказу применяется одна дельта на оператор,
+        -- поэтому вставка заказа из k позиций стоит O(k), а не O(k²).
+        CREATE OR REPLACE FUNCTION apply_order_total_deltas() RETURNS TRIGGER LANGUAGE plpgsql AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                UPDATE orders o SET total_amount = o.total_amount + d.delta
+                FROM (
+                    SELECT n.order_id, SUM(n.quantity * p.price) AS delta
+                    FROM new_rows n JOIN products p ON p.id = n.product_id
+                    GROUP BY n.order_id
+                ) d
+                WHERE o.id = d.order_id AND d.delta <> 0;
+            ELSIF TG_OP = 'DELETE' THEN
+                UPDATE orders o SET total_amount = o.total_amount - d.delta
+                FROM (
+                    SELECT r.order_id, SUM(r.quantity * p.price) AS delta
+                    FROM old_rows r JOIN products p ON p.id = r.product_id
+                    GROUP BY r.order_id
+                ) d
+                WHERE o.id = d.order_id AND d.delta <> 0;
+            ELSIF TG_OP = 'UPDATE' THEN
+                UPDATE orders o SET total_amount = o.total_amount + d.delta
+                FROM (
+                    SELECT ch.order_id, SUM(ch.quantity * p.price) AS delta
+                    FROM (
+                        SELECT order_id, product_id, quantity FROM new_rows
+                        UNION ALL
+                        SELECT order_id, product_id, -quantity FROM old_rows
+                    ) ch JOIN products p ON p.id = ch.product_id
+                    GROUP BY ch.order_id
+                ) d
+                WHERE o.id = d.order_id AND d.delta <> 0;
+            END IF;
+            RETURN NULL;
+        END;
+        $$;
+
+        CREATE TRIGGER trg_order_total_ins
+        AFTER INSERT ON order_items
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT
+        EXECUTE FUNCTION apply_order_total_deltas();
+
+        CREATE TRIGGER trg_order_total_upd
+        AFTER UPDATE ON order_items
+        REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT
+        EXECUTE FUNCTION apply_order_total_deltas();
+
+        CREATE TRIGGER trg_order_total_del
+        AFTER DELETE ON order_items
+        REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT
+        EXECUTE FUNCTION apply_order_total_deltas();
+
+        -- Изменённые пары (склад, товар) для сводки остатков. Смена только reserved
+        -- в отчёт не попадает и в журнал не пишется.
+        CREATE OR REPLACE FUNCTION log_stock_summary_changes() RETURNS TRIGGER LANGUAGE plpgsql AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                INSERT INTO stock_summary_changes (warehouse_id, product_id)
+                SELECT warehouse_id, product_id FROM new_rows;
+            ELSIF TG_OP = 'DELETE' THEN
+                INSERT INTO stock_summary_changes (warehouse_id, product_id)
+                SELECT warehouse_id, product_id FROM old_rows;
+            ELSIF TG_OP = 'UPDATE' THEN
+                INSERT INTO stock_summary_changes (warehouse_id, product_id)
+                SELECT warehouse_id, product_id FROM (
+                    (SELECT warehouse_id, product_id, quantity FROM new_rows
+                     EXCEPT SELECT warehouse_id, product_id, quantity FROM old_rows)
+                    UNION ALL
+                    (SELECT warehouse_id, product_id, quantity FROM old_rows
+                     EXCEPT SELECT warehouse_id, product_id, quantity FROM new_rows)
+                ) ch
+                GROUP BY warehouse_id, product_id;
+            END IF;
+            RETURN NULL;
+        END;
+        $$;
+
+        CREATE TRIGGER trg_inventory_summary_ins
+        AFTER INSERT ON inventory
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT
+        EXECUTE FUNCTION log_stock_summary_changes();
+
+        CREATE TRIGGER trg_inventory_summary_upd
+        AFTER UPDATE ON inventory
+        REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT
+        EXECUTE FUNCTION log_stock_summary_changes();
+
+        CREATE TRIGGER trg_inventory_summary_del
+        AFTER DELETE ON inventory
+        REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT
+        EXECUTE FUNCTION log_stock_summary_changes();
+
+        -- Изменённые заказы для сводки заказов (клиент, статус, склад, сумма)
+        CREATE OR REPLACE FUNCTION log_order_summary_changes() RETURNS TRIGGER LANGUAGE plpgsql AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                INSERT INTO order_summary_changes (order_id)
+                SELECT id FROM new_rows;
+            ELSIF TG_OP = 'DELETE' THEN
+                INSERT INTO order_summary_changes (order_id)
+                SELECT id FROM old_rows;
+            ELSIF TG_OP = 'UPDATE' THEN
+                INSERT INTO order_summary_changes (order_id)
+                SELECT id FROM (
+                    (SELECT id, customer_id, status, allocated_warehouse_id, total_amount FROM new_rows
+                     EXCEPT SELECT id, customer_id, status, allocated_warehouse_id, total_amount FROM old_rows)
+                    UNION ALL
+                    (SELECT id, customer_id, status, allocated_warehouse_id, total_amount FROM old_rows
+                     EXCEPT SELECT id, customer_id, status, allocated_warehouse_id, total_amount FROM new_rows)
+                ) ch
+                GROUP BY id;
+            END IF;
+            RETURN NULL;
+        END;
+        $$;
+
+        CREATE TRIGGER trg_order_summary_ins
+        AFTER INSERT ON orders
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT
+        EXECUTE FUNCTION log_order_summary_changes();
+
+        CREATE TRIGGER trg_order_summary_upd
+        AFTER UPDATE ON orders
+        REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT
+        EXECUTE FUNCTION log_order_summary_changes();
+
+        CREATE TRIGGER trg_order_summary_del
+        AFTER DELETE ON orders
+        REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT
+        EXECUTE FUNCTION log_order_summary_changes();
+
+        -- Пересчитывает строки сводок только для ключей из журналов. Забирает строки
+        -- журнала, зафиксированные к началу запроса (они и есть отметка «обработано
+        -- до сюда»); остальные попадут в следующий запуск. Запуски идут по одному,
+        -- чтобы более ранний не перезаписал сводку поверх более позднего.
+        -- Переименование склада, товара или клиента подхватывается при rebuild_summaries.
+        CREATE OR REPLACE FUNCTION refresh_summaries()
+        RETURNS TABLE(stock_rows BIGINT, order_rows BIGINT) LANGUAGE plpgsql AS $$
+        BEGIN
+            PERFORM pg_advisory_xact_lock(hashtext('refresh_summaries'));
+
+            WITH taken AS (
+                DELETE FROM stock_summary_changes RETURNING warehouse_id, product_id
+            ),
+            changed AS (
+                SELECT DISTINCT warehouse_id, product_id FROM taken
+            ),
+            removed AS (
+                DELETE FROM stock_summary s
+                USING changed c
+                WHERE s.warehouse_id = c.warehouse_id AND s.product_id = c.product_id
+                  AND NOT EXISTS (
+                      SELECT 1 FROM inventory i
+                      WHERE i.warehouse_id = c.warehouse_id AND i.product_id = c.product_id
+                  )
+                RETURNING 1
+            ),
+            upserted AS (
+                INSERT INTO stock_summary AS s (warehouse_id, product_id, warehouse_name, product_name, quantity)
+                SELECT i.warehouse_id, i.product_id, w.name, p.name, i.quantity
+                FROM changed c
+                JOIN inventory i ON i.warehouse_id = c.warehouse_id AND i.product_id = c.product_id
+                JOIN warehouses w ON w.id = i.warehouse_id
+                JOIN products p ON p.id = i.product_id
+                ORDER BY i.warehouse_id, i.product_id
+                ON CONFLICT (warehouse_id, product_id) DO UPDATE
+                SET warehouse_name = EXCLUDED.warehouse_name,
+                    product_name = EXCLUDED.product_name,
+                    quantity = EXCLUDED.quantity,
+                    refreshed_at = now()
+                RETURNING 1
+            )
+            SELECT (SELECT COUNT(*) FROM removed) + (SELECT COUNT(*) FROM upserted) INTO stock_rows;
 
-            UPDATE orders SET status='processing', allocated_warehouse_id=candidate_wh WHERE id=o_id;
+            WITH taken AS (
+                DELETE FROM order_summary_changes RETURNING order_id
+            ),
+            changed AS (
+                SELECT DISTINCT order_id FROM taken
+            ),
+            removed AS (
+                DELETE FROM order_summary s
+                USING changed c
+                WHERE s.order_id = c.order_id
+                  AND NOT EXISTS (SELECT 1 FROM orders o WHERE o.id = c.order_id)
+                RETURNING 1
+            ),
+            upserted AS (
+                INSERT INTO order_summary AS s (order_id, customer_name, status, allocated_warehouse_id, total_amount)
+                SELECT o.id, cu.name, o.status, o.allocated_warehouse_id, o.total_amount
+                FROM changed c
+                JOIN orders o ON o.id = c.order_id
+                LEFT JOIN customers cu ON cu.id = o.customer_id
+                ORDER BY o.id
+                ON CONFLICT (order_id) DO UPDATE
+                SET customer_name = EXCLUDED.customer_name,
+                    status = EXCLUDED.status,
+                    allocated_warehouse_id = EXCLUDED.allocated_warehouse_id,
+                    total_amount = EXCLUDED.total_amount,
+                    refreshed_at = now()
+                RETURNING 1
+            )
+            SELECT (SELECT COUNT(*) FROM removed) + (SELECT COUNT(*) FROM upserted) INTO order_rows;
+            RETURN NEXT;
+        END;
+        $$;
 
+        -- Полный пересчёт сводок с нуля (после ручных правок, переименований или при расхождении).
+        -- Блокировка журналов ждёт незавершённые записи и не пускает новые до конца транзакции.
+        CREATE OR REPLACE FUNCTION rebuild_summaries() RETURNS VOID LANGUAGE plpgsql AS $$
+        BEGIN
+            PERFORM pg_advisory_xact_lock(hashtext('refresh_summaries'));
+            LOCK TABLE stock_summary_changes, order_summary_changes IN EXCLUSIVE MODE;
+            DELETE FROM stock_summary_changes;
+            DELETE FROM order_summary_changes;
+            DELETE FROM stock_summary;
+            DELETE FROM order_summary;
+            INSERT INTO stock_summary (warehouse_id, product_id, warehouse_name, product_name, quantity)
+            SELECT i.warehouse_id, i.product_id, w.name, p.name, i.quantity
+            FROM inventory i
+            JOIN warehouses w ON w.id = i.warehouse_id
+            JOIN products p ON p.id = i.product_id;
+            INSERT INTO order_summary (order_id, customer_name, status, allocated_warehouse_id, total_amount)
+            SELECT o.id, cu.name, o.status, o.allocated_warehouse_id, o.total_amount
+            FROM orders o
+            LEFT JOIN customers cu ON cu.id = o.customer_id;
         END;
         $$;
+        """
+
+# Прежний построчный триггер — только для сравнения в bench_order_totals
+LEGACY_ORDER_TOTAL_SQL = """
+        DROP TRIGGER trg_order_total_ins ON order_items;
+        DROP TRIGGER trg_order_total_upd ON order_items;
+        DROP TRIGGER trg_order_total_del ON order_items;
 
-        -- Триггер пересчёта total_amount
         CREATE OR REPLACE FUNCTION recalc_order_total() RETURNS TRIGGER LANGUAGE plpgsql AS $$
         DECLARE
             target_order INT;
@@ -210,50 +1035,479 @@ def main():
         AFTER INSERT OR UPDATE OR DELETE ON order_items
         FOR EACH ROW
         EXECUTE FUNCTION recalc_order_total();
+        """
+
+# SQLSTATE ошибок, после которых транзакцию нужно просто повторить
+RETRYABLE_ERRORS = {
+    '40001': 'serialization',
+    '40P01': 'deadlock',
+}
+
+
+def run_in_transaction(conn, fn, retries=5, on_retry=None):
+    """Выполняет fn(cur) в отдельной транзакции и фиксирует её.
+
+    При ошибке сериализации или взаимоблокировке транзакция откатывается
+    и повторяется (до retries раз, со случайной паузой). on_retry(kind)
+    вызывается перед каждым повтором, kind — значение из RETRYABLE_ERRORS.
+    """
+    attempt = 0
+    while True:
+        try:
+            with conn.cursor() as cur:
+                result = fn(cur)
+            conn.commit()
+            return result
+        except DatabaseError as e:
+            conn.rollback()
+            kind = RETRYABLE_ERRORS.get(e.pgcode)
+            if kind is None or attempt >= retries:
+                raise
+            attempt += 1
+            if on_retry is not None:
+                on_retry(kind)
+            time.sleep(random.uniform(0, 0.005 * 2 ** attempt))
+
+
+# Забираем пачку новых заказов и распределяем её за один запрос.
+# SKIP LOCKED позволяет нескольким обработчикам работать параллельно,
+# не дожидаясь друг друга на одних и тех же заказах.
+ALLOCATE_BATCH_SQL = """
+    SELECT order_id, warehouse_id, error
+    FROM allocate_orders(ARRAY(
+        SELECT id FROM orders
+        WHERE status = 'new'
+        ORDER BY id
+        LIMIT %s
+        FOR UPDATE SKIP LOCKED
+    ))
+"""
+
+
+def allocate_pending_orders(conn, batch_size=100, retries=5, on_retry=None):
+    """Распределяет все заказы со статусом 'new' пачками по batch_size.
+
+    На каждую пачку — один запрос и один commit. Возвращает генератор
+    кортежей (order_id, warehouse_id, error): warehouse_id заполнен при
+    успехе, error — причина отмены заказа. Пачка, прерванная ошибкой
+    сериализации или взаимоблокировкой, повторяется (run_in_transaction).
+    """
+    def allocate_batch(cur):
+        cur.execute(ALLOCATE_BATCH_SQL, (batch_size,))
+        return cur.fetchall()
+
+    while True:
+        rows = run_in_transaction(conn, allocate_batch, retries=retries, on_retry=on_retry)
+        if not rows:
+            break
+        for row in rows:
+            yield row
+
+
+def _copy_value(value):
+    if value is None:
+        return '\\N'
+    return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+def copy_rows(cur, table, columns, rows, chunk_size=100_000):
+    """Передаёт строки в таблицу через COPY FROM STDIN порциями по chunk_size."""
+    sql = f"COPY {table} ({', '.join(columns)}) FROM STDIN"
+    buf = io.StringIO()
+    pending = 0
+    for row in rows:
+        buf.write('\t'.join(_copy_value(v) for v in row))
+        buf.write('\n')
+        pending += 1
+        if pending == chunk_size:
+            buf.seek(0)
+            cur.copy_expert(sql, buf)
+            buf = io.StringIO()
+            pending = 0
+    if pending:
+        buf.seek(0)
+        cur.copy_expert(sql, buf)
+
+
+def bulk_insert(cur, table, columns, rows):
+    """Вставляет строки через COPY и возвращает их id в том же порядке.
+
+    id заранее резервируются из последовательности таблицы одним запросом,
+    поэтому RETURNING по каждой строке не нужен.
+    """
+    rows = list(rows)
+    if not rows:
+        return []
+    cur.execute("SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+                (table, len(rows)))
+    ids = [r[0] for r in cur.fetchall()]
+    copy_rows(cur, table, ('id',) + tuple(columns), ((i,) + tuple(row) for i, row in zip(ids, rows)))
+    return ids
+
+
+# Внешние ключи, которые bulk_load_stock(defer_fk=True) снимает на время слияния
+# и создаёт заново: одна проверка соединением вместо триггера на каждую строку.
+BULK_FOREIGN_KEYS = [
+    ('inventory', 'inventory_warehouse_id_fkey', 'FOREIGN KEY (warehouse_id) REFERENCES warehouses(id) ON DELETE CASCADE'),
+    ('inventory', 'inventory_product_id_fkey', 'FOREIGN KEY (product_id) REFERENCES products(id) ON DELETE CASCADE'),
+    ('movements', 'movements_warehouse_id_fkey', 'FOREIGN KEY (warehouse_id) REFERENCES warehouses(id) ON DELETE SET NULL'),
+    ('movements', 'movements_product_id_fkey', 'FOREIGN KEY (product_id) REFERENCES products(id) ON DELETE SET NULL'),
+]
+
+# Слияние промежуточной таблицы поступлений с inventory одним оператором.
+# Склады блокируются по возрастанию id (как в add_stock_safe — склад раньше остатков).
+# Вместимость проверяется нарастающим итогом в порядке seq: на каждый склад
+# принимается самый длинный префикс поступлений, который помещается.
+MERGE_STOCK_SQL = """
+    WITH locked AS (
+        SELECT w.id, w.capacity, w.used_volume
+        FROM warehouses w
+        WHERE w.id IN (SELECT DISTINCT warehouse_id FROM stock_staging)
+        ORDER BY w.id
+        FOR NO KEY UPDATE
+    ),
+    validated AS (
+        SELECT s.seq, s.warehouse_id, s.product_id, s.quantity,
+               l.capacity, l.used_volume, p.unit_volume,
+               CASE
+                   WHEN s.quantity <= 0 THEN 'Quantity must be positive'
+                   WHEN p.id IS NULL THEN 'Product does not exist'
+                   WHEN l.id IS NULL THEN 'Warehouse does not exist'
+               END AS reason
+        FROM stock_staging s
+        LEFT JOIN products p ON p.id = s.product_id
+        LEFT JOIN locked l ON l.id = s.warehouse_id
+    ),
+    checked AS (
+        SELECT v.*,
+               COALESCE(v.reason, CASE
+                   WHEN v.used_volume + SUM(CASE WHEN v.reason IS NULL THEN v.quantity * v.unit_volume ELSE 0 END)
+                        OVER (PARTITION BY v.warehouse_id ORDER BY v.seq) > v.capacity
+                   THEN 'Not enough capacity'
+               END) AS reject_reason
+        FROM validated v
+    ),
+    accepted AS (
+        SELECT warehouse_id, product_id, SUM(quantity) AS quantity
+        FROM checked
+        WHERE reject_reason IS NULL
+        GROUP BY warehouse_id, product_id
+    ),
+    topped_up AS (
+        UPDATE inventory i SET quantity = i.quantity + a.quantity
+        FROM accepted a
+        WHERE i.warehouse_id = a.warehouse_id AND i.product_id = a.product_id
+    ),
+    inserted AS (
+        INSERT INTO inventory (warehouse_id, product_id, quantity)
+        SELECT a.warehouse_id, a.product_id, a.quantity
+        FROM accepted a
+        WHERE NOT EXISTS (
+            SELECT 1 FROM inventory i
+            WHERE i.warehouse_id = a.warehouse_id AND i.product_id = a.product_id
+        )
+        -- строку мог вставить параллельный add_stock_safe или загрузчик уже после
+        -- снимка оператора (пока ждали блокировку склада): тогда добавляем к ней
+        ON CONFLICT (warehouse_id, product_id)
+        DO UPDATE SET quantity = inventory.quantity + EXCLUDED.quantity
+    ),
+    logged AS (
+        INSERT INTO movements (warehouse_id, product_id, quantity_change, reason)
+        SELECT warehouse_id, product_id, quantity, 'bulk_load' FROM accepted
+    )
+    SELECT warehouse_id, product_id, quantity, reject_reason
+    FROM checked
+    WHERE reject_reason IS NOT NULL
+    ORDER BY seq
+"""
+
+
+def bulk_load_stock(cur, stock, defer_fk=False):
+    """Загружает поступления (warehouse_id, product_id, qty) через COPY и одно слияние.
+
+    Проверки те же, что в add_stock_safe. Возвращает список отклонённых строк
+    (warehouse_id, product_id, qty, причина). Фиксация — на вызывающей стороне.
+
+    defer_fk=True — режим первичного наполнения: внешние ключи inventory и
+    movements пересоздаются после слияния. Берёт эксклюзивную блокировку
+    таблиц, поэтому не годится при параллельной работе с остатками.
+    """
+    cur.execute("""
+        CREATE TEMP TABLE stock_staging (
+            seq BIGINT NOT NULL,
+            warehouse_id INT NOT NULL,
+            product_id INT NOT NULL,
+            quantity INT NOT NULL
+        )
+    """)
+    copy_rows(cur, 'stock_staging', ('seq', 'warehouse_id', 'product_id', 'quantity'),
+              ((seq,) + tuple(row) for seq, row in enumerate(stock)))
+    cur.execute("ANALYZE stock_staging")
+    if defer_fk:
+        for table, name, _ in BULK_FOREIGN_KEYS:
+            cur.execute(f"ALTER TABLE {table} DROP CONSTRAINT {name}")
+    cur.execute(MERGE_STOCK_SQL)
+    rejected = cur.fetchall()
+    if defer_fk:
+        for table, name, definition in BULK_FOREIGN_KEYS:
+            cur.execute(f"ALTER TABLE {table} ADD CONSTRAINT {name} {definition}")
+    cur.execute("DROP TABLE stock_staging")
+    return rejected
+
+
+def bench_order_totals(conn, orders=20, lines=60):
+    """Сравнивает построчный и операторный триггеры пересчёта total_amount.
+
+    Пересоздаёт схему, затем для каждого варианта вставляет orders заказов
+    по lines позиций (одним INSERT на заказ), проверяет суммы и откатывает
+    транзакцию. Возвращает словарь {вариант: секунды}.
+    """
+    cur = conn.cursor()
+    cur.execute(SCHEMA_SQL)
+    cur.execute("""
+        INSERT INTO products (name, price, unit_volume)
+        SELECT 'Bench_' || g, round((random() * 495 + 5)::numeric, 2), 1
+        FROM generate_series(1, %s) g
+    """, (lines,))
+    cur.execute("INSERT INTO customers (name) VALUES ('Bench') RETURNING id")
+    customer_id = cur.fetchone()[0]
+    conn.commit()
+
+    timings = {}
+    for variant in ('row', 'statement'):
+        if variant == 'row':
+            cur.execute(LEGACY_ORDER_TOTAL_SQL)
+        started = time.perf_counter()
+        for _ in range(orders):
+            cur.execute("INSERT INTO orders (customer_id, status) VALUES (%s,'new') RETURNING id", (customer_id,))
+            oid = cur.fetchone()[0]
+            cur.execute("""
+                INSERT INTO order_items (order_id, product_id, quantity)
+                SELECT %s, id, 1 + id %% 5 FROM products
+            """, (oid,))
+        timings[variant] = time.perf_counter() - started
+
+        cur.execute("""
+            SELECT COUNT(*) FROM orders o
+            WHERE o.total_amount <> (
+                SELECT COALESCE(SUM(oi.quantity * p.price), 0)
+                FROM order_items oi JOIN products p ON p.id = oi.product_id
+                WHERE oi.order_id = o.id
+            )
         """)
+        wrong = cur.fetchone()[0]
+        conn.rollback()
+        if wrong:
+            raise RuntimeError(f"{variant}-level trigger produced {wrong} wrong totals")
+
+    cur.close()
+    return timings
+
+
+def maintain_movements(conn, months_ahead=2):
+    """Плановое обслуживание журнала: секции на months_ahead месяцев вперёд
+    и дневные снимки остатков за все завершённые дни. Запускать раз в сутки."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT ensure_movement_partitions(current_date, %s)", (months_ahead,))
+        partitions = cur.fetchone()[0]
+        cur.execute("SELECT take_stock_snapshots()")
+        snapshots = cur.fetchone()[0]
+    conn.commit()
+    return partitions, snapshots
+
+
+def refresh_summaries(conn, rebuild=False):
+    """Пересчитывает в сводках для дашбордов строки, изменённые с прошлого запуска
+    (rebuild=True — пересчёт с нуля). Возвращает число обновлённых строк
+    (остатки, заказы)."""
+    with conn.cursor() as cur:
+        if rebuild:
+            cur.execute("SELECT rebuild_summaries()")
+        cur.execute("SELECT stock_rows, order_rows FROM refresh_summaries()")
+        counts = cur.fetchone()
+    conn.commit()
+    return counts
+
+
+def iter_stock_summary(cur, page_size=1000):
+    """Строки отчёта об остатках (id склада, склад, товар, количество) из сводки
+    в порядке (склад, товар). Читается страницами по первичному ключу."""
+    last = (0, 0)
+    while True:
+        cur.execute("""
+            SELECT warehouse_id, product_id, warehouse_name, product_name, quantity
+            FROM stock_summary
+            WHERE (warehouse_id, product_id) > (%s, %s)
+            ORDER BY warehouse_id, product_id
+            LIMIT %s
+        """, (last[0], last[1], page_size))
+        rows = cur.fetchall()
+        for wh_id, _, wh_name, product_name, quantity in rows:
+            yield wh_id, wh_name, product_name, quantity
+        if len(rows) < page_size:
+            return
+        last = rows[-1][:2]
+
+
+def iter_order_summary(cur, page_size=1000):
+    """Строки отчёта о заказах (id, клиент, статус, склад, сумма) из сводки
+    в порядке id. Читается страницами по первичному ключу."""
+    last_id = 0
+    while True:
+        cur.execute("""
+            SELECT order_id, customer_name, status, allocated_warehouse_id, total_amount
+            FROM order_summary
+            WHERE order_id > %s
+            ORDER BY order_id
+            LIMIT %s
+        """, (last_id, page_size))
+        rows = cur.fetchall()
+        yield from rows
+        if len(rows) < page_size:
+            return
+        last_id = rows[-1][0]
+
+
+def sweep_reservations(conn, batch_size=1000):
+    """Снимает все просроченные брони пачками по batch_size заказов, каждая
+    пачка — отдельная короткая транзакция. Возвращает число отменённых заказов."""
+    def expire(cur):
+        cur.execute("SELECT expire_reservations(%s)", (batch_size,))
+        return cur.fetchone()[0]
+
+    total = 0
+    while True:
+        expired = run_in_transaction(conn, expire)
+        total += expired
+        if expired < batch_size:
+            return total
+
+
+def _plan_nodes(node):
+    yield node
+    for child in node.get('Plans', []):
+        yield from _plan_nodes(child)
+
+
+def check_allocation_plan(cur, order_id):
+    """Проверяет план allocation_candidates(order_id) через EXPLAIN ANALYZE.
+
+    Поиск не должен сканировать inventory целиком и должен прочитать
+    не больше строк inventory, чем (товаров в заказе) x (складов).
+    Возвращает (прочитано строк inventory, список проблем).
+    """
+    cur.execute("EXPLAIN (ANALYZE, FORMAT JSON) SELECT * FROM allocation_candidates(%s)", (order_id,))
+    plan = cur.fetchone()[0][0]['Plan']
+    cur.execute("SELECT COUNT(DISTINCT product_id) FROM order_items WHERE order_id = %s", (order_id,))
+    items = cur.fetchone()[0]
+    cur.execute("SELECT COUNT(*) FROM warehouses")
+    warehouses = cur.fetchone()[0]
+
+    problems = []
+    inventory_rows = 0
+    for node in _plan_nodes(plan):
+        if node.get('Relation Name') != 'inventory':
+            continue
+        if node['Node Type'] == 'Seq Scan':
+            problems.append(f"order {order_id}: sequential scan on inventory")
+        inventory_rows += node['Actual Rows'] * node['Actual Loops']
+    if inventory_rows > items * warehouses:
+        problems.append(f"order {order_id}: read {inventory_rows} inventory rows, "
+                        f"expected at most {items * warehouses}")
+    return inventory_rows, problems
+
+
+def explain_allocation(conn, warehouses=100, skus=10000, orders=20, items=4):
+    """Регрессионная проверка поиска складов на inventory из warehouses x skus строк.
+
+    Пересоздаёт схему, наполняет её через COPY, создаёт orders заказов и
+    проверяет план каждого (check_allocation_plan). Возвращает список проблем.
+    """
+    rnd = random.Random(7)
+    cur = conn.cursor()
+    cur.execute(SCHEMA_SQL)
+    wh_ids = bulk_insert(cur, 'warehouses', ('name', 'city', 'capacity'),
+                         [(f'WH_{i}', 'Explain', 10 ** 9) for i in range(warehouses)])
+    product_ids = bulk_insert(cur, 'products', ('name', 'price', 'unit_volume'),
+                              [(f'SKU_{i}', 10, 1) for i in range(skus)])
+    customer_id = bulk_insert(cur, 'customers', ('name',), [('Explain',)])[0]
+    conn.commit()
+    bulk_load_stock(cur, ((wh, pid, rnd.randint(1, 20)) for wh in wh_ids for pid in product_ids),
+                    defer_fk=True)
+    conn.commit()
+
+    order_ids = []
+    for _ in range(orders):
+        cur.execute("INSERT INTO orders (customer_id, status) VALUES (%s,'new') RETURNING id", (customer_id,))
+        oid = cur.fetchone()[0]
+        cur.execute("""
+            INSERT INTO order_items (order_id, product_id, quantity)
+            SELECT %s, unnest(%s::int[]), 5
+        """, (oid, rnd.sample(product_ids, items)))
+        order_ids.append(oid)
+    conn.commit()
+    cur.execute("ANALYZE")
+    conn.commit()
+
+    problems = []
+    rows_read = [0]
+    for oid in order_ids:
+        rows, order_problems = check_allocation_plan(cur, oid)
+        rows_read.append(rows)
+        problems.extend(order_problems)
+    conn.rollback()
+
+    started = time.perf_counter()
+    for _ in allocate_pending_orders(conn, batch_size=1):
+        pass
+    per_order = (time.perf_counter() - started) / max(orders, 1)
+    print(f"{warehouses * skus} inventory rows: candidate search read at most {max(rows_read)} rows, "
+          f"allocation {per_order * 1000:.2f} ms/order")
+    cur.close()
+    return problems
+
+
+def main():
+    conn = get_connection()
+    try:
+        cur = conn.cursor()
+
+        # --- 1) Создаем схему, функции и триггер ---
+        cur.execute(SCHEMA_SQL)
 
         conn.commit()
         print("Schema, functions and triggers created successfully.")
 
-        # --- 2) Начальные данные ---
-        # Склады
-        cur.execute("INSERT INTO warehouses (name, city, capacity) VALUES (%s,%s,%s) RETURNING id", ('WH_A','Almaty',5000))
-        wh1 = cur.fetchone()[0]
-        cur.execute("INSERT INTO warehouses (name, city, capacity) VALUES (%s,%s,%s) RETURNING id", ('WH_B','Astana',4000))
-        wh2 = cur.fetchone()[0]
-        cur.execute("INSERT INTO warehouses (name, city, capacity) VALUES (%s,%s,%s) RETURNING id", ('WH_C','Shymkent',6000))
-        wh3 = cur.fetchone()[0]
-        warehouses = [wh1, wh2, wh3]
+        # --- 2) Начальные данные (через COPY) ---
+        warehouses = bulk_insert(cur, 'warehouses', ('name', 'city', 'capacity'), [
+            ('WH_A', 'Almaty', 5000),
+            ('WH_B', 'Astana', 4000),
+            ('WH_C', 'Shymkent', 6000),
+        ])
 
         # Товары
-        products = []
+        product_rows = []
         for i in range(1, 11):
             name = f'Product_{i}'
             price = round(random.uniform(5,500),2)
             unit_volume = round(random.uniform(1,20),2)
-            cur.execute("INSERT INTO products (name, price, unit_volume) VALUES (%s,%s,%s) RETURNING id", (name, price, unit_volume))
-            pid = cur.fetchone()[0]
-            products.append((pid, name, price, unit_volume))
+            product_rows.append((name, price, unit_volume))
+        product_ids = bulk_insert(cur, 'products', ('name', 'price', 'unit_volume'), product_rows)
+        products = [(pid,) + row for pid, row in zip(product_ids, product_rows)]
 
         # Клиенты
-        clients = []
-        for name in ['Alice','Bob','Charlie','Diana']:
-            cur.execute("INSERT INTO customers (name) VALUES (%s) RETURNING id", (name,))
-            clients.append(cur.fetchone()[0])
+        clients = bulk_insert(cur, 'customers', ('name',), [(name,) for name in ['Alice','Bob','Charlie','Diana']])
 
         conn.commit()
         print("Initial warehouses, products, and clients inserted.")
 
-        # --- 3) Распределяем начальные запасы ---
-        for wh_id in warehouses:
-            for pid, _, _, _ in products:
-                qty = random.randint(5,20)
-                try:
-                    cur.execute("SELECT add_stock_safe(%s,%s,%s)", (wh_id, pid, qty))
-                    conn.commit()
-                except DatabaseError as e:
-                    conn.rollback()
-                    print(f"add_stock_safe failed for wh={wh_id} pid={pid} qty={qty}: {e}")
+        # --- 3) Распределяем начальные запасы одним слиянием ---
+        stock = [(wh_id, pid, random.randint(5,20)) for wh_id in warehouses for pid, _, _, _ in products]
+        rejected = bulk_load_stock(cur, stock)
+        conn.commit()
+        for wh_id, pid, qty, reason in rejected:
+            print(f"Bulk stock rejected for wh={wh_id} pid={pid} qty={qty}: {reason}")
 
         # --- 4) Тест переполнения ---
         pid_test = products[0][0]
@@ -266,7 +1520,6 @@ def main():
             print("Expected error on overfill:", e)
 
         # --- 5) Создаем случайные заказы ---
-        order_ids = []
         for _ in range(10):
             client_id = random.choice(clients)
             cur.execute("INSERT INTO orders (customer_id, status) VALUES (%s,'new') RETURNING id", (client_id,))
@@ -276,49 +1529,139 @@ def main():
             for pid, _, _, _ in chosen:
                 qty = random.randint(1,5)
                 cur.execute("INSERT INTO order_items (order_id, product_id, quantity) VALUES (%s,%s,%s)", (oid, pid, qty))
-            order_ids.append(oid)
         conn.commit()
 
-        # --- 6) Обрабатываем заказы ---
-        for oid in order_ids:
-            try:
-                cur.execute("SELECT allocate_order(%s);", (oid,))
-                conn.commit()
-                cur.execute("SELECT allocated_warehouse_id, status FROM orders WHERE id=%s", (oid,))
-                row = cur.fetchone()
-                print(f"Order {oid} allocated to warehouse {row[0]}")
-            except DatabaseError as e:
-                conn.rollback()
-                cur.execute("SELECT allocated_warehouse_id, status FROM orders WHERE id=%s", (oid,))
-                row = cur.fetchone()
-                print(f"Order {oid} failed: {e} (status now {row[1]})")
-
-        # --- 7) Итоговые остатки ---
+        # --- 6) Обрабатываем заказы пачками ---
+        for oid, wh_id, error in allocate_pending_orders(conn):
+            if error is None:
+                print(f"Order {oid} allocated to warehouse {wh_id}")
+            else:
+                print(f"Order {oid} failed: {error} (status now cancelled)")
+
+        # --- 7) Итоговые остатки (из сводок, без соединения с inventory и orders) ---
+        refresh_summaries(conn)
         print("\n--- Final stock per warehouse ---")
-        cur.execute("""
-            SELECT w.id, w.name, p.name, i.quantity
-            FROM warehouses w
-            JOIN inventory i ON i.warehouse_id=w.id
-            JOIN products p ON p.id=i.product_id
-            ORDER BY w.id, p.id
-        """)
-        for r in cur.fetchall():
+        for r in iter_stock_summary(cur):
             print(r)
 
         print("\n--- Orders summary ---")
-        cur.execute("""
-            SELECT o.id, c.name, o.status, o.allocated_warehouse_id, o.total_amount
-            FROM orders o
-            LEFT JOIN customers c ON c.id=o.customer_id
-            ORDER BY o.id
-        """)
-        for r in cur.fetchall():
+        for r in iter_order_summary(cur):
             print(r)
 
+        print("\n--- Capacity counter audit ---")
+        cur.execute("SELECT wh_id, counter_volume, actual_volume FROM audit_used_volume()")
+        mismatches = cur.fetchall()
+        if not mismatches:
+            print("used_volume is consistent with inventory.")
+        for r in mismatches:
+            print(f"Warehouse {r[0]}: counter={r[1]} actual={r[2]}")
+
         cur.close()
 
     finally:
-        conn.close()
+        release(conn)
+
+def run_bench_totals(orders, lines):
+    conn = get_connection()
+    try:
+        timings = bench_order_totals(conn, orders, lines)
+    finally:
+        release(conn)
+    print(f"{orders} orders x {lines} lines:")
+    for variant, seconds in timings.items():
+        print(f"  {variant:<9} trigger: {seconds:.3f}s")
+    print(f"  speedup: {timings['row'] / timings['statement']:.1f}x")
+
+
+def run_explain_allocation(warehouses, skus, orders):
+    conn = get_connection()
+    try:
+        problems = explain_allocation(conn, warehouses, skus, orders)
+    finally:
+        release(conn)
+    if problems:
+        print("FAILED:")
+        for p in problems:
+            print("  " + p)
+        sys.exit(1)
+    print("OK: candidate search is index-driven.")
+
+
+def run_maintenance():
+    conn = get_connection()
+    try:
+        partitions, snapshots = maintain_movements(conn)
+    finally:
+        release(conn)
+    print(f"Created {partitions} movement partitions, wrote {snapshots} snapshot rows.")
+
+
+def run_reservation_sweeper(interval, batch_size):
+    """Фоновая очистка просроченных броней: раз в interval секунд (0 — один запуск)."""
+    conn = get_connection()
+    try:
+        while True:
+            expired = sweep_reservations(conn, batch_size)
+            print(f"Expired reservations of {expired} orders.")
+            if not interval:
+                break
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        release(conn)
+
+
+def run_summary_refresh(interval, rebuild):
+    """Фоновое обновление сводок: раз в interval секунд (0 — один запуск)."""
+    conn = get_connection()
+    try:
+        while True:
+            stock_rows, order_rows = refresh_summaries(conn, rebuild)
+            rebuild = False
+            print(f"Refreshed {stock_rows} stock and {order_rows} order summary rows.")
+            if not interval:
+                break
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        release(conn)
+
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description="Smart warehouse simulator")
+    parser.add_argument('--bench-totals', action='store_true',
+                        help="benchmark order total triggers (recreates the schema)")
+    parser.add_argument('--explain-alloc', action='store_true',
+                        help="check allocation plans on a large inventory (recreates the schema)")
+    parser.add_argument('--maintain', action='store_true',
+                        help="create upcoming movement partitions and daily stock snapshots")
+    parser.add_argument('--refresh-summaries', action='store_true',
+                        help="fold pending changes into the dashboard summary tables")
+    parser.add_argument('--sweep-reservations', action='store_true',
+                        help="release expired stock reservations and cancel their orders")
+    parser.add_argument('--interval', type=float, default=0,
+                        help="with --refresh-summaries/--sweep-reservations: repeat every N seconds")
+    parser.add_argument('--batch-size', type=int, default=1000,
+                        help="with --sweep-reservations: orders per transaction")
+    parser.add_argument('--rebuild', action='store_true',
+                        help="with --refresh-summaries: recompute summaries from scratch first")
+    parser.add_argument('--orders', type=int, default=20)
+    parser.add_argument('--lines', type=int, default=60)
+    parser.add_argument('--warehouses', type=int, default=100)
+    parser.add_argument('--skus', type=int, default=10000)
+    args = parser.parse_args()
+
+    if args.bench_totals:
+        run_bench_totals(args.orders, args.lines)
+    elif args.explain_alloc:
+        run_explain_allocation(args.warehouses, args.skus, args.orders)
+    elif args.maintain:
+        run_maintenance()
+    elif args.sweep_reservations:
+        run_reservation_sweeper(args.interval, args.batch_size)
+    elif args.refresh_summaries:
+        run_summary_refresh(args.interval, args.rebuild)
+    else:
+        main()
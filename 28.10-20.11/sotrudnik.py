@@ -1,61 +1,116 @@
-import psycopg2
+import os
+import sys
 
-connection = psycopg2.connect(
-    host="localhost",
-    port="5432",
-    database="my_python_app",
-    user="postgres",
-    password="khadimov"  # замените своим
-)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from schema_migrations import migrate
+from db_pool import execute_prepared_many, get_connection, release
 
-cursor = connection.cursor()
-
-# Создаем таблицы
-cursor.execute("""
-    CREATE TABLE IF NOT EXISTS employees_office1 (
+# Общая таблица сотрудников всех офисов. Новый офис — это новое
+# значение office, а не новая таблица.
+# position_norm — должность без учёта регистра и лишних пробелов
+# ("  senior  Developer" и "Senior Developer" совпадают); по ней и сравниваем.
+# Схема по версиям (schema_migrations): применяются только недостающие миграции
+MIGRATIONS = [
+    """
+    CREATE TABLE IF NOT EXISTS office_employees (
         id SERIAL PRIMARY KEY,
+        office TEXT NOT NULL,
         name TEXT,
-        position TEXT
+        position TEXT,
+        position_norm TEXT GENERATED ALWAYS AS (
+            lower(btrim(regexp_replace(position, '\\s+', ' ', 'g')))
+        ) STORED
     );
-""")
 
-cursor.execute("""
-    CREATE TABLE IF NOT EXISTS employees_office2 (
-        id SERIAL PRIMARY KEY,
-        name TEXT,
-        position TEXT
-    );
-""")
+    CREATE INDEX IF NOT EXISTS office_employees_position_idx
+    ON office_employees (position_norm, office) INCLUDE (name);
+    """,
+    # 2. перенос сотрудников из прежних таблиц employees_office1/employees_office2,
+    # если база создана старой версией скрипта. Строки, которые уже есть в
+    # office_employees (та же должность и имя в том же офисе), не дублируются.
+    # Старые таблицы не удаляем: их можно сверить с перенесёнными данными и
+    # убрать отдельной миграцией.
+    """
+    DO $$
+    DECLARE
+        office_name TEXT;
+    BEGIN
+        FOREACH office_name IN ARRAY ARRAY['office1', 'office2'] LOOP
+            IF to_regclass('employees_' || office_name) IS NOT NULL THEN
+                EXECUTE format(
+                    'INSERT INTO office_employees (office, name, position)
+                     SELECT %L, e.name, e.position FROM %I e
+                     WHERE NOT EXISTS (
+                         SELECT 1 FROM office_employees o
+                         WHERE o.office = %L
+                           AND o.name IS NOT DISTINCT FROM e.name
+                           AND o.position IS NOT DISTINCT FROM e.position
+                     )
+                     ORDER BY e.id',
+                    office_name, 'employees_' || office_name, office_name);
+            END IF;
+        END LOOP;
+    END $$;
+    """,
+]
+
+
+def seed(cursor):
+    # Вставляем данные офисов — только в пустую базу: migrate вызывает seed
+    # после миграций, и перенесённые из старых таблиц строки его отменяют
+    execute_prepared_many(cursor, 'insert_office_employee',
+                          "INSERT INTO office_employees (office, name, position) VALUES ($1, $2, $3)", [
+                              ('office1', 'Alice', 'Manager'),
+                              ('office1', 'Bob', 'Developer'),
+                              ('office1', 'Charlie', 'Designer'),
+                              ('office2', 'David', 'Developer'),
+                              ('office2', 'Eva', 'Manager'),
+                              ('office2', 'Frank', 'Tester'),
+                          ])
+
+
+connection = get_connection()
+migrate(connection, 'sotrudnik', MIGRATIONS, seed=seed, seed_table='office_employees')
+
+cursor = connection.cursor()
 
-# Очищаем таблицы перед вставкой, чтобы не дублировать данные
-cursor.execute("DELETE FROM employees_office1;")
-cursor.execute("DELETE FROM employees_office2;")
 
-# Вставляем данные в офис 1
-cursor.execute("INSERT INTO employees_office1 (name, position) VALUES (%s, %s)", ('Alice', 'Manager'))
-cursor.execute("INSERT INTO employees_office1 (name, position) VALUES (%s, %s)", ('Bob', 'Developer'))
-cursor.execute("INSERT INTO employees_office1 (name, position) VALUES (%s, %s)", ('Charlie', 'Designer'))
+def match_positions(cursor, offices, min_offices=2):
+    """Должности, которые есть хотя бы в min_offices офисах из offices.
 
-# Вставляем данные в офис 2
-cursor.execute("INSERT INTO employees_office2 (name, position) VALUES (%s, %s)", ('David', 'Developer'))
-cursor.execute("INSERT INTO employees_office2 (name, position) VALUES (%s, %s)", ('Eva', 'Manager'))
-cursor.execute("INSERT INTO employees_office2 (name, position) VALUES (%s, %s)", ('Frank', 'Tester'))
+    Вместо попарного JOIN сотрудников (1000 разработчиков в двух офисах —
+    миллион строк) возвращается по строке на должность и офис:
+    [(должность, [(офис, число сотрудников, [имена]), ...]), ...].
+    """
+    cursor.execute("""
+        SELECT position_norm, office, employees, names
+        FROM (
+            SELECT position_norm, office,
+                   COUNT(*) AS employees,
+                   array_agg(name ORDER BY name) AS names,
+                   COUNT(*) OVER (PARTITION BY position_norm) AS offices
+            FROM office_employees
+            WHERE office = ANY(%s) AND position_norm IS NOT NULL
+            GROUP BY position_norm, office
+        ) g
+        WHERE offices >= %s
+        ORDER BY position_norm, office;
+    """, (list(offices), min_offices))
 
-connection.commit()
+    matches = []
+    for position, office, employees, names in cursor.fetchall():
+        if not matches or matches[-1][0] != position:
+            matches.append((position, []))
+        matches[-1][1].append((office, employees, names))
+    return matches
 
-# Выполняем запрос: сотрудники с одинаковыми должностями в обоих офисах
-cursor.execute("""
-    SELECT o1.name, o1.position
-    FROM employees_office1 o1
-    JOIN employees_office2 o2
-    ON o1.position = o2.position;
-""")
 
-rows = cursor.fetchall()
+# Сотрудники с одинаковыми должностями в обоих офисах — по группам
+matches = match_positions(cursor, ['office1', 'office2'])
 
-print("Сотрудники с одинаковыми должностями в двух офисах:")
-for row in rows:
-    print(row)
+print("Одинаковые должности в двух офисах:")
+for position, by_office in matches:
+    print(position, by_office)
 
 cursor.close()
-connection.close()
+release(connection)
@@ -1,56 +1,244 @@
 # update_account_balances_full.py
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+
 import psycopg2
 from psycopg2 import sql
 
-DSN = {
-    'host': 'localhost',
-    'port': 5432,
-    'database': 'my_python_app',  # твоя база
-    'user': 'postgres',
-    'password': 'khadimov'
-}
+from db_pool import connection, get_connection, release
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from schema_migrations import migrate
+
+
+# Схема по версиям (schema_migrations): при запуске применяются только недостающие
+MIGRATIONS = [
+    # 1. счета и транзакции
+    """
+    CREATE TABLE IF NOT EXISTS accounts (
+        id SERIAL PRIMARY KEY,
+        balance NUMERIC DEFAULT 0
+    );
+    CREATE TABLE IF NOT EXISTS transactions (
+        id SERIAL PRIMARY KEY,
+        acc_id INT REFERENCES accounts(id) ON DELETE CASCADE,
+        amount NUMERIC NOT NULL
+    );
+    """,
+    # 2. флаг проведения. Строки, записанные старой версией скрипта, уже прибавлены
+    # к балансам, поэтому считаем их проведёнными, а новые строки — нет.
+    # Непроведённых строк мало, поэтому частичные индексы маленькие.
+    """
+    ALTER TABLE transactions ADD COLUMN IF NOT EXISTS posted BOOLEAN NOT NULL DEFAULT true;
+    ALTER TABLE transactions ALTER COLUMN posted SET DEFAULT false;
+    CREATE INDEX IF NOT EXISTS transactions_unposted_idx
+    ON transactions (id) WHERE NOT posted;
+    CREATE INDEX IF NOT EXISTS transactions_unposted_acc_idx
+    ON transactions (acc_id, id) WHERE NOT posted;
+    """,
+    # 3. журнал параллельных проводок по диапазонам счетов (post_sharded)
+    """
+    CREATE TABLE IF NOT EXISTS balance_post_runs (
+        id SERIAL PRIMARY KEY,
+        started_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+        finished_at TIMESTAMPTZ,
+        max_tx_id INT NOT NULL,
+        shard_size INT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS balance_post_shards (
+        run_id INT NOT NULL REFERENCES balance_post_runs(id) ON DELETE CASCADE,
+        lo INT NOT NULL,
+        hi INT NOT NULL,
+        posted INT,
+        done_at TIMESTAMPTZ,
+        PRIMARY KEY (run_id, lo)
+    );
+    """,
+]
+
+
+def seed(cur):
+    # тестовые данные — только в пустую базу
+    cur.execute("INSERT INTO accounts (balance) VALUES (100), (200), (300) RETURNING id;")
+    acc_ids = [r[0] for r in cur.fetchall()]
+    cur.execute("""
+        INSERT INTO transactions (acc_id, amount)
+        SELECT (%s::int[])[t.acc_no], t.amount
+        FROM (VALUES (1, 50), (1, 25), (2, 100), (3, 75), (3, 25)) AS t(acc_no, amount);
+    """, (acc_ids,))
+
 
 def setup_tables(conn):
-    with conn.cursor() as cur:
-        # создаём таблицу accounts, если нет
-        cur.execute("""
-        CREATE TABLE IF NOT EXISTS accounts (
-            id SERIAL PRIMARY KEY,
-            balance NUMERIC DEFAULT 0
-        );
-        """)
-        # создаём таблицу transactions, если нет
-        cur.execute("""
-        CREATE TABLE IF NOT EXISTS transactions (
-            id SERIAL PRIMARY KEY,
-            acc_id INT REFERENCES accounts(id) ON DELETE CASCADE,
-            amount NUMERIC NOT NULL
-        );
-        """)
-        # добавим тестовые данные, если таблицы пустые
-        cur.execute("SELECT COUNT(*) FROM accounts;")
-        if cur.fetchone()[0] == 0:
-            cur.execute("INSERT INTO accounts (balance) VALUES (100), (200), (300);")
-        cur.execute("SELECT COUNT(*) FROM transactions;")
-        if cur.fetchone()[0] == 0:
-            cur.execute("INSERT INTO transactions (acc_id, amount) VALUES (1,50),(1,25),(2,100),(3,75),(3,25);")
-    conn.commit()
+    migrate(conn, 'update_account_balances', MIGRATIONS, seed=seed, seed_table='accounts')
     print("Tables and test data ready.")
 
-def update_balances(conn):
-    with conn.cursor() as cur:
-        cur.execute("""
+# Проводит одну пачку: помечает транзакции проведёнными и прибавляет их суммы
+# к балансам в одной транзакции БД, поэтому повторный запуск ничего не удвоит.
+# SKIP LOCKED позволяет запускать несколько проводок параллельно, а счета
+# блокируются по возрастанию id, чтобы они не ждали друг друга по кругу.
+_POST_SQL = """
+    WITH marked AS ({marked}),
+    locked AS (
+        SELECT id FROM accounts
+        WHERE id IN (SELECT acc_id FROM marked)
+        ORDER BY id
+        FOR NO KEY UPDATE
+    ),
+    applied AS (
         UPDATE accounts a
-        SET balance = a.balance + t.total_amount
+        SET balance = a.balance + s.total_amount
         FROM (
             SELECT acc_id, SUM(amount) AS total_amount
-            FROM transactions
+            FROM marked
             GROUP BY acc_id
-        ) t
-        WHERE a.id = t.acc_id;
-        """)
+        ) s
+        WHERE a.id = s.acc_id AND a.id IN (SELECT id FROM locked)
+        RETURNING a.id
+    ){extra}
+    SELECT (SELECT COUNT(*) FROM marked), (SELECT COUNT(*) FROM applied)
+"""
+
+POST_BATCH_SQL = _POST_SQL.format(marked="""
+        UPDATE transactions t SET posted = true
+        FROM (
+            SELECT id FROM transactions
+            WHERE NOT posted
+            ORDER BY id
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        ) b
+        WHERE t.id = b.id
+        RETURNING t.acc_id, t.amount
+    """, extra="")
+
+# Шард — все непроведённые транзакции счетов [lo, hi) не новее max_tx_id.
+# Шард проводится пачками, как в POST_BATCH_SQL: транзакции и блокировки
+# не растут с размером шарда, а строки, занятые параллельным update_balances,
+# пропускаются. Счётчик шарда увеличивается вместе с каждой пачкой; неполная
+# пачка значит, что шард исчерпан, и он отмечается завершённым в той же
+# транзакции, поэтому после сбоя повторный запуск продолжит с непроведённых строк.
+POST_SHARD_SQL = _POST_SQL.format(marked="""
+        UPDATE transactions t SET posted = true
+        FROM (
+            SELECT id FROM transactions
+            WHERE NOT posted AND acc_id >= %(lo)s AND acc_id < %(hi)s AND id <= %(max_tx_id)s
+            ORDER BY acc_id, id
+            LIMIT %(batch_size)s
+            FOR UPDATE SKIP LOCKED
+        ) b
+        WHERE t.id = b.id
+        RETURNING t.acc_id, t.amount
+    """, extra=""",
+    done AS (
+        UPDATE balance_post_shards
+        SET posted = COALESCE(posted, 0) + (SELECT COUNT(*) FROM marked),
+            done_at = CASE WHEN (SELECT COUNT(*) FROM marked) < %(batch_size)s THEN now() END
+        WHERE run_id = %(run_id)s AND lo = %(lo)s
+    )""")
+
+def update_balances(conn, batch_size=1000):
+    """Проводит все новые транзакции пачками по batch_size, каждая пачка — свой commit.
+
+    Читаются только непроведённые строки (частичный индекс), поэтому время
+    работы зависит от числа новых транзакций, а не от всей истории.
+    """
+    posted = accounts = 0
+    with conn.cursor() as cur:
+        while True:
+            cur.execute(POST_BATCH_SQL, (batch_size,))
+            batch_posted, batch_accounts = cur.fetchone()
+            conn.commit()
+            if not batch_posted:
+                break
+            posted += batch_posted
+            accounts += batch_accounts
+    print(f"Balances updated: {posted} transactions posted to {accounts} account updates.")
+    return posted
+
+def _post_shard(shard):
+    """Выполняется в рабочем процессе: у каждого процесса свой пул соединений."""
+    run_id, lo, hi, max_tx_id, batch_size = shard
+    params = {'run_id': run_id, 'lo': lo, 'hi': hi, 'max_tx_id': max_tx_id, 'batch_size': batch_size}
+    posted = 0
+    with connection() as conn:
+        with conn.cursor() as cur:
+            while True:
+                cur.execute(POST_SHARD_SQL, params)
+                batch_posted, _ = cur.fetchone()
+                conn.commit()
+                posted += batch_posted
+                if batch_posted < batch_size:
+                    break
+    return lo, hi, posted
+
+
+def _open_run(conn, shard_size, resume):
+    """Возвращает (run_id, max_tx_id) незавершённого запуска или создаёт новый."""
+    with conn.cursor() as cur:
+        if resume:
+            cur.execute("""
+                SELECT id, max_tx_id FROM balance_post_runs
+                WHERE finished_at IS NULL
+                ORDER BY id DESC LIMIT 1
+            """)
+            row = cur.fetchone()
+            if row:
+                print(f"Resuming run {row[0]}.")
+                return row
+        # Граница запуска: транзакции, пришедшие позже, достанутся следующему
+        cur.execute("SELECT COALESCE(MAX(id), 0) FROM transactions")
+        max_tx_id = cur.fetchone()[0]
+        cur.execute("INSERT INTO balance_post_runs (max_tx_id, shard_size) VALUES (%s, %s) RETURNING id",
+                    (max_tx_id, shard_size))
+        run_id = cur.fetchone()[0]
+        cur.execute("""
+            INSERT INTO balance_post_shards (run_id, lo, hi)
+            SELECT %(run_id)s, lo, lo + %(size)s
+            FROM (SELECT MIN(acc_id) AS lo_acc, MAX(acc_id) AS hi_acc
+                  FROM transactions WHERE NOT posted AND id <= %(max_tx_id)s) r,
+                 generate_series(r.lo_acc, r.hi_acc, %(size)s) AS lo
+        """, {'run_id': run_id, 'size': shard_size, 'max_tx_id': max_tx_id})
+    conn.commit()
+    return run_id, max_tx_id
+
+
+def post_sharded(conn, workers=4, shard_size=100_000, resume=True, batch_size=1000):
+    """Проводит новые транзакции параллельно по диапазонам acc_id.
+
+    Счета делятся на шарды по shard_size id; шарды обрабатывает пул из
+    workers процессов, внутри шарда — пачки по batch_size, каждая своим commit.
+    Прогресс пишется в balance_post_shards: после сбоя повторный запуск
+    (resume=True) продолжает тот же запуск с незавершённых шардов.
+    """
+    run_id, max_tx_id = _open_run(conn, shard_size, resume)
+    with conn.cursor() as cur:
+        cur.execute("SELECT lo, hi FROM balance_post_shards WHERE run_id = %s AND done_at IS NULL ORDER BY lo",
+                    (run_id,))
+        pending = [(run_id, lo, hi, max_tx_id, batch_size) for lo, hi in cur.fetchall()]
+        cur.execute("SELECT COUNT(*) FROM balance_post_shards WHERE run_id = %s", (run_id,))
+        total = cur.fetchone()[0]
     conn.commit()
-    print("Balances updated.")
+
+    started = time.perf_counter()
+    done = total - len(pending)
+    posted = 0
+    with multiprocessing.Pool(workers) as procs:
+        for lo, hi, shard_posted in procs.imap_unordered(_post_shard, pending):
+            done += 1
+            posted += shard_posted
+            elapsed = time.perf_counter() - started
+            print(f"[{done}/{total}] accounts {lo}..{hi - 1}: {shard_posted} transactions "
+                  f"({posted / elapsed:.0f} tx/s)")
+
+    with conn.cursor() as cur:
+        cur.execute("UPDATE balance_post_runs SET finished_at = now() WHERE id = %s", (run_id,))
+    conn.commit()
+    print(f"Run {run_id} finished: {posted} transactions posted in {time.perf_counter() - started:.1f}s.")
+    return posted
+
 
 def report_accounts(conn):
     with conn.cursor() as cur:
@@ -61,19 +249,33 @@ def report_accounts(conn):
             print(f"ID={row[0]}, Balance={row[1]}")
 
 def main():
+    parser = argparse.ArgumentParser(description="Post new transactions to account balances")
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--sharded', action='store_true',
+                        help="post in parallel by acc_id ranges (for millions of accounts)")
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--shard-size', type=int, default=100_000, help="accounts per shard")
+    parser.add_argument('--new-run', action='store_true',
+                        help="with --sharded: start a new run instead of resuming an unfinished one")
+    args = parser.parse_args()
+
     try:
-        conn = psycopg2.connect(**DSN)
+        conn = get_connection()
     except psycopg2.OperationalError as e:
         print("Connection failed:", e)
         return
 
     try:
         setup_tables(conn)
-        report_accounts(conn)
-        update_balances(conn)
-        report_accounts(conn)
+        if args.sharded:
+            post_sharded(conn, args.workers, args.shard_size, resume=not args.new_run,
+                         batch_size=args.batch_size)
+        else:
+            report_accounts(conn)
+            update_balances(conn, args.batch_size)
+            report_accounts(conn)
     finally:
-        conn.close()
+        release(conn)
 
 if __name__ == "__main__":
     main()
@@ -1,64 +1,68 @@
-import psycopg2
+import os
+import sys
 
-connection = psycopg2.connect(
-    host="localhost",
-    port="5432",
-    database="my_python_app",
-    user="postgres",
-    password="khadimov"  # замените своим
-)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from schema_migrations import migrate
+from db_pool import execute_prepared_many, get_connection, release
+from hr_analytics import fetch_columns, group_stats
 
-cursor = connection.cursor()
-
-# Создаем таблицу departments
-cursor.execute("""
+# Схема по версиям (schema_migrations): применяются только недостающие миграции
+MIGRATIONS = [
+    """
     CREATE TABLE IF NOT EXISTS departments (
         id SERIAL PRIMARY KEY,
         name TEXT
     );
-""")
 
-# Создаем таблицу employees
-cursor.execute("""
     CREATE TABLE IF NOT EXISTS employees (
         id SERIAL PRIMARY KEY,
         name TEXT,
         age INT,
         department_id INT REFERENCES departments(id)
     );
-""")
+    """,
+]
+
 
-# Чистим данные
-cursor.execute("DELETE FROM employees;")
-cursor.execute("DELETE FROM departments;")
+# Тестовые данные добавляются только в пустую базу
+def seed(cursor):
+    # Добавляем отделы
+    execute_prepared_many(cursor, 'insert_department', "INSERT INTO departments (name) VALUES ($1)",
+                          [('IT',), ('HR',), ('Finance',)])
 
-# Добавляем отделы
-cursor.execute("INSERT INTO departments (name) VALUES (%s)", ('IT',))
-cursor.execute("INSERT INTO departments (name) VALUES (%s)", ('HR',))
-cursor.execute("INSERT INTO departments (name) VALUES (%s)", ('Finance',))
+    # Добавляем сотрудников (отдел — по названию, id зависят от последовательности)
+    execute_prepared_many(cursor, 'insert_employee', """
+        INSERT INTO employees (name, age, department_id)
+        SELECT $1, $2, id FROM departments WHERE name = $3
+    """, [
+        ('Alice', 25, 'IT'),
+        ('Bob', 30, 'IT'),
+        ('Charlie', 41, 'HR'),
+        ('Diana', 29, 'HR'),
+        ('Edward', 35, 'Finance'),
+    ])
 
-# Добавляем сотрудников
-cursor.execute("INSERT INTO employees (name, age, department_id) VALUES (%s, %s, %s)", ('Alice', 25, 1))
-cursor.execute("INSERT INTO employees (name, age, department_id) VALUES (%s, %s, %s)", ('Bob', 30, 1))
-cursor.execute("INSERT INTO employees (name, age, department_id) VALUES (%s, %s, %s)", ('Charlie', 41, 2))
-cursor.execute("INSERT INTO employees (name, age, department_id) VALUES (%s, %s, %s)", ('Diana', 29, 2))
-cursor.execute("INSERT INTO employees (name, age, department_id) VALUES (%s, %s, %s)", ('Edward', 35, 3))
 
-connection.commit()
+connection = get_connection()
+migrate(connection, 'vozrast', MIGRATIONS, seed=seed, seed_table='departments')
+
+cursor = connection.cursor()
 
-# Запрос — средний возраст сотрудников по отделам
-cursor.execute("""
-    SELECT d.name AS department, AVG(e.age) AS average_age
-    FROM employees e
-    JOIN departments d ON e.department_id = d.id
-    GROUP BY d.name;
-""")
+# Возраст по отделам: столбцы выгружаются одним бинарным COPY,
+# статистика считается в NumPy (hr_analytics)
+columns = fetch_columns(cursor, """
+    SELECT department_id, age FROM employees
+    WHERE department_id IS NOT NULL AND age IS NOT NULL
+""", [('department_id', 'int4'), ('age', 'int4')])
+stats = group_stats(columns['department_id'], columns['age'], percentiles=(50, 90))
 
-rows = cursor.fetchall()
+cursor.execute("SELECT id, name FROM departments;")
+department_names = dict(cursor.fetchall())
 
-print("Средний возраст сотрудников по отделам:")
-for row in rows:
-    print(row)
+print("Возраст сотрудников по отделам (отдел, сотрудников, средний, медиана, 90-й перцентиль):")
+for row in stats:
+    print((department_names[int(row['key'])], int(row['count']),
+           round(float(row['mean']), 2), float(row['p50']), float(row['p90'])))
 
 cursor.close()
-connection.close()
+release(connection)
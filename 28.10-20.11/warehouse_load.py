@@ -0,0 +1,255 @@
+"""Нагрузочный прогон для smart_warehouse_sim.
+
+Создаёт схему симулятора в заданном масштабе, затем с заданной частотой
+создаёт заказы и распределяет их (allocate_order), параллельно пополняя
+остатки через add_stock_safe. Итог — JSON с пропускной способностью,
+перцентилями задержек, числом повторов и долей отменённых заказов,
+чтобы прогоны можно было сравнивать между изменениями схемы.
+
+Пример:
+    python warehouse_load.py --warehouses 20 --skus 5000 --customers 1000 \\
+        --rate 200 --items 4 --workers 8 --duration 60 --label baseline
+"""
+import argparse
+import json
+import queue
+import random
+import threading
+import time
+from datetime import datetime
+
+from psycopg2 import DatabaseError
+
+from db_pool import configure_pool, connection
+from smart_warehouse_sim import (
+    SCHEMA_SQL, bulk_insert, bulk_load_stock, run_in_transaction,
+)
+
+
+def setup(conn, args):
+    """Пересоздаёт схему и наполняет её через COPY. Возвращает (склады, товары, клиенты)."""
+    rnd = random.Random(args.seed)
+    cur = conn.cursor()
+    cur.execute(SCHEMA_SQL)
+
+    # Вместимость с запасом, чтобы пополнения в основном проходили
+    capacity = args.skus * args.initial_stock * 20 * 2
+    warehouses = bulk_insert(cur, 'warehouses', ('name', 'city', 'capacity'),
+                             [(f'WH_{i}', f'City_{i % 17}', capacity) for i in range(args.warehouses)])
+    products = bulk_insert(cur, 'products', ('name', 'price', 'unit_volume'),
+                           [(f'SKU_{i}', round(rnd.uniform(5, 500), 2), round(rnd.uniform(1, 20), 2))
+                            for i in range(args.skus)])
+    customers = bulk_insert(cur, 'customers', ('name',), [(f'Customer_{i}',) for i in range(args.customers)])
+    conn.commit()
+
+    stock = ((wh, pid, rnd.randint(1, args.initial_stock))
+             for wh in warehouses for pid in products)
+    rejected = bulk_load_stock(cur, stock, defer_fk=True)
+    cur.execute("ANALYZE")
+    conn.commit()
+    cur.close()
+    if rejected:
+        print(f"{len(rejected)} initial stock rows rejected")
+    return warehouses, products, customers
+
+
+class Stats:
+    """Счётчики и задержки, общие для всех рабочих потоков."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {'order': [], 'restock': []}
+        self.counters = {
+            'orders_allocated': 0,
+            'orders_cancelled': 0,
+            'restocks_applied': 0,
+            'restocks_rejected': 0,
+            'errors': 0,
+        }
+        self.retries = {kind: 0 for kind in ('serialization', 'deadlock')}
+        self.max_lag = 0.0
+
+    def record(self, op, seconds, counter):
+        with self.lock:
+            self.latencies[op].append(seconds)
+            self.counters[counter] += 1
+
+    def retry(self, kind):
+        with self.lock:
+            self.retries[kind] += 1
+
+    def lag(self, seconds):
+        with self.lock:
+            self.max_lag = max(self.max_lag, seconds)
+
+
+def place_and_allocate(conn, rnd, args, products, customers, stats):
+    items = rnd.sample(products, min(args.items, len(products)))
+
+    def create(cur):
+        cur.execute("INSERT INTO orders (customer_id, status) VALUES (%s,'new') RETURNING id",
+                    (rnd.choice(customers),))
+        oid = cur.fetchone()[0]
+        cur.execute("""
+            INSERT INTO order_items (order_id, product_id, quantity)
+            SELECT %s, unnest(%s::int[]), unnest(%s::int[])
+        """, (oid, items, [rnd.randint(1, 5) for _ in items]))
+        return oid
+
+    def allocate(cur):
+        # allocate_orders оборачивает allocate_order и отменяет заказ при ошибке
+        cur.execute("SELECT warehouse_id, error FROM allocate_orders(ARRAY[%s])", (oid,))
+        return cur.fetchone()
+
+    started = time.perf_counter()
+    oid = run_in_transaction(conn, create, on_retry=stats.retry)
+    _, error = run_in_transaction(conn, allocate, on_retry=stats.retry)
+    stats.record('order', time.perf_counter() - started,
+                 'orders_allocated' if error is None else 'orders_cancelled')
+
+
+def restock(conn, rnd, args, warehouses, products, stats):
+    wh, pid, qty = rnd.choice(warehouses), rnd.choice(products), rnd.randint(1, args.initial_stock)
+
+    def add(cur):
+        cur.execute("SELECT add_stock_safe(%s,%s,%s)", (wh, pid, qty))
+
+    started = time.perf_counter()
+    try:
+        run_in_transaction(conn, add, on_retry=stats.retry)
+        counter = 'restocks_applied'
+    except DatabaseError:
+        counter = 'restocks_rejected'
+    stats.record('restock', time.perf_counter() - started, counter)
+
+
+def worker(tasks, args, warehouses, products, customers, stats, seed):
+    rnd = random.Random(seed)
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        kind, due = task
+        stats.lag(time.perf_counter() - due)
+        try:
+            # Соединение берётся из пула на одно задание, как в сервисе
+            with connection() as conn:
+                if kind == 'order':
+                    place_and_allocate(conn, rnd, args, products, customers, stats)
+                else:
+                    restock(conn, rnd, args, warehouses, products, stats)
+        except DatabaseError as e:
+            with stats.lock:
+                stats.counters['errors'] += 1
+            print(f"{kind} failed: {e}")
+
+
+def percentiles_ms(values):
+    if not values:
+        return None
+    values = sorted(values)
+
+    def pick(q):
+        return round(values[min(len(values) - 1, int(q * len(values)))] * 1000, 3)
+
+    return {'p50': pick(0.50), 'p95': pick(0.95), 'p99': pick(0.99), 'max': round(values[-1] * 1000, 3)}
+
+
+def run(args):
+    started_at = datetime.now().isoformat(timespec='seconds')
+    configure_pool(max_connections=args.workers)
+    with connection() as conn:
+        print("Seeding...")
+        seed_started = time.perf_counter()
+        warehouses, products, customers = setup(conn, args)
+        seed_seconds = time.perf_counter() - seed_started
+        print(f"Seeded in {seed_seconds:.1f}s")
+
+    stats = Stats()
+    tasks = queue.Queue()
+    threads = [
+        threading.Thread(target=worker,
+                         args=(tasks, args, warehouses, products, customers, stats, args.seed + i))
+        for i in range(args.workers)
+    ]
+    for t in threads:
+        t.start()
+
+    # Открытая модель нагрузки: задания ставятся по расписанию независимо от того,
+    # успевают ли рабочие потоки, поэтому перегрузка видна как рост задержек.
+    rnd = random.Random(args.seed)
+    total_orders = int(args.rate * args.duration)
+    started = time.perf_counter()
+    for i in range(total_orders):
+        due = started + i / args.rate
+        pause = due - time.perf_counter()
+        if pause > 0:
+            time.sleep(pause)
+        tasks.put(('order', due))
+        if rnd.random() < args.restock_ratio:
+            tasks.put(('restock', due))
+    for _ in threads:
+        tasks.put(None)
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    counters = stats.counters
+    orders_done = counters['orders_allocated'] + counters['orders_cancelled']
+    return {
+        'label': args.label,
+        'started_at': started_at,
+        'config': {
+            'warehouses': args.warehouses,
+            'skus': args.skus,
+            'customers': args.customers,
+            'rate': args.rate,
+            'items': args.items,
+            'workers': args.workers,
+            'duration': args.duration,
+            'restock_ratio': args.restock_ratio,
+            'initial_stock': args.initial_stock,
+            'seed': args.seed,
+        },
+        'seed_seconds': round(seed_seconds, 3),
+        'elapsed_seconds': round(elapsed, 3),
+        'throughput': {
+            'orders_per_second': round(orders_done / elapsed, 2),
+            'restocks_per_second': round(len(stats.latencies['restock']) / elapsed, 2),
+        },
+        'latency_ms': {op: percentiles_ms(values) for op, values in stats.latencies.items()},
+        'max_schedule_lag_ms': round(stats.max_lag * 1000, 3),
+        'counters': counters,
+        'retries': stats.retries,
+        'cancellation_rate': round(counters['orders_cancelled'] / orders_done, 4) if orders_done else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load generator for smart_warehouse_sim (recreates the schema)")
+    parser.add_argument('--warehouses', type=int, default=10)
+    parser.add_argument('--skus', type=int, default=1000)
+    parser.add_argument('--customers', type=int, default=100)
+    parser.add_argument('--rate', type=float, default=50, help="orders per second")
+    parser.add_argument('--items', type=int, default=3, help="items per order")
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=30, help="seconds")
+    parser.add_argument('--restock-ratio', type=float, default=0.2,
+                        help="add_stock_safe calls per order")
+    parser.add_argument('--initial-stock', type=int, default=50,
+                        help="max initial units per warehouse and SKU")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--label', default='', help="free-form tag, e.g. schema revision")
+    parser.add_argument('--output', help="JSON file (default: warehouse_load_<timestamp>.json)")
+    args = parser.parse_args()
+
+    result = run(args)
+    output = args.output or f"warehouse_load_{datetime.now():%Y%m%d_%H%M%S}.json"
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, indent=2)
+    print(json.dumps(result, indent=2))
+    print(f"Results written to {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,31 +1,40 @@
 import sqlite3
+import os
+import sys
 
-# Создаём базу данных
-conn = sqlite3.connect("products.db")
-cursor = conn.cursor()
-
-# Удаляем таблицу, если уже существует
-cursor.execute("DROP TABLE IF EXISTS Products")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from schema_migrations import migrate
 
-# Создаём таблицу товаров
-cursor.execute("""
-CREATE TABLE Products (
+# Схема по версиям: при запуске применяются только недостающие миграции,
+# а не пересоздание базы при каждом запуске
+MIGRATIONS = [
+    """
+CREATE TABLE IF NOT EXISTS Products (
     id INTEGER PRIMARY KEY,
     name TEXT,
     price REAL,
     discount_price REAL
-)
-""")
-
-# Добавляем тестовые данные
-products_data = [
-    (1, "Ноутбук", 120000, 100000),
-    (2, "Телефон", 80000, 80000),
-    (3, "Наушники", 15000, 12000),
-    (4, "Монитор", 50000, 50000),
-    (5, "Мышь", 10000, 8500)
+);
+""",
 ]
-cursor.executemany("INSERT INTO Products VALUES (?, ?, ?, ?)", products_data)
+
+
+def seed(cursor):
+    # Добавляем тестовые данные
+    products_data = [
+        (1, "Ноутбук", 120000, 100000),
+        (2, "Телефон", 80000, 80000),
+        (3, "Наушники", 15000, 12000),
+        (4, "Монитор", 50000, 50000),
+        (5, "Мышь", 10000, 8500)
+    ]
+    cursor.executemany("INSERT INTO Products VALUES (?, ?, ?, ?)", products_data)
+
+
+# Создаём базу данных
+conn = sqlite3.connect("products.db")
+migrate(conn, 'skidki', MIGRATIONS, seed=seed, seed_table='Products')
+cursor = conn.cursor()
 
 # SQL-запрос с IIF
 cursor.execute("""
@@ -1,48 +1,67 @@
+import argparse
 import sqlite3
-from datetime import datetime, timedelta
+import os
+import sys
+from datetime import date, timedelta
 
-# Создание и подключение базы данных
-conn = sqlite3.connect("clients.db")
-cursor = conn.cursor()
-
-# Удаляем таблицу, если существует
-cursor.execute("DROP TABLE IF EXISTS Clients")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from schema_migrations import migrate
 
-# Создаём таблицу
-cursor.execute("""
-CREATE TABLE Clients (
+# Схема по версиям: при запуске применяются только недостающие миграции,
+# а не пересоздание базы при каждом запуске
+MIGRATIONS = [
+    """
+CREATE TABLE IF NOT EXISTS Clients (
     id INTEGER PRIMARY KEY,
     name TEXT,
     last_purchase_date DATE,
     total_spent REAL
-)
-""")
-
-# Добавляем тестовые данные
-today = datetime.today().date()
-clients_data = [
-    (1, "Иван", today - timedelta(days=30), 60000),    # VIP
-    (2, "Мария", today - timedelta(days=200), 20000),  # Удержание
-    (3, "Петр", today - timedelta(days=90), 40000),    # Обычный
-    (4, "Анна", today - timedelta(days=10), 45000),    # Обычный
-    (5, "Сергей", today - timedelta(days=45), 80000)   # VIP
+);
+""",
 ]
-cursor.executemany("INSERT INTO Clients VALUES (?, ?, ?, ?)", clients_data)
 
-# SQL-запрос с CASE
-cursor.execute(f"""
+# Тестовые данные заполняются один раз, поэтому даты покупок в них фиксированные
+# (от SEED_DATE), а не от сегодняшнего дня. Статусы в комментариях — на SEED_DATE;
+# увидеть их можно с --as-of 2025-10-30
+SEED_DATE = date(2025, 10, 30)
+
+
+def seed(cursor):
+    # Добавляем тестовые данные
+    clients_data = [
+        (1, "Иван", SEED_DATE - timedelta(days=30), 60000),    # VIP
+        (2, "Мария", SEED_DATE - timedelta(days=200), 20000),  # Удержание
+        (3, "Петр", SEED_DATE - timedelta(days=90), 40000),    # Обычный
+        (4, "Анна", SEED_DATE - timedelta(days=10), 45000),    # Обычный
+        (5, "Сергей", SEED_DATE - timedelta(days=45), 80000)   # VIP
+    ]
+    cursor.executemany("INSERT INTO Clients VALUES (?, ?, ?, ?)", clients_data)
+
+
+parser = argparse.ArgumentParser(description="Client statuses by purchase recency and total spent")
+parser.add_argument('--as-of', type=date.fromisoformat, default=date.today(),
+                    help="date to compute statuses for, YYYY-MM-DD (default: today)")
+args = parser.parse_args()
+
+# Создание и подключение базы данных
+conn = sqlite3.connect("clients.db")
+migrate(conn, 'statusklienta', MIGRATIONS, seed=seed, seed_table='Clients')
+cursor = conn.cursor()
+
+# SQL-запрос с CASE (давность покупки — на дату --as-of, по умолчанию сегодня)
+cursor.execute("""
 SELECT 
     name,
     CASE
-        WHEN total_spent > 50000 AND julianday('now') - julianday(last_purchase_date) <= 60 THEN 'VIP'
-        WHEN julianday('now') - julianday(last_purchase_date) > 180 THEN 'Удержание'
+        WHEN total_spent > 50000 AND julianday(:as_of) - julianday(last_purchase_date) <= 60 THEN 'VIP'
+        WHEN julianday(:as_of) - julianday(last_purchase_date) > 180 THEN 'Удержание'
         ELSE 'Обычный'
     END AS client_status
 FROM Clients
-""")
+""", {"as_of": args.as_of.isoformat()})
 
 # Вывод результата
-print("Статусы клиентов:")
+print(f"Статусы клиентов на {args.as_of}:")
 for name, status in cursor.fetchall():
     print(f"{name}: {status}")
 
@@ -1,31 +1,40 @@
 import sqlite3
+import os
+import sys
 
-# Создаём и подключаем базу данных
-conn = sqlite3.connect("campaigns.db")
-cursor = conn.cursor()
-
-# Удаляем таблицу, если существует
-cursor.execute("DROP TABLE IF EXISTS CampaignResults")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from schema_migrations import migrate
 
-# Создаём таблицу
-cursor.execute("""
-CREATE TABLE CampaignResults (
+# Схема по версиям: при запуске применяются только недостающие миграции,
+# а не пересоздание базы при каждом запуске
+MIGRATIONS = [
+    """
+CREATE TABLE IF NOT EXISTS CampaignResults (
     campaign_id INTEGER PRIMARY KEY,
     clicks INTEGER,
     conversions REAL,
     budget REAL
-)
-""")
-
-# Добавляем тестовые данные
-data = [
-    (1, 5000, 7000, 5000),   # ROI = 140 → Успех
-    (2, 3000, 4000, 4000),   # ROI = 100 → Средне
-    (3, 2000, 1000, 2000),   # ROI = 50 → Провал
-    (4, 10000, 12000, 8000), # ROI = 150 → Успех
-    (5, 4000, 3500, 5000)    # ROI = 70 → Провал
+);
+""",
 ]
-cursor.executemany("INSERT INTO CampaignResults VALUES (?, ?, ?, ?)", data)
+
+
+def seed(cursor):
+    # Добавляем тестовые данные
+    data = [
+        (1, 5000, 7000, 5000),   # ROI = 140 → Успех
+        (2, 3000, 4000, 4000),   # ROI = 100 → Средне
+        (3, 2000, 1000, 2000),   # ROI = 50 → Провал
+        (4, 10000, 12000, 8000), # ROI = 150 → Успех
+        (5, 4000, 3500, 5000)    # ROI = 70 → Провал
+    ]
+    cursor.executemany("INSERT INTO CampaignResults VALUES (?, ?, ?, ?)", data)
+
+
+# Создаём и подключаем базу данных
+conn = sqlite3.connect("campaigns.db")
+migrate(conn, 'uspehkompanii', MIGRATIONS, seed=seed, seed_table='CampaignResults')
+cursor = conn.cursor()
 
 # SQL-запрос с IIF для оценки успеха
 cursor.execute("""
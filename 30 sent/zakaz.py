@@ -1,29 +1,38 @@
 import sqlite3
+import os
+import sys
 
-# Создание базы данных
-conn = sqlite3.connect('orders.db')
-cursor = conn.cursor()
-
-# Удаляем таблицу, если существует
-cursor.execute('DROP TABLE IF EXISTS Orders')
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from schema_migrations import migrate
 
-# Создаём таблицу
-cursor.execute('''
-CREATE TABLE Orders (
+# Схема по версиям: при запуске применяются только недостающие миграции,
+# а не пересоздание базы при каждом запуске
+MIGRATIONS = [
+    """
+CREATE TABLE IF NOT EXISTS Orders (
     order_id INTEGER PRIMARY KEY,
     status_Xcode INTEGER
-)
-''')
-
-# Добавляем тестовые данные
-orders_data = [
-    (1, 0),
-    (2, 1),
-    (3, 2),
-    (4, 3),
-    (5, 7)
+);
+""",
 ]
-cursor.executemany('INSERT INTO Orders VALUES (?, ?)', orders_data)
+
+
+def seed(cursor):
+    # Добавляем тестовые данные
+    orders_data = [
+        (1, 0),
+        (2, 1),
+        (3, 2),
+        (4, 3),
+        (5, 7)
+    ]
+    cursor.executemany('INSERT INTO Orders VALUES (?, ?)', orders_data)
+
+
+# Создание базы данных
+conn = sqlite3.connect('orders.db')
+migrate(conn, 'zakaz', MIGRATIONS, seed=seed, seed_table='Orders')
+cursor = conn.cursor()
 
 # SQL-запрос с CASE
 cursor.execute('''
@@ -5,8 +5,14 @@ social_network_all_in_one.py
 Однофайловая демонстрация проектирования и реализации базы данных для упрощённой социальной сети.
 Включает:
  - модели SQLAlchemy для пользователей, постов, комментариев, личных и групповых чатов;
- - хеширование паролей (argon2 через passlib, с запасным вариантом PBKDF2 если passlib не установлен);
- - шифрование сообщений (AES-GCM через cryptography) — серверное шифрование;
+ - хеширование паролей (argon2 через passlib, с запасным вариантом PBKDF2 если passlib не установлен)
+   в пуле потоков с ограниченной очередью (PasswordHashingPool), с синхронным и asyncio-интерфейсом;
+   хеш хранит алгоритм, стоимость и соль; профили стоимости (KDF_PROFILE, калибровка
+   python social_network_all_in_one.py --calibrate-kdf 250), устаревшие хеши обновляются при входе;
+ - шифрование сообщений (AES-GCM через cryptography) — серверное шифрование; MessageCrypto кеширует
+   шифры по key_id, расшифровывает пачки в пуле потоков и отдаёт ленивый список DecryptedMessages;
+ - пакетная запись постов, комментариев, чатов и сообщений одной транзакцией (BatchWriter);
+ - постраничная история чатов (iter_private_history / iter_group_history, курсор (created_at, message_id));
  - создание БД (SQLite по умолчанию), наполнение тестовыми данными и демонстрация выборок.
 
 Запуск:
@@ -27,9 +33,21 @@ social_network_all_in_one.py
 
 import os
 import sys
+import argparse
+import asyncio
+import atexit
+import base64
 import binascii
+import functools
+import hashlib
 import hmac
-from datetime import datetime
+import json
+import threading
+import time
+from collections import namedtuple
+from collections.abc import Sequence
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timezone
 
 # --------- Опциональные зависимости (попытаемся импортировать) ----------
 _have_sqlalchemy = True
@@ -38,7 +56,8 @@ _have_crypto = True
 
 try:
     from sqlalchemy import (
-        create_engine, Column, Integer, String, DateTime, Boolean, ForeignKey, Text, LargeBinary, func
+        create_engine, Column, Integer, String, DateTime, Boolean, ForeignKey, Text, LargeBinary, Index,
+        func, and_, or_, insert, type_coerce
     )
     from sqlalchemy.orm import declarative_base, relationship, sessionmaker
 except Exception as e:
@@ -60,51 +79,304 @@ DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///social_network.db")
 DEMO_AES_KEY = None  # будет сгенерирован в рантайме, если cryptography доступен
 
 # ------------------ Хеширование паролей --------------------
-if _have_passlib:
-    def hash_password(password: str) -> str:
-        return argon2.hash(password)
+# Хеш сам описывает алгоритм, стоимость и соль, поэтому стоимость можно менять,
+# не ломая уже сохранённые хеши:
+#   argon2:  $argon2id$v=19$m=65536,t=3,p=4$<соль>$<хеш>   (формат passlib/argon2-cffi)
+#   PBKDF2:  $pbkdf2-sha256$i=600000$<соль base64>$<хеш base64>
+# Хеши старого формата "<соль hex>$<хеш hex>" (PBKDF2, 200 000 итераций)
+# по-прежнему проверяются и заменяются новыми при следующем входе.
+PBKDF2_PREFIX = "$pbkdf2-sha256$"
+LEGACY_PBKDF2_ITERATIONS = 200_000
+# Нижние границы: калибровка на медленной машине не опустит стоимость ниже них
+PBKDF2_MIN_ITERATIONS = 100_000
+ARGON2_MIN_TIME_COST = 2
 
-    def verify_password(password: str, hashed: str) -> bool:
-        try:
-            return argon2.verify(password, hashed)
-        except Exception:
-            return False
-else:
-    import hashlib
-    import os as _os
-    def hash_password(password: str) -> str:
-        # PBKDF2-HMAC-SHA256 запасной вариант (не так удобен как argon2, но лучше чем plain)
-        salt = _os.urandom(16)
-        dk = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, 200_000)
-        return binascii.hexlify(salt).decode() + '$' + binascii.hexlify(dk).decode()
-
-    def verify_password(password: str, hashed: str) -> bool:
-        try:
+# Профили стоимости: pbkdf2_iterations — для запасного PBKDF2, argon2 — параметры
+# passlib (memory_cost в КиБ). Выбираются переменной окружения KDF_PROFILE;
+# KDF_PROFILE=auto подбирает стоимость под KDF_TARGET_MS миллисекунд на хеш.
+KDF_PROFILES = {
+    "interactive": {
+        "pbkdf2_iterations": 600_000,
+        "argon2": {"time_cost": 3, "memory_cost": 65536, "parallelism": 4},
+    },
+    "sensitive": {
+        "pbkdf2_iterations": 2_000_000,
+        "argon2": {"time_cost": 4, "memory_cost": 262144, "parallelism": 4},
+    },
+}
+KDF_TARGET_MS = float(os.environ.get("KDF_TARGET_MS", "250"))
+
+
+def _b64(data: bytes) -> str:
+    return base64.b64encode(data).decode().rstrip("=")
+
+
+def _unb64(text: str) -> bytes:
+    return base64.b64decode(text + "=" * (-len(text) % 4))
+
+
+def _pbkdf2(password: str, salt: bytes, iterations: int) -> bytes:
+    return hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, iterations)
+
+
+def _time_ms(fn, repeat=3) -> float:
+    # Лучший из нескольких замеров: меньше всего зависит от посторонней нагрузки
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def calibrate_kdf(target_ms=None) -> dict:
+    """Подбирает профиль стоимости так, чтобы хеш занимал около target_ms мс на этой машине.
+
+    PBKDF2: число итераций пропорционально замеренному времени. argon2:
+    memory_cost и parallelism берутся из профиля interactive, подбирается
+    time_cost. Результат можно передать в set_kdf_profile().
+    """
+    target_ms = target_ms or KDF_TARGET_MS
+    probe = 50_000
+    ms = _time_ms(lambda: _pbkdf2("calibration", b"\0" * 16, probe))
+    iterations = int(probe * target_ms / ms)
+    # две значащие цифры: повторная калибровка не меняет профиль из-за шума
+    iterations = int(float(f"{iterations:.2g}"))
+    profile = {"pbkdf2_iterations": max(PBKDF2_MIN_ITERATIONS, iterations)}
+
+    if _have_passlib:
+        params = dict(KDF_PROFILES["interactive"]["argon2"], time_cost=1)
+        ms = _time_ms(lambda: argon2.using(**params).hash("calibration"))
+        params["time_cost"] = max(ARGON2_MIN_TIME_COST, round(target_ms / ms))
+        profile["argon2"] = params
+    return profile
+
+
+def _profile_from_env() -> dict:
+    name = os.environ.get("KDF_PROFILE", "interactive")
+    if name == "auto":
+        return calibrate_kdf()
+    if name not in KDF_PROFILES:
+        raise ValueError(f"unknown KDF_PROFILE: {name} (expected auto or one of {sorted(KDF_PROFILES)})")
+    return KDF_PROFILES[name]
+
+
+_kdf_profile = None
+
+
+def get_kdf_profile() -> dict:
+    global _kdf_profile
+    if _kdf_profile is None:
+        _kdf_profile = _profile_from_env()
+    return _kdf_profile
+
+
+def set_kdf_profile(profile: dict):
+    """Меняет текущий профиль; старые хеши обновятся при следующем входе."""
+    global _kdf_profile
+    _kdf_profile = profile
+
+
+def _argon2_hasher(profile):
+    return argon2.using(**profile["argon2"])
+
+
+class PasswordCheck:
+    """Результат verify_password: истинен, если пароль верный.
+
+    needs_rehash — хеш создан устаревшим алгоритмом или с меньшей стоимостью,
+    чем в текущем профиле; после успешного входа его стоит пересчитать.
+    """
+    __slots__ = ("ok", "needs_rehash")
+
+    def __init__(self, ok: bool, needs_rehash: bool = False):
+        self.ok = ok
+        self.needs_rehash = ok and needs_rehash
+
+    def __bool__(self):
+        return self.ok
+
+    def __repr__(self):
+        return f"PasswordCheck(ok={self.ok}, needs_rehash={self.needs_rehash})"
+
+
+def hash_password(password: str, profile=None) -> str:
+    """Хеш по профилю: argon2, если доступен passlib, иначе PBKDF2-HMAC-SHA256."""
+    profile = profile or get_kdf_profile()
+    if _have_passlib:
+        return _argon2_hasher(profile).hash(password)
+    iterations = profile["pbkdf2_iterations"]
+    salt = os.urandom(16)
+    return f"{PBKDF2_PREFIX}i={iterations}${_b64(salt)}${_b64(_pbkdf2(password, salt, iterations))}"
+
+
+def verify_password(password: str, hashed: str, profile=None) -> PasswordCheck:
+    """Проверяет пароль по хешу любого из поддерживаемых форматов."""
+    profile = profile or get_kdf_profile()
+    try:
+        if hashed.startswith("$argon2"):
+            if not _have_passlib:
+                return PasswordCheck(False)
+            hasher = _argon2_hasher(profile)
+            return PasswordCheck(hasher.verify(password, hashed), hasher.needs_update(hashed))
+
+        if hashed.startswith(PBKDF2_PREFIX):
+            cost, salt_b64, dk_b64 = hashed[len(PBKDF2_PREFIX):].split('$')
+            iterations = int(cost.removeprefix("i="))
+            salt, expected = _unb64(salt_b64), _unb64(dk_b64)
+        else:
             salt_hex, dk_hex = hashed.split('$')
-            salt = binascii.unhexlify(salt_hex)
-            expected = binascii.unhexlify(dk_hex)
-            dk = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, 200_000)
-            return hmac.compare_digest(dk, expected)
-        except Exception:
-            return False
+            iterations = LEGACY_PBKDF2_ITERATIONS
+            salt, expected = binascii.unhexlify(salt_hex), binascii.unhexlify(dk_hex)
+            hashed = None  # старый формат обновляется всегда
+
+        ok = hmac.compare_digest(_pbkdf2(password, salt, iterations), expected)
+        outdated = (hashed is None or _have_passlib
+                    or iterations < profile["pbkdf2_iterations"])
+        return PasswordCheck(ok, outdated)
+    except Exception:
+        return PasswordCheck(False)
+
+# ------------------ Пул хеширования паролей --------------------
+# argon2 и PBKDF2 намеренно медленные (десятки-сотни мс на хеш). Чтобы регистрация
+# и вход не блокировали вызывающий поток и при всплесках загружали все ядра,
+# хеши считаются в пуле. По умолчанию это пул потоков: hashlib.pbkdf2_hmac и
+# argon2-cffi отпускают GIL. HASH_USE_PROCESSES=1 — пул процессов.
+HASH_WORKERS = int(os.environ.get("HASH_WORKERS", os.cpu_count() or 1))
+HASH_MAX_PENDING = int(os.environ.get("HASH_MAX_PENDING", HASH_WORKERS * 4))
+HASH_USE_PROCESSES = os.environ.get("HASH_USE_PROCESSES", "0") == "1"
+
+
+class HashingBusyError(RuntimeError):
+    """Очередь пула хеширования заполнена и не освободилась за отведённое время."""
+
+
+class PasswordHashingPool:
+    """Хеширование и проверка паролей вне вызывающего потока.
+
+    В работе одновременно не больше max_pending задач; следующий вызов ждёт,
+    пока освободится место (backpressure), или по истечении timeout получает
+    HashingBusyError. Есть синхронные методы (hash, verify, hash_many) и
+    асинхронные для asyncio (ahash, averify, ahash_many).
+    """
+
+    def __init__(self, workers=None, max_pending=None, processes=None):
+        workers = workers or HASH_WORKERS
+        processes = HASH_USE_PROCESSES if processes is None else processes
+        executor_cls = ProcessPoolExecutor if processes else ThreadPoolExecutor
+        self._executor = executor_cls(max_workers=workers)
+        self._slots = threading.BoundedSemaphore(max_pending or HASH_MAX_PENDING)
+        # asyncio-вызовы, ждущие места: (цикл событий, future), будятся в _release
+        self._async_waiters = []
+        self._waiters_lock = threading.Lock()
+
+    def _release(self):
+        self._slots.release()
+        with self._waiters_lock:
+            waiters, self._async_waiters = self._async_waiters, []
+        # Будим всех: каждый снова пробует занять место, не успевшие ждут дальше
+        for loop, waiter in waiters:
+            loop.call_soon_threadsafe(lambda w=waiter: w.done() or w.set_result(None))
+
+    def _start(self, fn, *args):
+        # место в очереди уже занято вызывающим
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._release()
+            raise
+        future.add_done_callback(lambda _: self._release())
+        return future
+
+    def _submit(self, fn, *args, timeout=None):
+        if not self._slots.acquire(timeout=timeout):
+            raise HashingBusyError("password hashing queue is full")
+        return self._start(fn, *args)
+
+    def submit_hash(self, password: str, timeout=None):
+        """Ставит хеширование в очередь и возвращает concurrent.futures.Future."""
+        return self._submit(hash_password, password, get_kdf_profile(), timeout=timeout)
+
+    def submit_verify(self, password: str, hashed: str, timeout=None):
+        return self._submit(verify_password, password, hashed, get_kdf_profile(), timeout=timeout)
+
+    def hash(self, password: str, timeout=None) -> str:
+        return self.submit_hash(password, timeout).result()
+
+    def verify(self, password: str, hashed: str, timeout=None) -> PasswordCheck:
+        return self.submit_verify(password, hashed, timeout).result()
+
+    def hash_many(self, passwords, timeout=None):
+        """Хеши в том же порядке; постановка в очередь ждёт, если пул занят."""
+        futures = [self.submit_hash(p, timeout) for p in passwords]
+        return [f.result() for f in futures]
+
+    async def _asubmit(self, fn, *args, timeout=None):
+        # Место ждём на future цикла событий, а не в потоке: ожидающие
+        # не занимают потоки и не мешают другим задачам to_thread
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while not self._slots.acquire(blocking=False):
+            waiter = loop.create_future()
+            with self._waiters_lock:
+                self._async_waiters.append((loop, waiter))
+            try:
+                # место могло освободиться до того, как мы встали в список
+                if self._slots.acquire(blocking=False):
+                    break
+                remaining = None if deadline is None else deadline - loop.time()
+                if remaining is not None and remaining <= 0:
+                    raise HashingBusyError("password hashing queue is full")
+                try:
+                    await asyncio.wait_for(waiter, remaining)
+                except asyncio.TimeoutError:
+                    raise HashingBusyError("password hashing queue is full") from None
+            finally:
+                with self._waiters_lock:
+                    if (loop, waiter) in self._async_waiters:
+                        self._async_waiters.remove((loop, waiter))
+        return await asyncio.wrap_future(self._start(fn, *args))
+
+    async def ahash(self, password: str, timeout=None) -> str:
+        return await self._asubmit(hash_password, password, get_kdf_profile(), timeout=timeout)
+
+    async def averify(self, password: str, hashed: str, timeout=None) -> PasswordCheck:
+        return await self._asubmit(verify_password, password, hashed, get_kdf_profile(), timeout=timeout)
+
+    async def ahash_many(self, passwords, timeout=None):
+        return await asyncio.gather(*(self.ahash(p, timeout) for p in passwords))
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+
+_hashing_pool = None
+_hashing_pool_lock = threading.Lock()
+
+
+def get_hashing_pool() -> PasswordHashingPool:
+    """Общий пул хеширования (создаётся при первом обращении)."""
+    global _hashing_pool
+    if _hashing_pool is None:
+        with _hashing_pool_lock:
+            if _hashing_pool is None:
+                _hashing_pool = PasswordHashingPool()
+                atexit.register(_hashing_pool.close)
+    return _hashing_pool
 
 # ------------------ Шифрование сообщений (серверное AES-GCM) --------------------
+SCHEME_AES_GCM = "AES-256-GCM"
+SCHEME_PLAINTEXT = "PLAINTEXT"
+
 if _have_crypto:
-    import os as _os
     def generate_aes_key() -> bytes:
-        return _os.urandom(32)  # AES-256
+        return os.urandom(32)  # AES-256
 
     def encrypt_message_aes_gcm(plaintext: str, key: bytes):
-        aes = AESGCM(key)
-        nonce = _os.urandom(12)
-        ct = aes.encrypt(nonce, plaintext.encode('utf-8'), None)
-        # AESGCM returns ciphertext||tag; мы храним их вместе
-        return ct, nonce
+        return get_message_crypto().encrypt(plaintext, key=key)[:2]
 
     def decrypt_message_aes_gcm(ct: bytes, nonce: bytes, key: bytes) -> str:
-        aes = AESGCM(key)
-        pt = aes.decrypt(nonce, ct, None)
-        return pt.decode('utf-8')
+        return get_message_crypto().cipher(key=key).decrypt(nonce, ct, None).decode('utf-8')
 else:
     def encrypt_message_aes_gcm(plaintext: str, key: bytes):
         # небезопасный fallback: сохраняем в открытом виде, но помечаем как PLAINTEXT
@@ -113,6 +385,166 @@ else:
     def decrypt_message_aes_gcm(ct: bytes, nonce: bytes, key: bytes) -> str:
         return ct.decode('utf-8')
 
+
+DecryptedMessage = namedtuple("DecryptedMessage", "message_id sender_id text scheme created_at")
+
+
+class MessageCrypto:
+    """Шифрование и расшифровка сообщений с кешем шифров.
+
+    Объект AESGCM создаётся один раз на ключ, ключ — один раз на key_id
+    (keys — словарь key_id -> ключ или функция, например запрос в KMS;
+    сообщения без key_id шифруются ключом default_key). Кешируются только
+    найденные ключи: неизвестный key_id — KeyError, и следующий запрос снова
+    идёт в keys. AESGCM не хранит
+    состояния между вызовами, поэтому один объект используется из всех потоков.
+
+    Пачки больше batch_threshold сообщений расшифровываются в пуле потоков:
+    cryptography отпускает GIL на время шифрования.
+    """
+
+    def __init__(self, keys=None, default_key=None, workers=None, batch_threshold=64, cache_size=256):
+        resolve = keys if callable(keys) or keys is None else keys.get
+        self._key_for_id = None
+        if resolve is not None:
+            def lookup(key_id):
+                # lru_cache не запоминает исключения, поэтому промах не кешируется
+                key = resolve(key_id)
+                if key is None:
+                    raise KeyError(f"no encryption key for key_id={key_id}")
+                return key
+            self._key_for_id = functools.lru_cache(maxsize=cache_size)(lookup)
+        self._cipher_for_key = functools.lru_cache(maxsize=cache_size)(AESGCM) if _have_crypto else None
+        self.default_key = default_key
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_threshold = batch_threshold
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def cipher(self, key_id=None, key=None):
+        """AESGCM для явного ключа key, иначе для key_id, иначе для default_key."""
+        if key is None:
+            if key_id is not None:
+                # Иначе сообщение зашифруется default_key, а key_id в нём будет врать
+                if self._key_for_id is None:
+                    raise KeyError(f"key_id={key_id} given but no key resolver is configured")
+                key = self._key_for_id(key_id)
+            else:
+                key = self.default_key or DEMO_AES_KEY
+        return self._cipher_for_key(bytes(key))
+
+    def encrypt(self, plaintext: str, key_id=None, key=None):
+        """Возвращает (payload, nonce, scheme) для записи в сообщение."""
+        if not _have_crypto:
+            return plaintext.encode('utf-8'), b'', SCHEME_PLAINTEXT
+        nonce = os.urandom(12)
+        # AESGCM возвращает ciphertext||tag; храним их вместе
+        ct = self.cipher(key_id, key).encrypt(nonce, plaintext.encode('utf-8'), None)
+        return ct, nonce, SCHEME_AES_GCM
+
+    def _decrypt_fields(self, fields, key=None) -> str:
+        payload, nonce, scheme, key_id = fields
+        try:
+            if scheme == SCHEME_AES_GCM and _have_crypto:
+                return self.cipher(key_id, key).decrypt(nonce, payload, None).decode('utf-8')
+            if scheme == SCHEME_PLAINTEXT:
+                return payload.decode('utf-8')
+            return "<неизвестная схема>"
+        except Exception as e:
+            return f"<ошибка расшифровки: {e}>"
+
+    def _decrypt_chunk(self, chunk, key):
+        return [self._decrypt_fields(fields, key) for fields in chunk]
+
+    def _pool(self):
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers,
+                                                    thread_name_prefix="message-crypto")
+                atexit.register(self._executor.shutdown)
+        return self._executor
+
+    def decrypt_many(self, messages, key=None):
+        """Тексты сообщений PrivateMessage / GroupMessage в том же порядке.
+
+        Ошибки отдельных сообщений не прерывают пачку: вместо текста
+        возвращается "<ошибка расшифровки: ...>".
+        """
+        # Атрибуты ORM читаем здесь: объекты сессии нельзя трогать из других потоков
+        fields = [(m.encrypted_payload, m.nonce, m.encryption_scheme, m.key_id) for m in messages]
+        encrypted = sum(1 for f in fields if f[2] == SCHEME_AES_GCM)
+        if not _have_crypto or self.workers == 1 or encrypted < self.batch_threshold:
+            return self._decrypt_chunk(fields, key)
+
+        # Ключи (и возможные запросы в KMS) — один раз и в этом потоке
+        for key_id in {f[3] for f in fields if f[2] == SCHEME_AES_GCM}:
+            try:
+                self.cipher(key_id, key)
+            except Exception:
+                pass  # сообщение получит текст ошибки при расшифровке
+        size = max(self.batch_threshold, -(-len(fields) // self.workers))
+        chunks = [fields[i:i + size] for i in range(0, len(fields), size)]
+        texts = []
+        for part in self._pool().map(self._decrypt_chunk, chunks, [key] * len(chunks)):
+            texts.extend(part)
+        return texts
+
+    def decrypt(self, message, key=None) -> DecryptedMessage:
+        return self.view([message], key)[0]
+
+    def view(self, messages, key=None) -> "DecryptedMessages":
+        return DecryptedMessages(self, messages, key)
+
+
+class DecryptedMessages(Sequence):
+    """Список сообщений, которые расшифровываются при первом обращении.
+
+    view[i] расшифровывает одно сообщение, view[a:b] и итерация — пачкой
+    через MessageCrypto.decrypt_many. Расшифрованное запоминается, так что
+    платим только за те сообщения, которые действительно показываем.
+    """
+
+    def __init__(self, crypto: MessageCrypto, messages, key=None):
+        self._crypto = crypto
+        self._messages = list(messages)
+        self._key = key
+        self._decrypted = [None] * len(self._messages)
+
+    def __len__(self):
+        return len(self._messages)
+
+    def _load(self, indices):
+        missing = [i for i in indices if self._decrypted[i] is None]
+        if missing:
+            texts = self._crypto.decrypt_many([self._messages[i] for i in missing], self._key)
+            for i, text in zip(missing, texts):
+                m = self._messages[i]
+                self._decrypted[i] = DecryptedMessage(m.message_id, m.sender_id, text,
+                                                      m.encryption_scheme, m.created_at)
+        return [self._decrypted[i] for i in indices]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self._load(range(*index.indices(len(self))))
+        return self._load([range(len(self))[index]])[0]
+
+    def __iter__(self):
+        # Пачками, чтобы прерванный на середине цикл не расшифровывал лишнего
+        step = self._crypto.batch_threshold
+        for start in range(0, len(self), step):
+            yield from self[start:start + step]
+
+
+_message_crypto = None
+
+
+def get_message_crypto() -> MessageCrypto:
+    """Общий движок шифрования (ключ по умолчанию — DEMO_AES_KEY)."""
+    global _message_crypto
+    if _message_crypto is None:
+        _message_crypto = MessageCrypto()
+    return _message_crypto
+
 # ------------------ Проверим наличие SQLAlchemy и определим модели --------------------
 if not _have_sqlalchemy:
     print("ERROR: SQLAlchemy не установлен в этой среде.")
@@ -202,6 +634,11 @@ class PrivateMessage(Base):
     chat = relationship("PrivateChat", back_populates="messages")
     sender = relationship("User", back_populates="sent_private_messages")
 
+    # История чата постранично: message_id — для однозначного порядка при равном created_at
+    __table_args__ = (
+        Index("ix_private_messages_chat_created", "chat_id", "created_at", "message_id"),
+    )
+
 # Групповые чаты
 class GroupChat(Base):
     __tablename__ = "group_chats"
@@ -238,6 +675,10 @@ class GroupMessage(Base):
     group = relationship("GroupChat", back_populates="messages")
     sender = relationship("User", back_populates="sent_group_messages")
 
+    __table_args__ = (
+        Index("ix_group_messages_group_created", "group_id", "created_at", "message_id"),
+    )
+
 class AuditLog(Base):
     __tablename__ = "audit_logs"
     audit_id = Column(Integer, primary_key=True, autoincrement=True)
@@ -262,6 +703,11 @@ SessionLocal = None
 
 def create_db(engine):
     Base.metadata.create_all(bind=engine)
+    # create_all не трогает уже существующие таблицы — индексы, добавленные
+    # в модели позже, создаём отдельно
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
     print("База данных и таблицы созданы или уже существовали.")
 
 # ------------------ CRUD / демонстрация --------------------
@@ -270,7 +716,7 @@ def create_user(session, username: str, email: str, password: str):
         user_id=gen_id(),
         username=username,
         email=email,
-        password_hash=hash_password(password),
+        password_hash=get_hashing_pool().hash(password),
     )
     session.add(u)
     try:
@@ -283,6 +729,65 @@ def create_user(session, username: str, email: str, password: str):
         print("Ошибка: пользователь с таким именем или email уже существует.")
         return None
 
+def create_users(session, users):
+    """Создаёт пачку пользователей [(username, email, password), ...] одним commit.
+
+    Пароли хешируются параллельно в пуле. Уже занятые имя или email (в базе
+    или раньше в этой же пачке) пропускаются с сообщением. Возвращает
+    список созданных пользователей.
+    """
+    users = list(users)
+    taken = session.query(User.username, User.email).filter(or_(
+        User.username.in_([u[0] for u in users]),
+        User.email.in_([u[1] for u in users]),
+    )).all()
+    taken_names = {name for name, _ in taken}
+    taken_emails = {email for _, email in taken}
+
+    fresh = []
+    for username, email, password in users:
+        if username in taken_names or email in taken_emails:
+            print(f"Ошибка: пользователь {username} / {email} уже существует — пропущен.")
+            continue
+        taken_names.add(username)
+        taken_emails.add(email)
+        fresh.append((username, email, password))
+
+    hashes = get_hashing_pool().hash_many([password for _, _, password in fresh])
+    created = [
+        User(user_id=gen_id(), username=username, email=email, password_hash=hashed)
+        for (username, email, _), hashed in zip(fresh, hashes)
+    ]
+    session.add_all(created)
+    try:
+        session.commit()
+    except IntegrityError:
+        # кто-то успел занять имя или email между проверкой и commit
+        session.rollback()
+        print("Ошибка: пользователь с таким именем или email уже существует.")
+        return []
+    print(f"Создано пользователей: {len(created)}")
+    return created
+
+def authenticate_user(session, username: str, password: str):
+    """Вход: пользователь при верном пароле, иначе None. Проверка хеша — в пуле.
+
+    Если хеш устарел (старый формат или стоимость ниже текущего профиля),
+    он пересчитывается по текущему профилю — пароль известен только сейчас.
+    """
+    pool = get_hashing_pool()
+    u = session.query(User).filter(User.username == username, User.is_active.is_(True)).first()
+    if u is None:
+        return None
+    check = pool.verify(password, u.password_hash)
+    if not check:
+        return None
+    if check.needs_rehash:
+        u.password_hash = pool.hash(password)
+        session.commit()
+        print(f"Хеш пароля пользователя {u.username} обновлён")
+    return u
+
 def create_post(session, author: User, content: str):
     p = Post(post_id=gen_id(), author_id=author.user_id, content=content)
     session.add(p)
@@ -311,17 +816,8 @@ def create_private_chat(session, member_user_ids):
     return chat
 
 def send_private_message(session, chat: PrivateChat, sender: User, plaintext: str, key: bytes=None, key_id: str=None):
-    global DEMO_AES_KEY
-    if key is None and _have_crypto:
-        key = DEMO_AES_KEY
-    if _have_crypto:
-        ct, nonce = encrypt_message_aes_gcm(plaintext, key)
-        scheme = "AES-256-GCM"
-        payload = ct
-    else:
-        # предупреждение: PLAINTEXT сохраняется небезопасно
-        payload, nonce = encrypt_message_aes_gcm(plaintext, key)
-        scheme = "PLAINTEXT"
+    # без cryptography — небезопасный PLAINTEXT
+    payload, nonce, scheme = get_message_crypto().encrypt(plaintext, key_id=key_id, key=key)
     msg = PrivateMessage(
         message_id=gen_id(),
         chat_id=chat.chat_id,
@@ -337,24 +833,230 @@ def send_private_message(session, chat: PrivateChat, sender: User, plaintext: st
     print(f"Отправлено сообщение {msg.message_id} в чат {chat.chat_id} (scheme={scheme})")
     return msg
 
-def read_and_decrypt_private_messages(session, chat: PrivateChat, key: bytes=None):
-    global DEMO_AES_KEY
-    if key is None and _have_crypto:
-        key = DEMO_AES_KEY
-    msgs = session.query(PrivateMessage).filter(PrivateMessage.chat_id == chat.chat_id).order_by(PrivateMessage.created_at).all()
-    result = []
-    for m in msgs:
+# ------------------ Пакетная запись (unit of work) --------------------
+def _ref_id(obj, attr):
+    # Ссылка на объект — сам ORM-объект или его id (строка из BatchWriter)
+    return obj if isinstance(obj, str) else getattr(obj, attr)
+
+class BatchWriter:
+    """Пакетная запись постов, комментариев, чатов и сообщений одной транзакцией.
+
+    В отличие от create_post / send_private_message и т.п., которые делают
+    commit и refresh на каждый объект, здесь id и created_at генерируются на
+    клиенте, строки копятся и пишутся массовым INSERT по таблицам, commit —
+    один. Методы add_* возвращают id нового объекта; его можно передавать
+    в следующие add_* вместо ORM-объекта. audit=True добавляет на каждый
+    созданный объект строку AuditLog в той же транзакции. Сообщения в
+    консоль и обработчики after_commit выполняются только после успешного
+    commit.
+
+        with BatchWriter(session) as batch:
+            post_id = batch.add_post(author, "Текст")
+            batch.add_comment(post_id, reader, "Комментарий")
+
+    chunk_size — сколько строк (включая участников чатов и записи аудита)
+    держать в памяти: при превышении они отправляются в базу (flush) в той
+    же транзакции.
+    """
+
+    # Порядок INSERT: сначала таблицы, на которые ссылаются внешние ключи
+    _WRITE_ORDER = (PrivateChat, PrivateChatMember, GroupChat, GroupMember,
+                    Post, Comment, PrivateMessage, GroupMessage, AuditLog)
+
+    def __init__(self, session, verbose=False, chunk_size=5000, audit=False):
+        self.session = session
+        self.verbose = verbose
+        self.chunk_size = chunk_size
+        self.audit = audit
+        self._rows = {}
+        self._pending = 0
+        self._written = {}
+        self._created = []
+        self._callbacks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+        return False
+
+    def _queue(self, model, values):
+        self._rows.setdefault(model, []).append(values)
+        table = model.__tablename__
+        self._written[table] = self._written.get(table, 0) + 1
+        self._pending += 1
+        if self._pending >= self.chunk_size:
+            self.flush()
+
+    def _add(self, model, done, id_attr, actor_id, **values):
+        object_id = values.setdefault(id_attr, gen_id())
+        created_at = values.setdefault("created_at", datetime.now(timezone.utc))
+        self._queue(model, values)
+        if self.audit:
+            self._queue(AuditLog, {"actor_id": actor_id, "action": "create",
+                                   "object_type": model.__tablename__, "object_id": object_id,
+                                   "created_at": created_at})
+        if self.verbose:
+            self._created.append((done, object_id))
+        return object_id
+
+    def add_post(self, author, content: str) -> str:
+        author_id = _ref_id(author, "user_id")
+        return self._add(Post, "Пост создан", "post_id", author_id, author_id=author_id, content=content)
+
+    def add_comment(self, post, author, content: str, parent_comment_id=None) -> str:
+        author_id = _ref_id(author, "user_id")
+        return self._add(Comment, "Комментарий создан", "comment_id", author_id,
+                         post_id=_ref_id(post, "post_id"), author_id=author_id, content=content,
+                         parent_comment_id=parent_comment_id)
+
+    def add_private_chat(self, member_user_ids, creator=None) -> str:
+        chat_id = self._add(PrivateChat, "Личный чат создан", "chat_id",
+                            creator and _ref_id(creator, "user_id"), is_direct=(len(member_user_ids) == 2))
+        for uid in member_user_ids:
+            self._queue(PrivateChatMember, {"chat_id": chat_id, "user_id": uid})
+        return chat_id
+
+    def add_group_chat(self, name: str, owner, member_user_ids=(), is_private=True) -> str:
+        owner_id = _ref_id(owner, "user_id")
+        group_id = self._add(GroupChat, "Групповой чат создан", "group_id", owner_id,
+                             name=name, owner_id=owner_id, is_private=is_private)
+        members = [owner_id] + [uid for uid in member_user_ids if uid != owner_id]
+        for uid in members:
+            self._queue(GroupMember, {
+                "group_id": group_id, "user_id": uid, "role": "owner" if uid == owner_id else "member",
+            })
+        return group_id
+
+    def add_private_message(self, chat, sender, plaintext: str, key: bytes=None, key_id: str=None) -> str:
+        sender_id = _ref_id(sender, "user_id")
+        payload, nonce, scheme = get_message_crypto().encrypt(plaintext, key_id=key_id, key=key)
+        return self._add(PrivateMessage, "Сообщение отправлено", "message_id", sender_id,
+                         chat_id=_ref_id(chat, "chat_id"), sender_id=sender_id, encrypted_payload=payload,
+                         encryption_scheme=scheme, key_id=key_id, nonce=nonce)
+
+    def add_group_message(self, group, sender, plaintext: str, key: bytes=None, key_id: str=None) -> str:
+        sender_id = _ref_id(sender, "user_id")
+        payload, nonce, scheme = get_message_crypto().encrypt(plaintext, key_id=key_id, key=key)
+        return self._add(GroupMessage, "Групповое сообщение отправлено", "message_id", sender_id,
+                         group_id=_ref_id(group, "group_id"), sender_id=sender_id, encrypted_payload=payload,
+                         encryption_scheme=scheme, key_id=key_id, nonce=nonce)
+
+    def after_commit(self, callback):
+        """callback() вызывается после успешного commit (уведомления, кеши и т.п.)."""
+        self._callbacks.append(callback)
+
+    def flush(self):
+        """Отправляет накопленные строки в базу, не завершая транзакцию."""
+        for model in self._WRITE_ORDER:
+            rows = self._rows.pop(model, None)
+            if rows:
+                # ORM bulk INSERT: executemany без RETURNING и без загрузки объектов
+                self.session.execute(insert(model), rows)
+        self._pending = 0
+
+    def commit(self):
         try:
-            if m.encryption_scheme == "AES-256-GCM" and _have_crypto:
-                pt = decrypt_message_aes_gcm(m.encrypted_payload, m.nonce, key)
-            elif m.encryption_scheme == "PLAINTEXT":
-                pt = m.encrypted_payload.decode('utf-8')
+            self.flush()
+            self.session.commit()
+        except BaseException:
+            self.rollback()
+            raise
+        created, callbacks, written = self._created, self._callbacks, self._written
+        self._created, self._callbacks, self._written = [], [], {}
+        for done, object_id in created:
+            print(f"{done}: {object_id}")
+        if written:
+            print("Записано одной транзакцией: " + ", ".join(f"{table} — {n}" for table, n in written.items()))
+        for callback in callbacks:
+            callback()
+
+    def rollback(self):
+        self.session.rollback()
+        self._rows, self._pending = {}, 0
+        self._created, self._callbacks, self._written = [], [], {}
+
+def read_and_decrypt_private_messages(session, chat: PrivateChat, key: bytes=None, lazy=False):
+    """Все сообщения чата: (message_id, sender_id, text, scheme, created_at).
+
+    lazy=True возвращает DecryptedMessages — расшифровка при обращении.
+    Для длинных чатов — iter_private_history (постранично).
+    """
+    msgs = session.query(PrivateMessage).filter(PrivateMessage.chat_id == chat.chat_id).order_by(PrivateMessage.created_at).all()
+    view = get_message_crypto().view(msgs, key)
+    return view if lazy else view[:]
+
+def read_and_decrypt_group_messages(session, group: GroupChat, key: bytes=None, lazy=False):
+    msgs = session.query(GroupMessage).filter(GroupMessage.group_id == group.group_id).order_by(GroupMessage.created_at).all()
+    view = get_message_crypto().view(msgs, key)
+    return view if lazy else view[:]
+
+def _created_at_bounds(session, column, created_at):
+    """(выражение столбца, нижняя, верхняя граница) для сравнения с курсором по created_at.
+
+    В SQLite время хранится текстом, и сравнение строковое. Строки со
+    server_default (func.now()) записаны как 'YYYY-MM-DD HH:MM:SS', а
+    SQLAlchemy пишет и подставляет параметры с микросекундами. Поэтому одно и
+    то же время без микросекунд бывает записано двумя строками, а между ними
+    других значений нет. Сравниваем столбец как текст с обоими вариантами:
+    "равно курсору" — это lo <= created_at <= hi. В остальных СУБД lo == hi.
+    """
+    if session.get_bind().dialect.name != "sqlite" or not isinstance(created_at, datetime):
+        return column, created_at, created_at
+    hi = created_at.strftime("%Y-%m-%d %H:%M:%S.%f")
+    lo = hi[:-7] if created_at.microsecond == 0 else hi
+    return type_coerce(column, String), lo, hi
+
+def _iter_history(session, model, scope_column, scope_id, page_size, before, after, key):
+    if before is not None and after is not None:
+        raise ValueError("pass either before or after, not both")
+    query = session.query(model).filter(scope_column == scope_id)
+    if after is not None:
+        cursor, newer = after, True
+        order = (model.created_at.asc(), model.message_id.asc())
+    else:
+        cursor, newer = before, False
+        order = (model.created_at.desc(), model.message_id.desc())
+    crypto = get_message_crypto()
+
+    while True:
+        page_query = query
+        if cursor is not None:
+            created_at, message_id = cursor
+            column, lo, hi = _created_at_bounds(session, model.created_at, created_at)
+            # Нестрогое условие по created_at — диапазон по индексу, второе — точная
+            # граница: при том же времени сравниваем message_id
+            if newer:
+                page_query = page_query.filter(column >= lo, or_(column > hi, model.message_id > message_id))
             else:
-                pt = "<неизвестная схема>"
-        except Exception as e:
-            pt = f"<ошибка расшифровки: {e}>"
-        result.append((m.message_id, m.sender_id, pt, m.encryption_scheme, m.created_at))
-    return result
+                page_query = page_query.filter(column <= hi, or_(column < lo, model.message_id < message_id))
+        rows = page_query.order_by(*order).limit(page_size).all()
+        if not rows:
+            return
+        yield crypto.view(rows, key)[:]
+        if len(rows) < page_size:
+            return
+        cursor = (rows[-1].created_at, rows[-1].message_id)
+
+def iter_private_history(session, chat: PrivateChat, page_size=50, before=None, after=None, key: bytes=None):
+    """История личного чата страницами расшифрованных сообщений (DecryptedMessage).
+
+    Курсор — пара (created_at, message_id) сообщения, например последнего на
+    полученной странице. По умолчанию и с before — от новых к старым (подгрузка
+    старой переписки), с after — от старых к новым, начиная после курсора.
+    В памяти одновременно только одна страница.
+    """
+    return _iter_history(session, PrivateMessage, PrivateMessage.chat_id, chat.chat_id,
+                         page_size, before, after, key)
+
+def iter_group_history(session, group: GroupChat, page_size=50, before=None, after=None, key: bytes=None):
+    """То же, что iter_private_history, для группового чата."""
+    return _iter_history(session, GroupMessage, GroupMessage.group_id, group.group_id,
+                         page_size, before, after, key)
 
 # ------------------ Заполнение тестовыми данными и демонстрация --------------------
 def seed_and_demo(engine):
@@ -375,20 +1077,23 @@ def seed_and_demo(engine):
         print("cryptography не обнаружен — сообщения будут сохранены в открытом виде (PLAINTEXT).")
 
     # создаём пользователей
-    u1 = create_user(session, "ivan", "ivan@example.com", "password123")
-    u2 = create_user(session, "maria", "maria@example.com", "securepass")
-    if not u1 or not u2:
+    users = create_users(session, [
+        ("ivan", "ivan@example.com", "password123"),
+        ("maria", "maria@example.com", "securepass"),
+    ])
+    if len(users) < 2:
         session.close()
         return
+    u1, u2 = users
 
-    # пост и комментарий
-    p1 = create_post(session, u1, "Привет! Это мой первый пост.")
-    c1 = create_comment(session, p1, u2, "Отличный пост!")
-
-    # личный чат и сообщения
-    chat = create_private_chat(session, [u1.user_id, u2.user_id])
-    send_private_message(session, chat, u1, "Привет, Мария! Это приватное сообщение.")
-    send_private_message(session, chat, u2, "Привет, Иван! Получил твоё сообщение.")
+    # пост, комментарий, личный чат и сообщения — одной транзакцией
+    with BatchWriter(session, verbose=True, audit=True) as batch:
+        p1 = batch.add_post(u1, "Привет! Это мой первый пост.")
+        batch.add_comment(p1, u2, "Отличный пост!")
+        chat_id = batch.add_private_chat([u1.user_id, u2.user_id], creator=u1)
+        batch.add_private_message(chat_id, u1, "Привет, Мария! Это приватное сообщение.")
+        batch.add_private_message(chat_id, u2, "Привет, Иван! Получил твоё сообщение.")
+    chat = session.get(PrivateChat, chat_id)
 
     # прочитаем и декодируем
     msgs = read_and_decrypt_private_messages(session, chat)
@@ -400,6 +1105,15 @@ def seed_and_demo(engine):
 
 # ------------------ Основная точка входа --------------------
 def main():
+    parser = argparse.ArgumentParser(description="Social network database demo")
+    parser.add_argument("--calibrate-kdf", type=float, metavar="MS", nargs="?", const=KDF_TARGET_MS,
+                        help="benchmark password hashing, print a cost profile for MS milliseconds "
+                             "per hash (default: KDF_TARGET_MS) and exit")
+    args = parser.parse_args()
+    if args.calibrate_kdf is not None:
+        print(json.dumps(calibrate_kdf(args.calibrate_kdf), indent=2))
+        return
+
     print("Запуск demo social_network_all_in_one.py")
     print(f"SQLAlchemy available: {_have_sqlalchemy}")
     print(f"passlib available: {_have_passlib} (если False — используется PBKDF2 запасной вариант)")
@@ -0,0 +1,95 @@
+"""Шифрование сообщений: MessageCrypto.decrypt_many, DecryptedMessages и ключи по key_id.
+
+Запуск: python -m pytest "4 sent/test_social_network_crypto.py"
+"""
+import importlib.util
+import os
+from collections import namedtuple
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+_spec = importlib.util.spec_from_file_location(
+    "social_network_all_in_one",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "social_network_all_in_one.py"),
+)
+sn = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(sn)
+
+Message = namedtuple("Message", "message_id sender_id encrypted_payload nonce encryption_scheme key_id created_at")
+
+KEY_1 = bytes(range(32))
+KEY_2 = bytes(range(32, 64))
+
+
+def _plain(i):
+    return Message(f"m{i}", "u", f"text {i}".encode(), b"", sn.SCHEME_PLAINTEXT, None, datetime(2024, 1, 1))
+
+
+def _encrypted(crypto, i, key_id):
+    payload, nonce, scheme = crypto.encrypt(f"text {i}", key_id=key_id)
+    return Message(f"m{i}", "u", payload, nonce, scheme, key_id, datetime(2024, 1, 1))
+
+
+class CountingKeys:
+    def __init__(self, keys):
+        self.keys = keys
+        self.calls = []
+
+    def __call__(self, key_id):
+        self.calls.append(key_id)
+        return self.keys.get(key_id)
+
+
+def test_key_id_without_resolver_raises():
+    with pytest.raises(KeyError):
+        sn.MessageCrypto(default_key=KEY_1).cipher(key_id="k1")
+
+
+def test_unknown_key_id_is_not_cached():
+    keys = CountingKeys({})
+    crypto = sn.MessageCrypto(keys=keys)
+    for _ in range(2):
+        with pytest.raises(KeyError):
+            crypto.cipher(key_id="missing")
+    assert keys.calls == ["missing", "missing"]
+
+
+def test_view_decrypts_lazily_and_in_order(monkeypatch):
+    crypto = sn.MessageCrypto(batch_threshold=4)
+    batches = []
+    decrypt_many = crypto.decrypt_many
+
+    def counting_decrypt_many(messages, key=None):
+        batches.append(len(messages))
+        return decrypt_many(messages, key)
+
+    monkeypatch.setattr(crypto, "decrypt_many", counting_decrypt_many)
+    view = crypto.view([_plain(i) for i in range(10)])
+
+    assert len(view) == 10 and batches == []
+    assert view[-1].text == "text 9"
+    assert [m.text for m in view[2:5]] == ["text 2", "text 3", "text 4"]
+    assert batches == [1, 3]
+    # уже расшифрованные сообщения повторно не расшифровываются
+    assert [m.message_id for m in view] == [f"m{i}" for i in range(10)]
+    assert sum(batches) == 10
+
+
+def test_decrypt_many_with_key_ids_and_unknown_key():
+    pytest.importorskip("cryptography")
+    keys = CountingKeys({"k1": KEY_1, "k2": KEY_2})
+    crypto = sn.MessageCrypto(keys=keys, workers=2, batch_threshold=2)
+    messages = [_encrypted(crypto, i, "k1" if i % 2 else "k2") for i in range(6)]
+    # ключ k2 пропал из хранилища: его сообщения не расшифровываются, остальные — да
+    stolen = messages[1]._replace(key_id="unknown")
+    texts = crypto.decrypt_many(messages + [stolen, _plain(7)])
+
+    assert texts[:6] == [f"text {i}" for i in range(6)]
+    assert texts[6].startswith("<ошибка расшифровки")
+    assert texts[7] == "text 7"
+    # найденные ключи запрашиваются по разу, неизвестный — при каждом обращении
+    assert keys.calls.count("k1") == 1 and keys.calls.count("k2") == 1
+    assert keys.calls.count("unknown") == 2
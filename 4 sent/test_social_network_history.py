@@ -0,0 +1,96 @@
+"""Постраничная история чатов (iter_private_history / iter_group_history) на SQLite.
+
+Запуск: python -m pytest "4 sent/test_social_network_history.py"
+"""
+import importlib.util
+import itertools
+import os
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+_spec = importlib.util.spec_from_file_location(
+    "social_network_all_in_one",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "social_network_all_in_one.py"),
+)
+sn = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(sn)
+
+
+@pytest.fixture
+def session(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'history.db'}")
+    sn.create_db(engine)
+    session = sessionmaker(bind=engine)()
+    session.add_all([
+        sn.User(user_id="u", username="u", email="u@example.com", password_hash="x"),
+        sn.PrivateChat(chat_id="c"),
+        sn.GroupChat(group_id="g", owner_id="u"),
+    ])
+    session.commit()
+    yield session
+    session.close()
+
+
+def _add_server_default_rows(session, table, scope_column, scope_id):
+    # Как в базах, созданных раньше: created_at от server_default, без микросекунд,
+    # по нескольку сообщений в одну секунду
+    for i in range(9):
+        session.execute(text(
+            f"INSERT INTO {table} (message_id, {scope_column}, sender_id, encrypted_payload, "
+            f"encryption_scheme, created_at, is_deleted) "
+            f"VALUES (:id, :scope, 'u', :payload, 'PLAINTEXT', :created_at, 0)"
+        ), {"id": f"s{i}", "scope": scope_id, "payload": f"s{i}".encode(),
+            "created_at": f"2024-01-01 00:00:0{i // 3}"})
+    session.commit()
+
+
+def _expected(session, model, scope_column, scope_id):
+    rows = session.query(model.created_at, model.message_id).filter(scope_column == scope_id).all()
+    return [message_id for _, message_id in sorted(rows)]
+
+
+def _walk(pages):
+    # Ограничение на число страниц: при ошибке в курсоре генератор не закончится
+    return [m.message_id for page in itertools.islice(pages, 50) for m in page]
+
+
+def _check_both_directions(session, model, history, scope, expected):
+    # назад от новых: все сообщения ровно по разу
+    assert _walk(history(session, scope, page_size=2)) == expected[::-1]
+
+    # вперёд и назад от курсора в середине
+    middle = session.get(model, expected[4])
+    cursor = (middle.created_at, middle.message_id)
+    assert _walk(history(session, scope, page_size=2, after=cursor)) == expected[5:]
+    assert _walk(history(session, scope, page_size=2, before=cursor)) == expected[:4][::-1]
+
+
+def test_private_history_pages_server_default_rows(session):
+    chat = session.get(sn.PrivateChat, "c")
+    _add_server_default_rows(session, "private_messages", "chat_id", "c")
+    for i in range(3):
+        sn.send_private_message(session, chat, session.get(sn.User, "u"), f"new {i}")
+    # строки с микросекундами (как пишет SQLAlchemy) в ту же секунду, что и строки без них
+    session.add_all([
+        sn.PrivateMessage(message_id=f"b{i}", chat_id="c", sender_id="u", encrypted_payload=b"b",
+                          encryption_scheme="PLAINTEXT", created_at=datetime(2024, 1, 1, 0, 0, 1, 500000 + i))
+        for i in range(3)
+    ])
+    session.commit()
+
+    expected = _expected(session, sn.PrivateMessage, sn.PrivateMessage.chat_id, "c")
+    assert len(expected) == 15
+    _check_both_directions(session, sn.PrivateMessage, sn.iter_private_history, chat, expected)
+
+
+def test_group_history_pages_server_default_rows(session):
+    group = session.get(sn.GroupChat, "g")
+    _add_server_default_rows(session, "group_messages", "group_id", "g")
+
+    expected = _expected(session, sn.GroupMessage, sn.GroupMessage.group_id, "g")
+    _check_both_directions(session, sn.GroupMessage, sn.iter_group_history, group, expected)
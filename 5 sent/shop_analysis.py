@@ -3,11 +3,18 @@
 Короткий Python-скрипт: создаёт SQLite БД интернет-магазина, заполняет данными
 и выполняет запрошенные аналитические SQL-запросы, выводя результаты в терминал.
 Скопируй в файл и запусти: python shop_analysis.py
+
+Схема и данные выполняются один раз — в шаблон shop_analysis.template.db;
+рабочая база создаётся его копией (sqlite_template). Чистая копия для
+тестового прогона: python shop_analysis.py --fresh [--db путь | --db :memory:]
 """
+import argparse
 import sqlite3
-from pathlib import Path
+
+from sqlite_template import build_template, open_database
 
 DB_PATH = "shop_analysis.db"
+TEMPLATE_PATH = "shop_analysis.template.db"
 
 SCHEMA_AND_SEED = """
 PRAGMA foreign_keys = ON;
@@ -148,11 +155,6 @@ QUERIES = [
     },
 ]
 
-def execute_script(conn, script: str):
-    cur = conn.cursor()
-    cur.executescript(script)
-    conn.commit()
-
 def run_and_print(conn, title: str, sql: str):
     cur = conn.cursor()
     cur.execute(sql)
@@ -170,16 +172,21 @@ def run_and_print(conn, title: str, sql: str):
         print(" | ".join(str(r) for r in row))
 
 def main():
-    # создать файл БД, если ещё нет
-    db_file = Path(DB_PATH)
-    first_time = not db_file.exists()
-    conn = sqlite3.connect(DB_PATH)
+    parser = argparse.ArgumentParser(description="Online shop analytics queries")
+    parser.add_argument("--db", default=DB_PATH, help="working database path (':memory:' for an in-memory copy)")
+    parser.add_argument("--fresh", action="store_true",
+                        help="replace the working database with a clean copy of the template")
+    parser.add_argument("--rebuild-template", action="store_true",
+                        help="rebuild the seeded template from SCHEMA_AND_SEED")
+    parser.add_argument("--clone-method", choices=("backup", "copy"), default="backup")
+    args = parser.parse_args()
+
+    if args.rebuild_template:
+        build_template(TEMPLATE_PATH, [SCHEMA_AND_SEED])
+    # база есть — открываем как есть, нет — копируем готовый шаблон
+    conn = open_database(args.db, [SCHEMA_AND_SEED], template_path=TEMPLATE_PATH,
+                         fresh=args.fresh, method=args.clone_method)
     conn.row_factory = sqlite3.Row  # можно обращаться по именам, но печатаем кортежи
-    if first_time:
-        execute_script(conn, SCHEMA_AND_SEED)
-    else:
-        # на всякий случай убедимся, что таблицы существуют и seed применён idempotent
-        execute_script(conn, "BEGIN; " + SCHEMA_AND_SEED + " COMMIT;")
     # выполнить запросы
     for q in QUERIES:
         run_and_print(conn, q["title"], q["sql"])
@@ -5,13 +5,22 @@ shop_game_platform.py
 Создаёт SQLite БД для игровой платформы, заполняет таблицы минимальными данными
 (5 игроков, 3 игры, 9 матчей + PlayerScores) и выполняет запрошенные аналитические запросы.
 
+Схема и данные выполняются один раз — в шаблон game_platform.template.db;
+рабочая база создаётся его копией (sqlite_template), а существующая
+открывается без повторного заполнения.
+
 Запуск:
     python shop_game_platform.py
+    python shop_game_platform.py --fresh                  # чистая копия шаблона
+    python shop_game_platform.py --db /tmp/worker1.db --fresh
+    python shop_game_platform.py --db :memory:            # копия в памяти
 """
-import sqlite3
-from pathlib import Path
+import argparse
+
+from sqlite_template import build_template, open_database
 
 DB = "game_platform.db"
+TEMPLATE = "game_platform.template.db"
 
 INIT_SQL = """
 PRAGMA foreign_keys = ON;
@@ -208,11 +217,6 @@ QUERIES = [
     },
 ]
 
-def run_script(conn, script):
-    cur = conn.cursor()
-    cur.executescript(script)
-    conn.commit()
-
 def print_query(conn, title, sql):
     print("\n" + title)
     print("-" * len(title))
@@ -230,14 +234,20 @@ def print_query(conn, title, sql):
         print(" | ".join(str(x) if x is not None else "NULL" for x in r))
 
 def main():
-    first_time = not Path(DB).exists()
-    conn = sqlite3.connect(DB)
-    if first_time:
-        run_script(conn, INIT_SQL)
-        run_script(conn, SEED_SQL)
-    else:
-        # ensure seed idempotent
-        run_script(conn, SEED_SQL)
+    parser = argparse.ArgumentParser(description="Game platform analytics queries")
+    parser.add_argument("--db", default=DB, help="working database path (':memory:' for an in-memory copy)")
+    parser.add_argument("--fresh", action="store_true",
+                        help="replace the working database with a clean copy of the template")
+    parser.add_argument("--rebuild-template", action="store_true",
+                        help="rebuild the seeded template from INIT_SQL and SEED_SQL")
+    parser.add_argument("--clone-method", choices=("backup", "copy"), default="backup")
+    args = parser.parse_args()
+
+    scripts = [INIT_SQL, SEED_SQL]
+    if args.rebuild_template:
+        build_template(TEMPLATE, scripts)
+    conn = open_database(args.db, scripts, template_path=TEMPLATE,
+                         fresh=args.fresh, method=args.clone_method)
 
     for q in QUERIES:
         print_query(conn, q["title"], q["sql"])
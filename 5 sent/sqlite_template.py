@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+sqlite_template.py
+
+Быстрый старт демонстрационных SQLite-баз из готового шаблона.
+
+Схема и тестовые данные выполняются один раз — в файл-шаблон, рядом с
+которым сохраняется контрольная сумма (<шаблон>.sha256: SHA-256 файла и
+отпечаток SQL, из которого он собран). Рабочая база получается копией
+шаблона через sqlite3 backup API или копированием файла, без повторного
+выполнения скриптов. Шаблон пересобирается сам, если SQL изменился или
+файл не совпадает с контрольной суммой.
+
+    conn = open_database("game_platform.db", [INIT_SQL, SEED_SQL],
+                         template_path="game_platform.template.db")
+
+    # тесты: каждый прогон / рабочий процесс — своя чистая копия
+    conn = open_database(f"/tmp/worker{n}.db", [INIT_SQL, SEED_SQL],
+                         template_path="game_platform.template.db", fresh=True)
+    conn = open_database(":memory:", [INIT_SQL, SEED_SQL],
+                         template_path="game_platform.template.db")
+"""
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+from pathlib import Path
+
+
+def scripts_fingerprint(scripts) -> str:
+    """SHA-256 SQL-скриптов: меняется, когда меняется схема или тестовые данные."""
+    h = hashlib.sha256()
+    for script in scripts:
+        h.update(script.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def file_checksum(path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _checksum_path(template_path) -> Path:
+    return Path(str(template_path) + ".sha256")
+
+
+def _temp_path(target) -> Path:
+    # Временный файл в той же папке, чтобы os.replace был атомарным
+    target = Path(target)
+    fd, tmp = tempfile.mkstemp(prefix=target.name + ".", suffix=".tmp", dir=target.parent or ".")
+    os.close(fd)
+    return Path(tmp)
+
+
+def build_template(template_path, scripts) -> str:
+    """Собирает шаблон заново: выполняет scripts в новом файле и пишет контрольную сумму."""
+    template_path = Path(template_path)
+    tmp = _temp_path(template_path)
+    try:
+        conn = sqlite3.connect(tmp)
+        try:
+            for script in scripts:
+                conn.executescript(script)
+            conn.commit()
+        finally:
+            conn.close()
+        checksum = file_checksum(tmp)
+        info = {"sha256": checksum, "scripts": scripts_fingerprint(scripts)}
+        # Сначала файл, потом сумма: читатель в промежутке увидит расхождение
+        # и просто пересоберёт шаблон ещё раз
+        os.replace(tmp, template_path)
+        _checksum_path(template_path).write_text(json.dumps(info), encoding="utf-8")
+        return checksum
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+def template_is_valid(template_path, scripts) -> bool:
+    template_path = Path(template_path)
+    checksum_file = _checksum_path(template_path)
+    if not template_path.exists() or not checksum_file.exists():
+        return False
+    try:
+        info = json.loads(checksum_file.read_text(encoding="utf-8"))
+    except ValueError:
+        return False
+    return (info.get("scripts") == scripts_fingerprint(scripts)
+            and info.get("sha256") == file_checksum(template_path))
+
+
+def ensure_template(template_path, scripts) -> Path:
+    """Возвращает путь к актуальному шаблону, при необходимости собирая его."""
+    if not template_is_valid(template_path, scripts):
+        build_template(template_path, scripts)
+    return Path(template_path)
+
+
+def clone_template(template_path, target, method="backup"):
+    """Копирует шаблон в target.
+
+    method="backup" — через sqlite3 backup API (безопасно, даже если шаблон
+    кто-то читает), "copy" — копированием файла (быстрее для больших баз).
+    target=":memory:" возвращает открытое соединение с копией в памяти;
+    для файла возвращается None. Файл подменяется атомарно.
+    """
+    if target == ":memory:":
+        src = sqlite3.connect(f"file:{template_path}?mode=ro", uri=True)
+        try:
+            dst = sqlite3.connect(":memory:")
+            src.backup(dst)
+        finally:
+            src.close()
+        return dst
+
+    tmp = _temp_path(target)
+    try:
+        if method == "copy":
+            shutil.copyfile(template_path, tmp)
+        elif method == "backup":
+            src = sqlite3.connect(f"file:{template_path}?mode=ro", uri=True)
+            dst = sqlite3.connect(tmp)
+            try:
+                src.backup(dst)
+            finally:
+                dst.close()
+                src.close()
+        else:
+            raise ValueError(f"unknown clone method: {method}")
+        os.replace(tmp, target)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    return None
+
+
+def open_database(db_path, scripts, template_path=None, fresh=False, method="backup"):
+    """Открывает рабочую базу, создавая её копией шаблона.
+
+    Существующая база открывается как есть (скрипты не выполняются);
+    fresh=True заменяет её чистой копией шаблона. ":memory:" — всегда копия.
+    """
+    if template_path is None:
+        template_path = Path(db_path).with_suffix(".template.db")
+    if db_path == ":memory:":
+        return clone_template(ensure_template(template_path, scripts), ":memory:")
+    if fresh or not Path(db_path).exists():
+        clone_template(ensure_template(template_path, scripts), db_path, method)
+    return sqlite3.connect(db_path)
@@ -1,58 +1,59 @@
 import sqlite3
 import os
+import sys
 
-# Удаляем старую базу, если она уже есть
-if os.path.exists("company.db"):
-    os.remove("company.db")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from schema_migrations import migrate
 
-# Создаем подключение к файлу базы данных
-conn = sqlite3.connect("company.db")
-cursor = conn.cursor()
-
-# Создаем таблицу Departments
-cursor.execute('''
-CREATE TABLE Departments (
+# Схема по версиям: при запуске применяются только недостающие миграции,
+# а не пересоздание базы при каждом запуске
+MIGRATIONS = [
+    """
+CREATE TABLE IF NOT EXISTS Departments (
     DepartmentID INTEGER PRIMARY KEY,
     DepartmentName TEXT NOT NULL,
     ManagerID INTEGER
 );
-''')
 
-# Создаем таблицу Employees
-cursor.execute('''
-CREATE TABLE Employees (
+CREATE TABLE IF NOT EXISTS Employees (
     EmployeeID INTEGER PRIMARY KEY,
     FirstName TEXT NOT NULL,
     LastName TEXT NOT NULL,
     DepartmentID INTEGER,
     FOREIGN KEY (DepartmentID) REFERENCES Departments(DepartmentID)
 );
-''')
+""",
+]
+
+
+def seed(cursor):
+    # Заполняем таблицу Departments
+    cursor.executemany('''
+    INSERT INTO Departments (DepartmentID, DepartmentName, ManagerID)
+    VALUES (?, ?, ?);
+    ''', [
+        (1, 'IT', 101),
+        (2, 'HR', 102),
+        (3, 'Marketing', 103)
+    ])
 
-# Заполняем таблицу Departments
-cursor.executemany('''
-INSERT INTO Departments (DepartmentID, DepartmentName, ManagerID)
-VALUES (?, ?, ?);
-''', [
-    (1, 'IT', 101),
-    (2, 'HR', 102),
-    (3, 'Marketing', 103)
-])
+    # Заполняем таблицу Employees (один без отдела)
+    cursor.executemany('''
+    INSERT INTO Employees (EmployeeID, FirstName, LastName, DepartmentID)
+    VALUES (?, ?, ?, ?);
+    ''', [
+        (1, 'Иван', 'Иванов', 1),
+        (2, 'Анна', 'Смирнова', 2),
+        (3, 'Петр', 'Кузнецов', 3),
+        (4, 'Ольга', 'Васильева', None),
+        (5, 'Дмитрий', 'Соколов', 1)
+    ])
 
-# Заполняем таблицу Employees (один без отдела)
-cursor.executemany('''
-INSERT INTO Employees (EmployeeID, FirstName, LastName, DepartmentID)
-VALUES (?, ?, ?, ?);
-''', [
-    (1, 'Иван', 'Иванов', 1),
-    (2, 'Анна', 'Смирнова', 2),
-    (3, 'Петр', 'Кузнецов', 3),
-    (4, 'Ольга', 'Васильева', None),
-    (5, 'Дмитрий', 'Соколов', 1)
-])
 
-# Сохраняем изменения
-conn.commit()
+# Создаем подключение к файлу базы данных
+conn = sqlite3.connect("company.db")
+migrate(conn, 'sotrudniki', MIGRATIONS, seed=seed, seed_table='Departments')
+cursor = conn.cursor()
 
 # INNER JOIN — только сотрудники с существующим отделом
 print("Результат INNER JOIN (только с отделом):")
@@ -0,0 +1,168 @@
+"""Версионированное создание схемы для учебных скриптов (SQLite и PostgreSQL).
+
+Раньше скрипты при каждом запуске удаляли файл базы или делали DROP TABLE /
+DELETE FROM и заполняли всё заново. Теперь схема описывается списком
+миграций, а номер применённой версии хранится в самой базе, в таблице
+schema_version (по строке на компонент — обычно на скрипт). При запуске
+применяются только недостающие миграции, а тестовые данные добавляются,
+только если таблица seed_table пуста. Если всё уже на месте, запуск —
+это пара SELECT без записи.
+
+    MIGRATIONS = [
+        '''CREATE TABLE IF NOT EXISTS Users (user_id INTEGER PRIMARY KEY, username TEXT);''',
+        '''ALTER TABLE Users ADD COLUMN email TEXT;''',   # версия 2
+    ]
+
+    def seed(cursor):
+        cursor.executemany("INSERT INTO Users (user_id, username) VALUES (?, ?)", [(1, 'ivan')])
+
+    migrate(conn, 'polzovately', MIGRATIONS, seed=seed, seed_table='Users')
+
+Миграция — строка SQL (можно несколько операторов) или функция от курсора.
+Уже выпущенные миграции не меняют: изменения схемы добавляются в конец списка.
+Первая миграция пишется через CREATE TABLE IF NOT EXISTS, чтобы базы,
+созданные старыми версиями скриптов, подхватывались без потери данных.
+
+Скрипты из папок уроков подключают модуль так:
+
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+    from schema_migrations import migrate
+"""
+import sqlite3
+
+VERSION_TABLE = 'schema_version'
+
+# Все миграции в PostgreSQL выполняются под одной рекомендательной блокировкой:
+# параллельно запущенные скрипты не применят одну миграцию дважды
+_PG_LOCK_NAME = 'schema_migrations'
+
+
+def _is_sqlite(conn):
+    return isinstance(conn, sqlite3.Connection)
+
+
+def _split_sqlite(script):
+    # sqlite3 выполняет за раз один оператор, а executescript сам делает COMMIT
+    # и сломал бы общую транзакцию. complete_statement понимает точки с запятой
+    # внутри строк и тел триггеров.
+    statements, buf = [], ''
+    for part in script.split(';'):
+        buf += part + ';'
+        if sqlite3.complete_statement(buf):
+            if buf.strip(' \t\r\n;'):
+                statements.append(buf)
+            buf = ''
+    if buf.strip(' \t\r\n;'):
+        statements.append(buf)
+    return statements
+
+
+def _table_exists(cur, sqlite, table):
+    if sqlite:
+        cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,))
+        return cur.fetchone() is not None
+    cur.execute("SELECT to_regclass(%s) IS NOT NULL", (table,))
+    return cur.fetchone()[0]
+
+
+def _state(cur, sqlite, component, seed_table):
+    """(текущая версия компонента, нужно ли заполнять seed_table)."""
+    version = 0
+    if _table_exists(cur, sqlite, VERSION_TABLE):
+        cur.execute(f"SELECT version FROM {VERSION_TABLE} WHERE component = {'?' if sqlite else '%s'}",
+                    (component,))
+        row = cur.fetchone()
+        if row:
+            version = row[0]
+
+    needs_seed = False
+    if seed_table is not None:
+        if _table_exists(cur, sqlite, seed_table):
+            cur.execute(f"SELECT EXISTS (SELECT 1 FROM {seed_table})")
+            needs_seed = not cur.fetchone()[0]
+        else:
+            needs_seed = True
+    return version, needs_seed
+
+
+def _apply(cur, sqlite, step):
+    if callable(step):
+        step(cur)
+    elif sqlite:
+        for statement in _split_sqlite(step):
+            cur.execute(statement)
+    else:
+        cur.execute(step)
+
+
+def migrate(conn, component, migrations, seed=None, seed_table=None):
+    """Доводит схему компонента до версии len(migrations) и заполняет пустую базу.
+
+    conn — соединение sqlite3 или psycopg2. seed(cursor) вызывается, если
+    таблица seed_table пуста (или ещё не существует). Миграции, запись версии
+    и заполнение выполняются одной транзакцией. Возвращает число применённых
+    миграций.
+    """
+    if seed is not None and seed_table is None:
+        raise ValueError("seed_table is required together with seed")
+
+    sqlite = _is_sqlite(conn)
+    target = len(migrations)
+    cur = conn.cursor()
+    try:
+        version, needs_seed = _state(cur, sqlite, component, seed_table)
+        if version > target:
+            raise RuntimeError(f"{component}: database schema version {version} is newer "
+                               f"than this script ({target})")
+        if version == target and not (needs_seed and seed is not None):
+            conn.commit()
+            return 0
+
+        if sqlite:
+            # Режим без неявных транзакций модуля sqlite3: транзакцией управляем сами.
+            # IMMEDIATE сразу берёт блокировку записи, второй процесс ждёт её здесь.
+            isolation_level, conn.isolation_level = conn.isolation_level, None
+            cur.execute("BEGIN IMMEDIATE")
+        else:
+            cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (_PG_LOCK_NAME,))
+
+        try:
+            cur.execute(f"""
+                CREATE TABLE IF NOT EXISTS {VERSION_TABLE} (
+                    component TEXT PRIMARY KEY,
+                    version INTEGER NOT NULL,
+                    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            # Пока ждали блокировку, другой процесс мог всё сделать сам
+            version, _ = _state(cur, sqlite, component, seed_table)
+            for step in migrations[version:]:
+                _apply(cur, sqlite, step)
+            if target > version:
+                ph = '?' if sqlite else '%s'
+                cur.execute(f"""
+                    INSERT INTO {VERSION_TABLE} (component, version) VALUES ({ph}, {ph})
+                    ON CONFLICT (component) DO UPDATE
+                    SET version = excluded.version, applied_at = CURRENT_TIMESTAMP
+                """, (component, target))
+
+            if seed is not None and _state(cur, sqlite, component, seed_table)[1]:
+                seed(cur)
+
+            if sqlite:
+                cur.execute("COMMIT")
+            else:
+                conn.commit()
+        except BaseException:
+            if sqlite:
+                if conn.in_transaction:
+                    cur.execute("ROLLBACK")
+            else:
+                conn.rollback()
+            raise
+        finally:
+            if sqlite:
+                conn.isolation_level = isolation_level
+        return target - version
+    finally:
+        cur.close()